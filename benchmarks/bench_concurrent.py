@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+"""
+A stress test of a Fifth shared by threads: producers push onto the top while
+consumers pop from the bottom, checking every number is popped exactly once.
+
+Compares ConcurrentFifth, whose consumers block in reverse_pop(), with a Fifth
+behind one lock whose consumers poll on InsufficientStackItemsError. Both lock
+once per operation, so their throughput is similar; blocking consumers wait
+without spinning, at the cost of waking when an item arrives.
+
+From the base directory:
+PYTHONPATH=src python3 benchmarks/bench_concurrent.py [count] [threads]
+"""
+import sys
+import threading
+import time
+from collections import Counter
+
+from fifth import Fifth
+from fifth import InsufficientStackItemsError
+from threadsafe import ConcurrentFifth
+
+
+class LockedFifth:
+    """A Fifth behind one lock, its consumers polling."""
+
+    def __init__(self):
+        self._fifth = Fifth()
+        self._lock = threading.Lock()
+
+    def push(self, number: int):
+        """Push a valid integer onto the top of the stack."""
+        with self._lock:
+            self._fifth.push(number)
+
+    def reverse_pop(self) -> int:
+        """Remove the bottom element of the stack, polling until there is one."""
+        while True:
+            with self._lock:
+                try:
+                    return self._fifth.reverse_pop()
+                except InsufficientStackItemsError:
+                    pass
+            time.sleep(0)
+
+
+def run(fifth, pop, count: int, threads: int) -> float:
+    """Seconds for threads producers to push count numbers each and threads
+    consumers to pop them."""
+    popped = [[] for _ in range(threads)]
+
+    def produce(offset: int):
+        for number in range(offset, offset + count):
+            fifth.push(number)
+
+    def consume(numbers: list):
+        for _ in range(count):
+            numbers.append(pop())
+
+    workers = [threading.Thread(target=consume, args=(numbers,)) for numbers in popped]
+    workers += [threading.Thread(target=produce, args=(index * count,)) for index in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    counts = Counter(number for numbers in popped for number in numbers)
+    if counts != Counter(range(count * threads)):
+        raise AssertionError("numbers were lost or popped twice")
+    return elapsed
+
+
+def main(count: int, threads: int):
+    """Print the throughput of each stack with one and with threads producers."""
+    print(f"{'stack':<12} {'threads':>7} {'ops/sec':>12}")
+    for workers in sorted({1, threads}):
+        concurrent = ConcurrentFifth()
+        locked = LockedFifth()
+        for name, fifth, pop in (
+                ('concurrent', concurrent,
+                 lambda fifth=concurrent: fifth.reverse_pop(block=True, timeout=10)),
+                ('locked', locked, locked.reverse_pop)):
+            elapsed = run(fifth, pop, count, workers)
+            print(f"{name:<12} {2 * workers:>7} {2 * count * workers / elapsed:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 4)
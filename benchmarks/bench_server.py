@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+"""
+A load generator for the Fifth server.
+
+Opens many concurrent sessions, each pipelining a script of commands, and
+reports the throughput. Without --port or --unix a server is started in this
+process on a loopback port.
+
+From the base directory:
+PYTHONPATH=src python3 benchmarks/bench_server.py --clients 1000 --commands 1000
+"""
+import argparse
+import asyncio
+import resource
+import time
+
+from server import Server
+
+
+def make_script(commands: int) -> bytes:
+    """A script of PUSH, DUP and + commands which keeps the stack small."""
+    lines = ["PUSH 1"]
+    while len(lines) < commands - 1:
+        lines += ["DUP", "+"]
+    return ("\n".join(lines[:commands]) + "\n\n").encode()
+
+
+async def client(connect, script: bytes) -> int:
+    """Run one session, returning the number of output lines."""
+    reader, writer = await connect()
+    writer.write(script)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    await writer.wait_closed()
+    return response.count(b"\n")
+
+
+async def run(args):
+    """Run the sessions against a server and print the throughput."""
+    listener = None
+    if args.unix:
+        async def connect():
+            return await asyncio.open_unix_connection(args.unix)
+    else:
+        port = args.port
+        if port is None:
+            listener = await Server(output=args.output).start_tcp("127.0.0.1", 0)
+            port = listener.sockets[0].getsockname()[1]
+
+        async def connect():
+            return await asyncio.open_connection(args.host, port)
+
+    script = make_script(args.commands)
+    start = time.perf_counter()
+    lines = await asyncio.gather(*(client(connect, script) for _ in range(args.clients)))
+    elapsed = time.perf_counter() - start
+
+    if listener is not None:
+        listener.close()
+        await listener.wait_closed()
+
+    commands = args.clients * args.commands
+    print(f"sessions:     {args.clients}")
+    print(f"commands:     {commands}")
+    print(f"output lines: {sum(lines)}")
+    print(f"seconds:      {elapsed:.3f}")
+    print(f"commands/sec: {commands / elapsed:,.0f}")
+    print(f"sessions/sec: {args.clients / elapsed:,.0f}")
+
+
+def main():
+    """Parse the arguments, raise the file descriptor limit, and run the benchmark."""
+    parser = argparse.ArgumentParser(description="A load generator for the Fifth server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="a running server's TCP port")
+    parser.add_argument("--unix", metavar="PATH", help="a running server's Unix socket")
+    parser.add_argument("--clients", type=int, default=1000, help="concurrent sessions")
+    parser.add_argument("--commands", type=int, default=1000, help="commands per session")
+    parser.add_argument("--output", default="full",
+                        help="the output mode of the in-process server")
+    args = parser.parse_args()
+
+    # Each session needs a file descriptor for each end
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = min(hard, max(soft, 2 * args.clients + 64))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
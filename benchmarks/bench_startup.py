@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+"""
+Compares the end-to-end latency of running a tiny script with the program and
+with the client of a warm server.
+
+Each way is run as a new process, as a pipeline would run it, with the script
+on stdin. The warm server is started for the run on a temporary socket.
+
+From the base directory:
+python3 benchmarks/bench_startup.py --runs 200
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+SCRIPT = b"PUSH 3\nPUSH 4\n+\nDUP\n*\n"
+
+
+def measure(command, env, runs: int) -> list:
+    """The seconds taken by each run of a command."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, input=SCRIPT, env=env, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return sorted(times)
+
+
+def main():
+    """Print the latency of each way of running a tiny script."""
+    parser = argparse.ArgumentParser(description="Compares the startup latency of Fifth.")
+    parser.add_argument("--runs", type=int, default=100, help="runs of each way")
+    parser.add_argument("--workers", type=int, default=2, help="warm server workers")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, FIFTH_SOCKET=os.path.join(directory, "fifth.sock"))
+        with subprocess.Popen([sys.executable, os.path.join(SRC, "warm.py"),
+                               "--workers", str(args.workers)],
+                              env=env, stderr=subprocess.DEVNULL) as server:
+            try:
+                while not os.path.exists(env["FIFTH_SOCKET"]):
+                    time.sleep(0.01)
+                ways = {
+                    "program": [sys.executable, SRC],
+                    "client": [sys.executable, os.path.join(SRC, "client.py")],
+                    "client -S": [sys.executable, "-S", os.path.join(SRC, "client.py")],
+                }
+                print(f"{'way':<12} {'p50 ms':>8} {'p90 ms':>8} {'mean ms':>8}")
+                for name, command in ways.items():
+                    times = measure(command, env, args.runs)
+                    print(f"{name:<12} {times[len(times) // 2] * 1e3:>8.2f}"
+                          f" {times[len(times) * 9 // 10] * 1e3:>8.2f}"
+                          f" {sum(times) / len(times) * 1e3:>8.2f}")
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait()
+
+
+if __name__ == "__main__":
+    main()
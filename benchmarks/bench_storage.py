@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+"""
+Compares the memory use, push/pop throughput and cost of forking of the Fifth
+storage backends.
+
+From the base directory:
+PYTHONPATH=src python3 benchmarks/bench_storage.py [count]
+"""
+import sys
+import time
+import tracemalloc
+
+from fifth import Fifth
+from filestorage import SpillStorage
+from storage import ArrayStorage
+from storage import DequeStorage
+from storage import ListStorage
+from storage import PersistentStorage
+from storage import RenderedStorage
+
+BACKENDS = {
+    'list': ListStorage,
+    'deque': DequeStorage,
+    'array': ArrayStorage,
+    'persistent': PersistentStorage,
+    'spill': SpillStorage,
+    'rendered': RenderedStorage,
+}
+
+# The number of forks made to measure the cost of forking
+FORKS = 10
+
+
+def measure_memory(storage, count: int) -> int:
+    """The bytes allocated holding count items."""
+    tracemalloc.start()
+    fifth = Fifth(storage=storage)
+    for number in range(1000, 1000 + count):
+        fifth.push(number)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current
+
+
+def measure_throughput(storage, count: int) -> float:
+    """Push and pop operations per second."""
+    fifth = Fifth(storage=storage)
+    start = time.perf_counter()
+    for number in range(count):
+        fifth.push(number)
+    for _ in range(count):
+        fifth.pop()
+    return 2 * count / (time.perf_counter() - start)
+
+
+def measure_forks(storage, count: int):
+    """The bytes allocated and seconds taken by a fork of a stack of count items
+    which then pushes, adds and pops from the bottom."""
+    fifth = Fifth(range(count), storage=storage)
+
+    def make_forks():
+        forks = []
+        for _ in range(FORKS):
+            fork = fifth.fork()
+            fork.push(1)
+            fork.add()
+            fork.reverse_pop()
+            forks.append(fork)
+        return forks
+
+    start = time.perf_counter()
+    make_forks()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    forks = make_forks()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del forks
+    return current / FORKS, elapsed / FORKS
+
+
+def main(count: int):
+    """Print the memory, throughput and fork cost of each storage backend."""
+    print(f"{'storage':<10} {'bytes/item':>10} {'ops/sec':>12} {'bytes/fork':>12} {'us/fork':>10}")
+    for name, storage in BACKENDS.items():
+        memory = measure_memory(storage, count)
+        throughput = measure_throughput(storage, count)
+        try:
+            fork_memory, fork_time = measure_forks(storage, count)
+            forks = f"{fork_memory:>12,.0f} {fork_time * 1e6:>10,.1f}"
+        except TypeError:
+            # The backend cannot be copied
+            forks = f"{'-':>12} {'-':>10}"
+        print(f"{name:<10} {memory / count:>10.1f} {throughput:>12,.0f} {forks}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+"""
+A benchmark suite for Fifth.
+
+Runs each workload in workloads.py through Stack.execute, one line at a
+time, and through a compiled program, and reports the throughput, the latency
+percentiles of single commands and the peak memory. Results can be saved as
+JSON and compared against a baseline, failing the run on a regression.
+
+From the base directory:
+PYTHONPATH=src python3 benchmarks/bench_suite.py --output results.json
+PYTHONPATH=src python3 benchmarks/bench_suite.py --baseline results.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from array import array
+from typing import Callable, Dict, Iterator
+
+from compiler import ERRORS
+from compiler import compile_script
+from compiler import execute_each
+from stack import Stack
+
+from workloads import WORKLOADS
+from workloads import Workload
+
+
+def stack_engine(workload: Workload) -> Iterator[None]:
+    """Run a workload through Stack.execute, yielding after each line.
+
+    The stack is not rendered, which on a deep stack would dominate.
+    """
+    stack = Stack()
+    stack.fifth.storage.extend(workload.data)
+    execute = stack.execute
+    for command_line in workload.lines:
+        try:
+            execute(command_line)
+        except ERRORS:
+            pass
+        yield
+
+
+def execute_engine(workload: Workload) -> Iterator[None]:
+    """Run a workload as a compiled program, yielding after each instruction."""
+    stack = Stack()
+    stack.fifth.storage.extend(workload.data)
+    for _ in execute_each(compile_script(workload.lines), stack.fifth):
+        yield
+
+
+# A dict mapping engine names to functions running a workload
+ENGINES: Dict[str, Callable[[Workload], Iterator[None]]] = {
+    'stack': stack_engine,
+    'execute': execute_engine,
+}
+
+
+def percentile(ordered: list, fraction: float) -> float:
+    """A percentile of sorted values, by the nearest rank."""
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure(engine: Callable[[Workload], Iterator[None]], workload: Workload,
+            repeat: int) -> Dict[str, float]:
+    """Measure an engine running a workload."""
+    # Throughput: the best of several untimed runs
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in engine(workload):
+            pass
+        best = min(best, time.perf_counter() - start)
+
+    # Latency: each command timed on its own
+    latencies = array('q')
+    steps = engine(workload)
+    clock = time.perf_counter_ns
+    while True:
+        start = clock()
+        try:
+            next(steps)
+        except StopIteration:
+            break
+        latencies.append(clock() - start)
+    ordered = sorted(latencies)
+
+    # Memory: the peak allocated while running, beyond the workload itself
+    tracemalloc.start()
+    for _ in engine(workload):
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'ops_per_sec': len(workload.lines) / best,
+        'p50_us': percentile(ordered, 0.50) / 1000,
+        'p90_us': percentile(ordered, 0.90) / 1000,
+        'p99_us': percentile(ordered, 0.99) / 1000,
+        'peak_bytes': peak,
+    }
+
+
+def run(size: int, seed: int, repeat: int, names=None) -> dict:
+    """Run the suite."""
+    results = {}
+    for workload_name, generate in WORKLOADS.items():
+        if names and workload_name not in names:
+            continue
+        workload = generate(size, seed)
+        for engine_name, engine in ENGINES.items():
+            key = f"{engine_name}/{workload_name}"
+            results[key] = measure(engine, workload, repeat)
+            result = results[key]
+            print(f"{key:<24} {result['ops_per_sec']:>12,.0f} ops/sec"
+                  f" {result['p50_us']:>8.2f} {result['p90_us']:>8.2f} {result['p99_us']:>8.2f} us"
+                  f" {result['peak_bytes'] / 1024:>10,.0f} KiB", flush=True)
+    return {
+        'python': platform.python_version(),
+        'size': size,
+        'seed': seed,
+        'results': results,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """Find the regressions from a baseline.
+
+    :param tolerance The fraction by which throughput may fall or memory grow.
+    :return Descriptions of the regressions.
+    """
+    regressions = []
+    for key, result in current['results'].items():
+        if key not in baseline['results']:
+            continue
+        base = baseline['results'][key]
+        if result['ops_per_sec'] < base['ops_per_sec'] * (1 - tolerance):
+            regressions.append(f"{key}: {result['ops_per_sec']:,.0f} ops/sec,"
+                               f" baseline {base['ops_per_sec']:,.0f}")
+        if result['peak_bytes'] > base['peak_bytes'] * (1 + tolerance) + 64 * 1024:
+            regressions.append(f"{key}: peak {result['peak_bytes']:,} bytes,"
+                               f" baseline {base['peak_bytes']:,}")
+    return regressions
+
+
+def main() -> int:
+    """Run the suite, saving or comparing the results as asked.
+
+    :return The exit status, 1 if a workload regressed against the baseline.
+    """
+    parser = argparse.ArgumentParser(description="A benchmark suite for Fifth.")
+    parser.add_argument("--size", type=int, default=20_000, help="commands per workload")
+    parser.add_argument("--seed", type=int, default=0, help="the workload random seed")
+    parser.add_argument("--repeat", type=int, default=3, help="runs to take the best of")
+    parser.add_argument("--workload", action="append", choices=list(WORKLOADS),
+                        help="run only this workload (repeatable)")
+    parser.add_argument("--output", metavar="JSON", help="save the results")
+    parser.add_argument("--baseline", metavar="JSON", help="compare against saved results")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="the fraction of throughput or memory a regression exceeds")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+        # Compare like with like
+        args.size, args.seed = baseline['size'], baseline['seed']
+
+    current = run(args.size, args.seed, args.repeat, args.workload)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(current, file, indent=2)
+
+    if baseline is not None:
+        regressions = compare(current, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
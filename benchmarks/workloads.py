@@ -0,0 +1,64 @@
+"""
+Reproducible synthetic Fifth workloads for benchmarking.
+
+Each workload is a script and an initial stack. The same name, size and seed
+always give the same workload.
+"""
+import random
+from typing import Callable, Dict, List, NamedTuple
+
+
+class Workload(NamedTuple):
+    """A script to run against an initial stack."""
+    name: str
+    lines: List[str]
+    data: List[int]
+
+
+def top_heavy(size: int, seed: int = 0) -> Workload:
+    """Long chains of PUSH and arithmetic at the top of the stack."""
+    rng = random.Random(seed)
+    lines = []
+    while len(lines) < size:
+        lines += [f"PUSH {rng.randint(1, 1000)}", f"PUSH {rng.randint(1, 1000)}",
+                  rng.choice(["+", "-", "*", "/"]), "DUP", "SWAP", "+"]
+    return Workload("top_heavy", lines[:size], [])
+
+
+def bottom_heavy(size: int, seed: int = 0, depth: int = 100_000) -> Workload:
+    """rPUSH/rPOP churn at the bottom of a deep stack."""
+    rng = random.Random(seed)
+    lines = []
+    while len(lines) < size:
+        lines += [f"rPUSH {rng.randint(1, 1000)}", "rDUP", "r+", "rPOP",
+                  f"rPUSH {rng.randint(1, 1000)}", "rSWAP", "rPOP"]
+    return Workload("bottom_heavy", lines[:size], list(range(depth)))
+
+
+def bignum(size: int, seed: int = 0) -> Workload:
+    """Multiplication chains building ever larger integers."""
+    rng = random.Random(seed)
+    lines = ["PUSH 7"]
+    while len(lines) < size:
+        lines += [f"PUSH {rng.randint(2, 1000)}", "*"]
+    return Workload("bignum", lines[:size], [])
+
+
+def error_heavy(size: int, seed: int = 0) -> Workload:
+    """Mostly commands failing with insufficient items on the stack."""
+    rng = random.Random(seed)
+    lines = []
+    while len(lines) < size:
+        lines += [rng.choice(["+", "POP", "SWAP", "r-", "DUP", "rPOP", "/"])
+                  for _ in range(9)]
+        lines += [f"PUSH {rng.randint(0, 9)}", "POP"]
+    return Workload("error_heavy", lines[:size], [])
+
+
+# A dict mapping workload names to their generators
+WORKLOADS: Dict[str, Callable[..., Workload]] = {
+    'top_heavy': top_heavy,
+    'bottom_heavy': bottom_heavy,
+    'bignum': bignum,
+    'error_heavy': error_heavy,
+}
@@ -1,5 +1,50 @@
 """Runs Stack."""
+import argparse
+import sys
+
+from bytecode import ProgramCache
+from fifth import ARITHMETIC
+from profiler import Profiler
+from stack import OUTPUT
 from stack import Stack
+from stack import rendered_storage
+
+parser = argparse.ArgumentParser(description="A Fifth interpreter.")
+parser.add_argument("--batch", action="store_true",
+                    help="read the whole input in blocks and buffer the output")
+parser.add_argument("--output", choices=OUTPUT.list(), default=OUTPUT.FULL.value,
+                    help="print the stack after every command (full), the change made by "
+                         "every command (delta), the final stack (final) or errors only (quiet)")
+parser.add_argument("--arithmetic", choices=ARITHMETIC.list(), default=ARITHMETIC.BIGINT.value,
+                    help="arbitrary precision integers (bigint), or 64-bit integers which wrap "
+                         "around (wrap) or hold at the limit (saturate) on overflow")
+parser.add_argument("--rendered", action="store_true",
+                    help="keep the string of the stack up to date as it changes, so the full "
+                         "output of a large stack only re-renders the values changed")
+parser.add_argument("--profile", action="store_true",
+                    help="count and time every command and print a report to stderr at exit")
+parser.add_argument("--cache", action="store_true",
+                    help="cache the compiled script file, so later runs of it skip parsing")
+parser.add_argument("--cache-dir", default=None,
+                    help="the directory of cached programs, $FIFTH_CACHE_DIR or ~/.cache/fifth "
+                         "by default; implies --cache")
+parser.add_argument("file", nargs="?",
+                    help="a script to run in batch mode instead of reading stdin")
+args = parser.parse_args()
 
-stack = Stack()
-stack.main()
+profiler = Profiler() if args.profile else None
+storage = rendered_storage(args.arithmetic) if args.rendered else None
+stack = Stack(output=args.output, profiler=profiler, arithmetic=args.arithmetic, storage=storage)
+try:
+    if args.file and (args.cache or args.cache_dir):
+        stack.run_program(ProgramCache(args.cache_dir).load(args.file))
+    elif args.file:
+        with open(args.file, "rb") as script:
+            stack.run_file(script)
+    elif args.batch:
+        stack.run_file()
+    else:
+        stack.main()
+finally:
+    if profiler is not None:
+        print(profiler.report(), file=sys.stderr)
@@ -0,0 +1,324 @@
+"""
+Serialises compiled Fifth programs, and caches the programs of script files on
+disk, as .pyc files cache Python modules.
+
+A serialised program is a header, the opcodes, then four operand sections:
+- the operands as 64-bit machine integers, which are read straight from the
+  file into the operand list;
+- the operands which do not fit in 64 bits, each a varint index into the
+  operands and a varint length then that many bytes of a little-endian signed
+  integer, replacing the placeholder in the first section;
+- the error operands, each a varint index, a byte indexing compiler.ERRORS and
+  a varint length then that many bytes of the UTF-8 message;
+- the operands of bulk commands, each a varint index and a byte for its kind,
+  then for a tuple a varint count and its integers, or for a range its start,
+  stop and step, each integer encoded as in the second section.
+
+The header holds a magic number and a format version, which a cached file must
+match, and the BLAKE2 digest of the script it was compiled from.
+
+ProgramCache names its files after the path, modification time and size of the
+script, so a cached program is found without reading the script. The digest of
+the script is still checked before the program is used, but hashing is far
+cheaper than parsing every line.
+"""
+import io
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+from hashlib import blake2b
+from typing import BinaryIO, List, Optional, Tuple
+
+from compiler import ERRORS
+from compiler import OPCODE
+from compiler import OPERAND_OPCODES
+from compiler import Program
+from compiler import compile_script
+from fifth import MAX_RANGE
+from stack import read_script_lines
+
+MAGIC = b'FIFTHPRG'
+
+# The format version, increased whenever the format or the compiler changes
+VERSION = 2
+
+# magic, version, digest, instructions, and the bytes of the big, error and
+# sequence operand sections
+HEADER = struct.Struct('<8sI32sQQQQ')
+
+# The default cache directory, unless FIFTH_CACHE_DIR is set
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'fifth')
+
+# The suffix of cached programs
+SUFFIX = '.fifthc'
+
+# The placeholder in the machine integer section for other operands
+PLACEHOLDER = 0
+
+# The kinds of sequence operands
+TUPLE = 0
+RANGE = 1
+
+# The bytes of every opcode, to find any other byte among the opcodes
+_OPCODE_BYTES = bytes(OPCODE)
+
+_INT64_MIN = -2 ** 63
+_INT64_MAX = 2 ** 63 - 1
+
+
+def _varint(number: int) -> bytes:
+    data = bytearray()
+    while number > 0x7f:
+        data.append(number & 0x7f | 0x80)
+        number >>= 7
+    data.append(number)
+    return bytes(data)
+
+
+def _read_varint(data, position: int) -> Tuple[int, int]:
+    """The varint at a position in data, and the position after it."""
+    number = shift = 0
+    while True:
+        if position >= len(data):
+            raise ValueError("corrupt Fifth program")
+        byte = data[position]
+        position += 1
+        number |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return number, position
+        shift += 7
+
+
+def _signed(number: int) -> bytes:
+    length = (number.bit_length() + 8) // 8
+    return _varint(length) + number.to_bytes(length, 'little', signed=True)
+
+
+def _read_signed(data, position: int) -> Tuple[int, int]:
+    """The signed integer at a position in data, and the position after it."""
+    length, position = _read_varint(data, position)
+    end = position + length
+    return int.from_bytes(data[position:end], 'little', signed=True), end
+
+
+def _padding(size: int) -> int:
+    return -size % 8
+
+
+def _read_index(data, position: int, count: int) -> Tuple[int, int]:
+    """The varint index of one of count operands at a position in data, and the
+    position after it."""
+    index, position = _read_varint(data, position)
+    if index >= count:
+        raise ValueError("corrupt Fifth program")
+    return index, position
+
+
+def _read_range(values: List[int]) -> range:
+    """The range of a start, stop and step, as PUSHN pushes."""
+    operand = range(*values)
+    # As inclusive_range allows; len() of a range too long for an index
+    # raises OverflowError, so its length is not taken
+    if operand.step not in (1, -1) or abs(operand.stop - operand.start) > MAX_RANGE:
+        raise ValueError("corrupt Fifth program")
+    return operand
+
+
+def _check_end(position: int, end: int):
+    """Check an entry of a section did not run past the end of the section."""
+    if position > end:
+        raise ValueError("corrupt Fifth program")
+
+
+def digest(source: bytes) -> bytes:
+    """The digest of a script recorded with its program."""
+    return blake2b(source, digest_size=32).digest()
+
+
+def dumps(program: Program, source_digest: bytes = bytes(32)) -> bytes:
+    """Serialise a program.
+
+    :param source_digest The digest of the script the program was compiled from.
+    """
+    numbers = array('q')
+    big = bytearray()
+    errors = bytearray()
+    sequences = bytearray()
+    operands = iter(program.operands)
+    index = 0
+    for opcode in program.opcodes:
+        if opcode not in OPERAND_OPCODES:
+            continue
+        operand = next(operands)
+        if opcode == OPCODE.ERROR:
+            error_class, message = operand
+            message = message.encode()
+            errors += _varint(index) + bytes((ERRORS.index(error_class),))
+            errors += _varint(len(message)) + message
+            numbers.append(PLACEHOLDER)
+        elif isinstance(operand, range):
+            sequences += _varint(index) + bytes((RANGE,))
+            sequences += b''.join(map(_signed, (operand.start, operand.stop, operand.step)))
+            numbers.append(PLACEHOLDER)
+        elif isinstance(operand, tuple):
+            sequences += _varint(index) + bytes((TUPLE,)) + _varint(len(operand))
+            sequences += b''.join(map(_signed, operand))
+            numbers.append(PLACEHOLDER)
+        elif _INT64_MIN <= operand <= _INT64_MAX:
+            numbers.append(operand)
+        else:
+            big += _varint(index) + _signed(operand)
+            numbers.append(PLACEHOLDER)
+        index += 1
+
+    header = HEADER.pack(MAGIC, VERSION, source_digest, len(program.opcodes),
+                         len(big), len(errors), len(sequences))
+    return b''.join((header, b'\0' * _padding(HEADER.size),
+                     program.opcodes, b'\0' * _padding(len(program.opcodes)),
+                     numbers.tobytes(), big, errors, sequences))
+
+
+def _read_header(data, source_digest: Optional[bytes]) -> Tuple[int, int, int, int]:
+    """The number of instructions of a program, and the sizes of its sections
+    of big integers, errors and sequences.
+
+    :raises ValueError If data is not a program of this version, or not of the script.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError("not a Fifth program")
+    magic, version, program_digest, *sizes = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"not a version {VERSION} Fifth program")
+    if source_digest is not None and source_digest != program_digest:
+        raise ValueError("the program is not of the script")
+    return tuple(sizes)
+
+
+def _read_big(data, position: int, end: int, operands: list):
+    """Read the section of integers which do not fit in 64 bits into operands."""
+    while position < end:
+        index, position = _read_index(data, position, len(operands))
+        operands[index], position = _read_signed(data, position)
+        _check_end(position, end)
+
+
+def _read_errors(data, position: int, end: int, operands: list):
+    """Read the section of compile errors into operands."""
+    while position < end:
+        index, position = _read_index(data, position, len(operands))
+        if position >= end or data[position] >= len(ERRORS):
+            raise ValueError("corrupt Fifth program")
+        error_class = ERRORS[data[position]]
+        length, position = _read_varint(data, position + 1)
+        _check_end(position + length, end)
+        operands[index] = (error_class, bytes(data[position:position + length]).decode())
+        position += length
+
+
+def _read_sequences(data, position: int, end: int, operands: list):
+    """Read the section of tuples and ranges into operands."""
+    while position < end:
+        index, position = _read_index(data, position, len(operands))
+        if position >= end or data[position] not in (TUPLE, RANGE):
+            raise ValueError("corrupt Fifth program")
+        kind = data[position]
+        size, position = (3, position + 1) if kind == RANGE else _read_varint(data, position + 1)
+        _check_end(position + size, end)
+        values = []
+        for _ in range(size):
+            number, position = _read_signed(data, position)
+            values.append(number)
+        _check_end(position, end)
+        operands[index] = tuple(values) if kind == TUPLE else _read_range(values)
+
+
+def loads(data, source_digest: bytes = None) -> Program:
+    """Deserialise a program from bytes, or any buffer such as an mmap.
+
+    :param source_digest The digest of the script, if it must match.
+    :raises ValueError If data is not a program of this version, not of the
+    script, or corrupt.
+    """
+    instructions, *sizes = _read_header(data, source_digest)
+    position = HEADER.size + _padding(HEADER.size)
+    opcodes = bytes(data[position:position + instructions])
+    if opcodes.translate(None, _OPCODE_BYTES):
+        raise ValueError("corrupt Fifth program")
+    position += instructions + _padding(instructions)
+    end = position + sum(map(opcodes.count, OPERAND_OPCODES)) * 8
+    if end + sum(sizes) != len(data):
+        raise ValueError("truncated Fifth program")
+    with memoryview(data) as view, view[position:end] as section, section.cast('q') as numbers:
+        operands: List[object] = numbers.tolist()
+
+    for read_section, size in zip((_read_big, _read_errors, _read_sequences), sizes):
+        read_section(data, end, end + size, operands)
+        end += size
+    return Program(opcodes, operands)
+
+
+def compile_file(infile: BinaryIO) -> Program:
+    """Compile a script file as Stack.run_file reads it, up to its first empty line."""
+    opcodes = bytearray()
+    operands = []
+    for lines in read_script_lines(infile):
+        program = compile_script(line.decode() for line in lines)
+        opcodes += program.opcodes
+        operands += program.operands
+    return Program(opcodes, operands)
+
+
+class ProgramCache:
+    """A directory of the compiled programs of script files.
+
+    :param directory The cache directory, created when first written.
+    """
+
+    def __init__(self, directory: str = None):
+        self.directory = directory or os.environ.get('FIFTH_CACHE_DIR', DEFAULT_DIRECTORY)
+
+    def path(self, script: str) -> str:
+        """The cached program file of a script file, which may not exist."""
+        status = os.stat(script)
+        key = f"{os.path.realpath(script)}\0{status.st_mtime_ns}\0{status.st_size}"
+        return os.path.join(self.directory, blake2b(key.encode(), digest_size=16).hexdigest()
+                            + SUFFIX)
+
+    def get(self, script: str, source_digest: bytes) -> Optional[Program]:
+        """The cached program of a script file, or None if it is not cached."""
+        try:
+            with open(self.path(script), 'rb') as file, \
+                    mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return loads(data, source_digest)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, script: str, program: Program, source_digest: bytes):
+        """Cache the program of a script file."""
+        os.makedirs(self.directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(dumps(program, source_digest))
+            # Replace atomically, so concurrent runs never read part of a file
+            os.replace(temporary, self.path(script))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def load(self, script: str) -> Program:
+        """The program of a script file, compiled and cached unless it is cached."""
+        with open(script, 'rb') as file:
+            source = file.read()
+        source_digest = digest(source)
+        program = self.get(script, source_digest)
+        if program is None:
+            program = compile_file(io.BytesIO(source))
+            try:
+                self.put(script, program, source_digest)
+            except OSError:
+                # The cache is an optimisation, so a read-only cache is not an error
+                pass
+        return program
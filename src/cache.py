@@ -0,0 +1,154 @@
+"""
+Caches the outcomes of running Fifth scripts against initial stacks.
+
+Entries are keyed on a hash of the normalised script, in which each line's
+whitespace is collapsed as Stack.interpret would split it, of the arithmetic
+mode and of the initial stack. An entry holds the final stack and, if the
+script failed, the class and message of the error, so failures are replayed as
+well as successes.
+
+The cache is bounded both by its number of entries and by the approximate
+bytes they hold, evicting the least recently used entries first.
+"""
+import sys
+from collections import OrderedDict
+from hashlib import blake2b
+from typing import Iterable, NamedTuple, Optional, Tuple
+
+from compiler import ERRORS
+from compiler import Script
+from compiler import compile_script
+from compiler import execute
+from fifth import ARITHMETIC
+from fifth import Fifth
+
+# The default maximum number of entries
+MAX_ENTRIES = 1024
+
+# The default maximum bytes held by the entries
+MAX_BYTES = 64 * 1024 * 1024
+
+
+class CacheInfo(NamedTuple):
+    """Statistics of a ResultCache."""
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    bytes: int
+
+
+class _Entry(NamedTuple):
+    stack: Tuple[int, ...]
+    error: Optional[Tuple[type, str]]
+    size: int
+
+
+def normalise(script: Script) -> str:
+    """A script with the whitespace of each line collapsed, which runs as the script."""
+    if isinstance(script, str):
+        script = script.splitlines()
+    return "\n".join(" ".join(command_line.split()) for command_line in script)
+
+
+def _key(script: str, stack: Iterable[int], arithmetic: ARITHMETIC) -> bytes:
+    digest = blake2b(script.encode(), digest_size=16)
+    digest.update(f"\0{arithmetic.value}\0".encode())
+    # hex() has no limit on the digits of large integers, unlike repr()
+    digest.update(",".join(map(hex, stack)).encode())
+    return digest.digest()
+
+
+def _size(stack: Tuple[int, ...], error: Optional[Tuple[type, str]]) -> int:
+    size = sys.getsizeof(stack) + sum(map(sys.getsizeof, stack))
+    if error is not None:
+        size += sys.getsizeof(error[1])
+    return size
+
+
+class ResultCache:
+    """An LRU cache of the outcomes of scripts.
+
+    :param max_entries The maximum number of entries.
+    :param max_bytes The maximum bytes held by the entries.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[bytes, _Entry] = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def cache_info(self) -> CacheInfo:
+        """The hit, miss and eviction counts and the size of the cache."""
+        return CacheInfo(self._hits, self._misses, self._evictions,
+                         len(self._entries), self._bytes)
+
+    def clear(self):
+        """Remove every entry, keeping the statistics."""
+        self._entries.clear()
+        self._bytes = 0
+
+    def _store(self, key: bytes, entry: _Entry):
+        if entry.size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self._evictions += 1
+
+    def execute(self, script: Script, fifth: Fifth) -> Fifth:
+        """Run a script against fifth as compiler.execute would, replaying the
+        outcome if the script has been run against the same stack before.
+
+        Within a transaction the cache is bypassed, so every operation is journalled.
+
+        :raises InvalidCommandError If a command cannot be performed.
+        :raises InvalidOperationError If an operation cannot be performed.
+        :raises InsufficientStackItemsError If there are too few items on the stack.
+        """
+        script = normalise(script)
+        if fifth.in_transaction:
+            return execute(compile_script(script), fifth)
+
+        storage = fifth.storage
+        key = _key(script, storage, fifth.arithmetic)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._hits += 1
+            self._entries.move_to_end(key)
+            storage.drop(len(storage))
+            storage.extend(entry.stack)
+            if entry.error is not None:
+                error_class, message = entry.error
+                raise error_class(message)
+            return fifth
+
+        self._misses += 1
+        try:
+            execute(compile_script(script), fifth)
+        except ERRORS as error:
+            stack = tuple(storage)
+            outcome = (type(error), str(error))
+            self._store(key, _Entry(stack, outcome, _size(stack, outcome)))
+            raise
+        stack = tuple(storage)
+        self._store(key, _Entry(stack, None, _size(stack, None)))
+        return fifth
+
+    def run(self, script: Script, data: Iterable[int] = ()) -> Fifth:
+        """Run a script against a new Fifth holding data.
+
+        :raises InvalidCommandError If a command cannot be performed.
+        :raises InvalidOperationError If an operation cannot be performed.
+        :raises InsufficientStackItemsError If there are too few items on the stack.
+        """
+        return self.execute(script, Fifth(list(data)))
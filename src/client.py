@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+"""
+A tiny client for the warm Fifth server, see warm.py.
+
+Forwards stdin, or a script file, to a pre-forked worker over a Unix socket
+and copies the output to stdout, so a short script does not pay for importing
+and setting up the interpreter. It takes the same arguments as the program,
+and if no server is running it runs the program itself instead.
+
+Only the standard library is imported, so for the lowest latency it can be
+run without site packages:
+python3 -S src/client.py < script.txt
+"""
+import os
+import select
+import sys
+
+# The socket module imports enum, selectors and more, which cost more than the
+# rest of the client; the C module it wraps is all the client needs
+import _socket as socket
+
+# The socket the server listens on, unless FIFTH_SOCKET is set
+DEFAULT_SOCKET = f"/tmp/fifth-{os.getuid()}.sock"
+
+# The protocol version, sent in the request header
+VERSION = 1
+
+# The output modes of the program, as in stack.OUTPUT
+OUTPUTS = ("full", "delta", "final", "quiet")
+
+# Bytes copied at a time
+BUFFER_SIZE = 64 * 1024
+
+
+def socket_path() -> str:
+    """The socket of the warm server."""
+    return os.environ.get("FIFTH_SOCKET", DEFAULT_SOCKET)
+
+
+def parse_args(argv):
+    """The output mode, batch flag and script file in the program's arguments."""
+    output, batch, path = "full", False, None
+    args = iter(argv)
+    for arg in args:
+        if arg == "--output":
+            output = next(args, output)
+        elif arg.startswith("--output="):
+            output = arg.partition("=")[2]
+        elif arg == "--batch":
+            batch = True
+        elif not arg.startswith("-"):
+            path = arg
+        else:
+            raise ValueError(arg)
+    if output not in OUTPUTS:
+        raise ValueError(output)
+    return output, batch, path
+
+
+def _forward(sock: socket.socket, infile: int):
+    """Send infile to the server as it can be read, copying the output as it
+    arrives, so that neither side blocks writing while the other is not reading."""
+    out = sys.stdout.fileno()
+    sock.setblocking(False)
+    pending = b""
+    reading = True
+    while True:
+        readers = [sock, infile] if reading and not pending else [sock]
+        writers = [sock] if pending else []
+        readable, writable, _ = select.select(readers, writers, [])
+        if sock in readable:
+            data = sock.recv(BUFFER_SIZE)
+            if not data:
+                return
+            os.write(out, data)
+        if writable:
+            pending = pending[sock.send(pending):]
+        elif infile in readable:
+            pending = os.read(infile, BUFFER_SIZE)
+            if not pending:
+                sock.shutdown(socket.SHUT_WR)
+                reading = False
+
+
+def run(argv) -> int:
+    """Run the program's arguments on the warm server.
+
+    :return The exit status.
+    """
+    output, batch, path = parse_args(argv)
+    interactive = path is None and not batch and sys.stdin.isatty()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path())
+        mode = "interactive" if interactive else "batch"
+        sock.sendall(f"FIFTH {VERSION} {mode} {output}\n".encode())
+        infile = os.open(path, os.O_RDONLY) if path is not None else sys.stdin.fileno()
+        _forward(sock, infile)
+    finally:
+        sock.close()
+    return 0
+
+
+def main():
+    """Run a script on the warm server, or run the program itself if there is none."""
+    try:
+        status = run(sys.argv[1:])
+    except (ValueError, FileNotFoundError, ConnectionRefusedError):
+        # No server, or arguments for the program to report: run it instead
+        program = os.path.dirname(os.path.abspath(__file__))
+        os.execv(sys.executable, [sys.executable, program, *sys.argv[1:]])
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""
+Compiles Fifth programs into specialised Python functions.
+
+A program is translated into straight-line Python source which is compiled once
+with compile() and cached. Items pushed by the program are held in local
+variables, and only written to the stack when the program ends, an error is
+raised, or too many are held. The generator tracks how many items are proven
+to be on the stack, so the size of the stack is only checked where it is not
+known, and never for items held in locals.
+
+Operations on the bottom of the stack first write the locals to the stack, and
+then act on the stack directly, as do bulk commands, which call their Fifth
+method.
+
+The generated function has the same effect as compiler.execute, including which
+error it raises and the state of the stack when it does. Within a transaction
+it falls back to compiler.execute, so that every operation is journalled, as it
+does for a Fifth in a fixed width arithmetic mode.
+"""
+from functools import lru_cache
+from functools import partial
+from typing import Callable, List, Optional, Tuple
+
+from compiler import OPCODE
+from compiler import Program
+from compiler import execute
+from fifth import ARITHMETIC
+from fifth import Fifth
+from fifth import InsufficientStackItemsError
+from fifth import InvalidCommandError
+from fifth import InvalidOperationError
+from optimiser import OPERAND_STACK_EFFECT
+
+# The number of compiled functions cached
+FUNCTION_CACHE_SIZE = 256
+
+# The most items held in local variables before they are written to the stack
+MAX_LOCALS = 32
+
+# The most instructions compiled into a function: larger programs run with
+# compiler.execute, as a function for them is slow to compile and large to cache
+MAX_INSTRUCTIONS = 10000
+
+INSUFFICIENT = "raise InsufficientStackItemsError('ERROR: insufficient items on stack.')"
+DIVIDE_BY_ZERO = "raise InvalidOperationError('ERROR: cannot divide by zero.')"
+
+# A dict mapping arithmetic opcodes to Python operators
+PYTHON_OPERATORS = {
+    OPCODE.ADD: '+',
+    OPCODE.SUBTRACT: '-',
+    OPCODE.MULTIPLY: '*',
+    OPCODE.DIVIDE: '//',
+    OPCODE.REVERSE_ADD: '+',
+    OPCODE.REVERSE_SUBTRACT: '-',
+    OPCODE.REVERSE_MULTIPLY: '*',
+    OPCODE.REVERSE_DIVIDE: '//',
+}
+
+# A dict mapping the opcodes of bulk commands to the Fifth methods they call
+# with their operand, which act on the stack in C
+BULK_METHODS = {
+    OPCODE.PUSH_MANY: 'push_many',
+    OPCODE.REVERSE_PUSH_MANY: 'reverse_push_many',
+    OPCODE.PUSH_RANGE: 'push_many',
+    OPCODE.DROPN: 'drop',
+    OPCODE.DUPN: 'dup_many',
+    OPCODE.SUM: 'sum',
+    OPCODE.PRODUCT: 'product',
+    OPCODE.REVERSE_SUM: 'reverse_sum',
+    OPCODE.REVERSE_PRODUCT: 'reverse_product',
+}
+
+BOTTOM_OPCODES = frozenset((
+    OPCODE.REVERSE_PUSH, OPCODE.REVERSE_POP, OPCODE.REVERSE_SWAP, OPCODE.REVERSE_DUP,
+    OPCODE.REVERSE_ADD, OPCODE.REVERSE_SUBTRACT, OPCODE.REVERSE_MULTIPLY,
+    OPCODE.REVERSE_DIVIDE,
+))
+
+
+def _local(position: int) -> str:
+    return f"t{position}"
+
+
+def _is_literal(expression: str) -> bool:
+    return expression.lstrip('-').isdigit()
+
+
+class _Generator:
+    """The source of a function, with the items on top of the stack held in locals.
+
+    Each item held in locals is either an integer literal, or the local named
+    after its position, so the stack is the items on it followed by the items
+    held in locals.
+    """
+
+    def __init__(self):
+        self.lines: List[str] = []
+        self.items: List[str] = []
+        # Integers too large to write as literals, named c0, c1, ...
+        self.constants: List[int] = []
+        # The number of items proven to be on the stack
+        self.known = 0
+
+    def literal(self, number: int) -> str:
+        """The source of an integer, a literal unless it does not fit in 64 bits."""
+        if -2 ** 63 <= number < 2 ** 63:
+            return repr(number)
+        return self.constant(number)
+
+    def constant(self, value) -> str:
+        """The name of a new constant holding a value."""
+        self.constants.append(value)
+        return f"c{len(self.constants) - 1}"
+
+    def emit(self, line: str):
+        """Write a line of the body of the function."""
+        self.lines.append(f"    {line}")
+
+    def _flush_source(self) -> Optional[str]:
+        if not self.items:
+            return None
+        if len(self.items) == 1:
+            return f"s.append({self.items[0]})"
+        return f"s.extend(({', '.join(self.items)}))"
+
+    def flush(self):
+        """Write the items held in locals to the stack."""
+        if (line := self._flush_source()) is not None:
+            self.emit(line)
+        self.known += len(self.items)
+        self.items = []
+
+    def fail(self, condition: Optional[str], raise_line: str):
+        """Raise an error, unconditionally if condition is None, leaving the stack
+        as it was before the instruction."""
+        flush = self._flush_source()
+        if condition is None:
+            if flush is not None:
+                self.emit(flush)
+            self.emit(raise_line)
+            return
+        self.emit(f"if {condition}:")
+        if flush is not None:
+            self.emit(f"    {flush}")
+        self.emit(f"    {raise_line}")
+
+    def require(self, count: int):
+        """Check there are count items on the stack."""
+        if self.known < count:
+            self.fail(f"len(s) < {count}", INSUFFICIENT)
+            self.known = count
+
+    def ensure(self, count: int):
+        """Hold at least count items in locals, checking the stack has enough."""
+        held = len(self.items)
+        if held >= count:
+            return
+        pulled = count - held
+        self.require(pulled)
+        # Move the held items up to make room below them
+        for position in reversed(range(held)):
+            if self.items[position] == _local(position):
+                self.emit(f"{_local(position + pulled)} = {_local(position)}")
+                self.items[position] = _local(position + pulled)
+        for position in reversed(range(pulled)):
+            self.emit(f"{_local(position)} = s.pop()")
+        self.items[:0] = [_local(position) for position in range(pulled)]
+        self.known -= pulled
+
+    def assign(self, position: int, expression: str):
+        """Hold the value of an expression at a position."""
+        if _is_literal(expression):
+            self.items[position] = expression
+        else:
+            if expression != _local(position):
+                self.emit(f"{_local(position)} = {expression}")
+            self.items[position] = _local(position)
+
+    def push(self, expression: str):
+        """Hold the value of an expression on top of the stack."""
+        self.items.append(None)
+        self.assign(len(self.items) - 1, expression)
+        if len(self.items) > MAX_LOCALS:
+            self.flush()
+
+    def top(self, opcode: OPCODE, operand) -> bool:
+        """Generate an operation on the top of the stack.
+
+        :return False if the operation always raises an error.
+        """
+        if opcode == OPCODE.PUSH:
+            self.push(self.literal(operand))
+        elif opcode == OPCODE.POP:
+            if self.items:
+                self.items.pop()
+            else:
+                self.require(1)
+                self.emit("s.pop()")
+                self.known -= 1
+        elif opcode == OPCODE.DUP:
+            self.ensure(1)
+            self.push(self.items[-1])
+        elif opcode == OPCODE.SWAP:
+            self.swap()
+        elif opcode == OPCODE.DROP:
+            self.drop(operand)
+        else:
+            return self.arithmetic(opcode)
+        return True
+
+    def swap(self):
+        """Generate a SWAP, exchanging the locals holding the top two items."""
+        self.ensure(2)
+        second, first = self.items[-2:]
+        position = len(self.items) - 2
+        if second == _local(position) and first == _local(position + 1):
+            self.emit(f"{second}, {first} = {first}, {second}")
+        elif second == _local(position):
+            self.assign(position + 1, second)
+            self.assign(position, first)
+        else:
+            self.assign(position, first)
+            self.assign(position + 1, second)
+
+    def drop(self, count: int):
+        """Generate a DROP of count items, from the locals and then the stack."""
+        held = len(self.items)
+        if held >= count:
+            del self.items[held - count:]
+            return
+        # The POPs which would succeed, then the one which fails
+        self.items = []
+        dropped = count - held
+        if self.known < dropped:
+            self.emit(f"if len(s) < {dropped}:")
+            self.emit("    s.drop(len(s))")
+            self.emit(f"    {INSUFFICIENT}")
+            self.known = dropped
+        self.emit(f"s.drop({dropped})")
+        self.known -= dropped
+
+    def arithmetic(self, opcode: OPCODE) -> bool:
+        """Generate an arithmetic operator on the top two items.
+
+        :return False if the operator always raises an error.
+        """
+        self.ensure(2)
+        second, first = self.items[-2:]
+        if opcode == OPCODE.DIVIDE:
+            if first == '0':
+                self.fail(None, DIVIDE_BY_ZERO)
+                return False
+            if not _is_literal(first):
+                self.fail(f"{first} == 0", DIVIDE_BY_ZERO)
+        position = len(self.items) - 2
+        self.items.pop()
+        self.emit(f"{_local(position)} = {second} {PYTHON_OPERATORS[opcode]} {first}")
+        self.items[position] = _local(position)
+        return True
+
+    def bottom(self, opcode: OPCODE, operand):
+        """Generate an operation on the bottom of the stack."""
+        self.flush()
+        if opcode == OPCODE.REVERSE_PUSH:
+            self.emit(f"s.appendleft({self.literal(operand)})")
+            self.known += 1
+        elif opcode == OPCODE.REVERSE_POP:
+            self.require(1)
+            self.emit("s.popleft()")
+            self.known -= 1
+        elif opcode == OPCODE.REVERSE_DUP:
+            self.require(1)
+            self.emit("s.appendleft(s[0])")
+            self.known += 1
+        elif opcode == OPCODE.REVERSE_SWAP:
+            self.require(2)
+            self.emit("s[0], s[1] = s[1], s[0]")
+        else:
+            self.require(2)
+            if opcode == OPCODE.REVERSE_DIVIDE:
+                self.fail("s[1] == 0", DIVIDE_BY_ZERO)
+            self.emit(f"s[0] = s.popleft() {PYTHON_OPERATORS[opcode]} s[0]")
+            self.known -= 1
+
+    def bulk(self, opcode: OPCODE, operand):
+        """Generate a bulk command, calling its Fifth method on the stack."""
+        self.flush()
+        argument = self.literal(operand) if isinstance(operand, int) else self.constant(operand)
+        self.emit(f"fifth.{BULK_METHODS[opcode]}({argument})")
+        need, change = OPERAND_STACK_EFFECT[opcode](operand)
+        # The method raises if there are fewer than need items
+        self.known = max(self.known, need) + change
+
+    def generate(self, program: Program) -> str:
+        """The source of the function running a program."""
+        for opcode, operand in program.instructions():
+            if opcode == OPCODE.ERROR:
+                error_class, message = operand
+                self.fail(None, f"raise {error_class.__name__}({message!r})")
+                break
+            if opcode in BULK_METHODS:
+                self.bulk(opcode, operand)
+            elif opcode in BOTTOM_OPCODES:
+                self.bottom(opcode, operand)
+            elif not self.top(opcode, operand):
+                break
+        else:
+            self.flush()
+            self.emit("return fifth")
+
+        return "\n".join([
+            "def run(fifth):",
+            "    if fifth.in_transaction or fifth.arithmetic is not BIGINT:",
+            "        return fallback(fifth)",
+            "    s = fifth.storage",
+            *self.lines,
+        ])
+
+
+def generate(program: Program) -> str:
+    """Generate the source of a function executing a program, which is called
+    with a Fifth and returns it."""
+    return _Generator().generate(program)
+
+
+@lru_cache(maxsize=FUNCTION_CACHE_SIZE)
+def _compile(opcodes: bytes, operands: Tuple) -> Callable[[Fifth], Fifth]:
+    program = Program(opcodes, list(operands))
+    generator = _Generator()
+    source = generator.generate(program)
+    namespace = {
+        **{f"c{index}": number for index, number in enumerate(generator.constants)},
+        'fallback': partial(execute, program),
+        'BIGINT': ARITHMETIC.BIGINT,
+        'InsufficientStackItemsError': InsufficientStackItemsError,
+        'InvalidCommandError': InvalidCommandError,
+        'InvalidOperationError': InvalidOperationError,
+    }
+    # The source is generated from the opcodes, operands are literals of ints
+    # or constants in the namespace, so no input reaches it as code
+    exec(compile(source, "<fifth>", "exec"), namespace)  # pylint: disable=exec-used
+    return namespace['run']
+
+
+def compile_program(program: Program) -> Callable[[Fifth], Fifth]:
+    """Compile a program into a function executing it against a Fifth.
+
+    Functions are cached, so compiling an equal program again is cheap.
+    A program of more than MAX_INSTRUCTIONS instructions is not compiled, and
+    the function runs it with compiler.execute.
+
+    :return A function of a Fifth which returns it, and like compiler.execute
+    stops at the first instruction which fails.
+    """
+    if len(program.opcodes) > MAX_INSTRUCTIONS:
+        return partial(execute, program)
+    return _compile(program.opcodes, tuple(program.operands))
@@ -0,0 +1,304 @@
+"""
+Compiles Fifth scripts into programs which can be executed many times.
+
+A script is parsed once into a Program: a compact array of opcodes, one per
+input line, plus an array of operands for the opcodes which take an argument.
+Lines which Stack.interpret would reject are compiled into an ERROR opcode which
+raises the same error when it is executed.
+"""
+from enum import IntEnum, unique
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
+
+from fifth import Fifth
+from fifth import COMMAND
+from fifth import OPERATORS
+from fifth import InsufficientStackItemsError
+from fifth import InvalidCommandError
+from fifth import InvalidOperationError
+from fifth import inclusive_range
+
+
+@unique
+class OPCODE(IntEnum):
+    """Program opcodes."""
+    PUSH = 0
+    POP = 1
+    SWAP = 2
+    DUP = 3
+    REVERSE_PUSH = 4
+    REVERSE_POP = 5
+    REVERSE_SWAP = 6
+    REVERSE_DUP = 7
+    ADD = 8
+    SUBTRACT = 9
+    MULTIPLY = 10
+    DIVIDE = 11
+    REVERSE_ADD = 12
+    REVERSE_SUBTRACT = 13
+    REVERSE_MULTIPLY = 14
+    REVERSE_DIVIDE = 15
+    ERROR = 16
+    # Not a command: removes the top n items as n POPs would
+    DROP = 17
+    PUSH_MANY = 18
+    REVERSE_PUSH_MANY = 19
+    PUSH_RANGE = 20
+    DROPN = 21
+    DUPN = 22
+    SUM = 23
+    PRODUCT = 24
+    REVERSE_SUM = 25
+    REVERSE_PRODUCT = 26
+
+
+# A dict mapping input commands and operators to opcodes
+OPCODES = {
+    COMMAND.PUSH: OPCODE.PUSH,
+    COMMAND.POP: OPCODE.POP,
+    COMMAND.SWAP: OPCODE.SWAP,
+    COMMAND.DUP: OPCODE.DUP,
+    COMMAND.REVERSE_PUSH: OPCODE.REVERSE_PUSH,
+    COMMAND.REVERSE_POP: OPCODE.REVERSE_POP,
+    COMMAND.REVERSE_SWAP: OPCODE.REVERSE_SWAP,
+    COMMAND.REVERSE_DUP: OPCODE.REVERSE_DUP,
+    COMMAND.PUSH_RANGE: OPCODE.PUSH_RANGE,
+    COMMAND.DROPN: OPCODE.DROPN,
+    COMMAND.DUPN: OPCODE.DUPN,
+    COMMAND.SUM: OPCODE.SUM,
+    COMMAND.PRODUCT: OPCODE.PRODUCT,
+    COMMAND.REVERSE_SUM: OPCODE.REVERSE_SUM,
+    COMMAND.REVERSE_PRODUCT: OPCODE.REVERSE_PRODUCT,
+    OPERATORS.ADD: OPCODE.ADD,
+    OPERATORS.SUBTRACT: OPCODE.SUBTRACT,
+    OPERATORS.MULTIPLY: OPCODE.MULTIPLY,
+    OPERATORS.DIVIDE: OPCODE.DIVIDE,
+    OPERATORS.REVERSE_ADD: OPCODE.REVERSE_ADD,
+    OPERATORS.REVERSE_SUBTRACT: OPCODE.REVERSE_SUBTRACT,
+    OPERATORS.REVERSE_MULTIPLY: OPCODE.REVERSE_MULTIPLY,
+    OPERATORS.REVERSE_DIVIDE: OPCODE.REVERSE_DIVIDE,
+}
+
+# Opcodes which take an integer argument
+INTEGER_OPCODES = frozenset((OPCODE.PUSH, OPCODE.REVERSE_PUSH))
+
+# A dict mapping the opcodes which push an integer to the opcodes pushing many,
+# whose operand is a tuple of the integers
+MANY_OPCODES = {
+    OPCODE.PUSH: OPCODE.PUSH_MANY,
+    OPCODE.REVERSE_PUSH: OPCODE.REVERSE_PUSH_MANY,
+}
+
+# Opcodes which take a count of items argument
+COUNT_OPCODES = frozenset((OPCODE.DROPN, OPCODE.DUPN, OPCODE.SUM, OPCODE.PRODUCT,
+                           OPCODE.REVERSE_SUM, OPCODE.REVERSE_PRODUCT))
+
+# Opcodes which consume an operand
+OPERAND_OPCODES = (INTEGER_OPCODES | COUNT_OPCODES | set(MANY_OPCODES.values())
+                   | {OPCODE.PUSH_RANGE, OPCODE.ERROR, OPCODE.DROP})
+
+# Opcodes which are commands, and so are checked for their argument count
+COMMAND_OPCODES = frozenset(OPCODES[command] for command in COMMAND)
+
+ERRORS = (InvalidCommandError, InvalidOperationError, InsufficientStackItemsError)
+
+Script = Union[str, Iterable[str]]
+
+
+class Program:
+    """A compiled Fifth script.
+
+    :param opcodes The opcode of each instruction.
+    :param operands The operands of the instructions in OPERAND_OPCODES, in order.
+    """
+    __slots__ = ('opcodes', 'operands')
+
+    def __init__(self, opcodes: bytes = b'', operands: list = None):
+        self.opcodes = bytes(opcodes)
+        self.operands = operands if operands is not None else []
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def __eq__(self, other):
+        if not isinstance(other, Program):
+            return NotImplemented
+        return self.opcodes == other.opcodes and self.operands == other.operands
+
+    def instructions(self) -> Iterator[Tuple[OPCODE, object]]:
+        """Iterate over (opcode, operand) pairs, the operand being None for
+        opcodes which take no operand."""
+        next_operand = iter(self.operands).__next__
+        for opcode in self.opcodes:
+            opcode = OPCODE(opcode)
+            yield opcode, next_operand() if opcode in OPERAND_OPCODES else None
+
+    @classmethod
+    def from_instructions(cls, instructions: Iterable[Tuple[int, object]]) -> 'Program':
+        """Build a program from (opcode, operand) pairs."""
+        opcodes = bytearray()
+        operands = []
+        for opcode, operand in instructions:
+            opcodes.append(opcode)
+            if opcode in OPERAND_OPCODES:
+                operands.append(operand)
+        return cls(opcodes, operands)
+
+
+def _parse_integers(command_args: List[str], count: Optional[int] = None) -> List[int]:
+    """The integer arguments of a command.
+
+    :param count The number of arguments expected, or None for one or more.
+    :raises InvalidCommandError If there are not count arguments, or one is not an integer.
+    """
+    if count is None:
+        if not command_args:
+            raise InvalidCommandError("ERROR: expected 1 argument.")
+    elif len(command_args) != count:
+        plural = "" if count == 1 else "s"
+        raise InvalidCommandError(f"ERROR: expected {count} argument{plural}.")
+    if not all(map(str.isdigit, command_args)):
+        raise InvalidCommandError("ERROR: an integer argument expected.")
+    return list(map(int, command_args))
+
+
+def _parse_command(opcode: OPCODE, command_args: List[str]) -> Tuple[OPCODE, object]:
+    """Parse the arguments of a command into an (opcode, operand) pair.
+
+    :raises InvalidCommandError If the arguments are not those of the command.
+    """
+    if opcode in INTEGER_OPCODES:
+        numbers = _parse_integers(command_args)
+        if len(numbers) == 1:
+            return opcode, numbers[0]
+        return MANY_OPCODES[opcode], tuple(numbers)
+    if opcode == OPCODE.PUSH_RANGE:
+        return opcode, inclusive_range(*_parse_integers(command_args, 2))
+    if opcode in COUNT_OPCODES:
+        return opcode, _parse_integers(command_args, 1)[0]
+    if command_args:
+        raise InvalidCommandError("ERROR: expected 0 arguments.")
+    return opcode, None
+
+
+def parse_line(command_line: str) -> Tuple[OPCODE, object]:
+    """Parse one line of a script into an (opcode, operand) pair.
+
+    Lines which cannot be interpreted are parsed into an ERROR opcode whose
+    operand is the error class and message to raise.
+    """
+    command_line_split = command_line.split()
+    if not command_line_split:
+        return OPCODE.ERROR, (InvalidCommandError, "ERROR: no command specified.")
+
+    opcode = OPCODES.get(command_line_split[0])
+    if opcode is None:
+        return OPCODE.ERROR, (InvalidCommandError, "ERROR: unknown command/operator.")
+
+    if opcode not in COMMAND_OPCODES:
+        return opcode, None
+    try:
+        return _parse_command(opcode, command_line_split[1:])
+    except InvalidCommandError as error:
+        return OPCODE.ERROR, (InvalidCommandError, str(error))
+
+
+def compile_script(script: Script) -> Program:
+    """Compile a script, either a string or an iterable of lines, into a Program.
+
+    Each line compiles into exactly one instruction.
+    """
+    if isinstance(script, str):
+        script = script.splitlines()
+
+    opcodes = bytearray()
+    operands = []
+    for command_line in script:
+        opcode, operand = parse_line(command_line)
+        opcodes.append(opcode)
+        if opcode in OPERAND_OPCODES:
+            operands.append(operand)
+    return Program(opcodes, operands)
+
+
+def _raise_error(error: Tuple[type, str]):
+    error_class, message = error
+    raise error_class(message)
+
+
+def _drop(fifth: Fifth, count: int):
+    size = fifth.size()
+    if size < count:
+        # The POPs which would succeed, then the one which fails
+        fifth.drop(size)
+        fifth.pop()
+    fifth.drop(count)
+
+
+def bind(program: Program, fifth: Fifth) -> List[Callable[[], None]]:
+    """Get a table, indexed by opcode, of functions executing each opcode against
+    fifth and taking their operands in turn from the program."""
+    next_operand = iter(program.operands).__next__
+    table = [
+        lambda: fifth.push(next_operand()),
+        fifth.pop,
+        fifth.swap,
+        fifth.dup,
+        lambda: fifth.reverse_push(next_operand()),
+        fifth.reverse_pop,
+        fifth.reverse_swap,
+        fifth.reverse_dup,
+        fifth.add,
+        fifth.subtract,
+        fifth.multiply,
+        fifth.floordiv,
+        fifth.reverse_add,
+        fifth.reverse_subtract,
+        fifth.reverse_multiply,
+        fifth.reverse_floordiv,
+        lambda: _raise_error(next_operand()),
+        lambda: _drop(fifth, next_operand()),
+        lambda: fifth.push_many(next_operand()),
+        lambda: fifth.reverse_push_many(next_operand()),
+        lambda: fifth.push_many(next_operand()),
+        lambda: fifth.drop(next_operand()),
+        lambda: fifth.dup_many(next_operand()),
+        lambda: fifth.sum(next_operand()),
+        lambda: fifth.product(next_operand()),
+        lambda: fifth.reverse_sum(next_operand()),
+        lambda: fifth.reverse_product(next_operand()),
+    ]
+    return table
+
+
+def execute(program: Program, fifth: Fifth) -> Fifth:
+    """Execute a program against fifth.
+
+    Execution stops at the first instruction which fails, leaving fifth as it
+    was after the last successful instruction.
+
+    :raises InvalidCommandError If a command cannot be performed.
+    :raises InvalidOperationError If an operation cannot be performed.
+    :raises InsufficientStackItemsError If there are too few items on the stack.
+    """
+    table = bind(program, fifth)
+    for opcode in program.opcodes:
+        table[opcode]()
+    return fifth
+
+
+def execute_each(program: Program, fifth: Fifth) -> Iterator[Optional[Exception]]:
+    """Execute a program against fifth, yielding after each instruction.
+
+    As with a sequence of calls to Stack.interpret, a failing instruction leaves
+    the stack unchanged and execution continues with the next instruction.
+
+    :return An iterator of the error raised by each instruction, or None.
+    """
+    table = bind(program, fifth)
+    for opcode in program.opcodes:
+        try:
+            table[opcode]()
+        except ERRORS as error:
+            yield error
+        else:
+            yield None
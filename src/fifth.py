@@ -26,12 +26,33 @@ rPOP - remove the bottom element of the stack
 rSWAP - swap the bottom two elements of the stack
 rDUP - duplicate bottom top element of the stack
 
+and bulk commands, each run as one command however many values it acts on:
+PUSH x y ... - push each value onto the top of the stack in turn
+rPUSH x y ... - push each value onto the bottom of the stack in turn
+PUSHN x y - push the integers from x to y inclusive onto the top of the stack,
+            at most MAX_RANGE of them
+DROPN n - remove the top n elements of the stack
+DUPN n - duplicate the top n elements of the stack
+SUM n / PROD n - replace the top n elements of the stack with their sum / product
+rSUM n / rPROD n - replace the bottom n elements of the stack with their sum / product
+
 """
 
+import copy
+import math
+import operator
+from contextlib import contextmanager
 from enum import Enum, unique
-from typing import List
+from collections import deque
+from itertools import islice, repeat, starmap
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional
 from functools import wraps
 
+from storage import DEFAULT_STORAGE
+
+# The values rendered at a time by Fifth.render()
+RENDER_CHUNK = 4096
+
 
 class InsufficientStackItemsError(Exception):
     """When there are insufficient items on the stack to perform an operation."""
@@ -41,6 +62,10 @@ class InvalidOperationError(Exception):
     """For operations that caused an error."""
 
 
+class InvalidCommandError(Exception):
+    """For commands that caused an error."""
+
+
 class BaseEnum(Enum):
     """An enum base class with a list() helper."""
     @classmethod
@@ -60,6 +85,13 @@ class COMMAND(str, BaseEnum):
     REVERSE_POP = 'rPOP'
     REVERSE_SWAP = 'rSWAP'
     REVERSE_DUP = 'rDUP'
+    PUSH_RANGE = 'PUSHN'
+    DROPN = 'DROPN'
+    DUPN = 'DUPN'
+    SUM = 'SUM'
+    PRODUCT = 'PROD'
+    REVERSE_SUM = 'rSUM'
+    REVERSE_PRODUCT = 'rPROD'
 
 
 @unique
@@ -79,20 +111,190 @@ commands = COMMAND.list()
 operators = OPERATORS.list()
 
 
-class Fifth:
+@unique
+class ARITHMETIC(str, BaseEnum):
+    """Arithmetic modes."""
+    # Arbitrary precision integers
+    BIGINT = 'bigint'
+    # 64-bit integers, wrapping around on overflow
+    WRAP = 'wrap'
+    # 64-bit integers, held at the largest or smallest on overflow
+    SATURATE = 'saturate'
+
+
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+# The most integers PUSHN may push, so one command cannot exhaust memory
+MAX_RANGE = 1 << 20
+
+
+def inclusive_range(start: int, stop: int) -> range:
+    """The integers from start to stop inclusive, counting down if stop is less.
+
+    :raises InvalidCommandError If there are more than MAX_RANGE integers.
+    """
+    if start <= stop:
+        numbers = range(start, stop + 1)
+    else:
+        numbers = range(start, stop - 1, -1)
+    if len(numbers) > MAX_RANGE:
+        raise InvalidCommandError(f"ERROR: at most {MAX_RANGE} integers in a range.")
+    return numbers
+
+
+def _wrap(number: int) -> int:
+    return ((number - INT64_MIN) & 0xFFFF_FFFF_FFFF_FFFF) + INT64_MIN
+
+
+def _saturate(number: int) -> int:
+    return INT64_MIN if number < INT64_MIN else INT64_MAX if number > INT64_MAX else number
+
+
+class Operations(NamedTuple):
+    """The arithmetic of an arithmetic mode, each a function of (left, right)."""
+    add: Callable[[int, int], int]
+    subtract: Callable[[int, int], int]
+    multiply: Callable[[int, int], int]
+    floordiv: Callable[[int, int], int]
+    # Brings a pushed integer into range
+    normalise: Callable[[int], int]
+
+
+def _fixed_width(fit: Callable[[int], int]) -> Operations:
+    # The exact result is brought into range, so / still rounds towards -infinity
+    return Operations(lambda left, right: fit(left + right),
+                      lambda left, right: fit(left - right),
+                      lambda left, right: fit(left * right),
+                      lambda left, right: fit(left // right),
+                      lambda number: fit(int(number)))
+
+
+# A dict mapping arithmetic modes to their operations
+OPERATIONS = {
+    ARITHMETIC.BIGINT: Operations(operator.add, operator.sub, operator.mul, operator.floordiv, int),
+    ARITHMETIC.WRAP: _fixed_width(_wrap),
+    ARITHMETIC.SATURATE: _fixed_width(_saturate),
+}
+
+
+class Transactional:
+    """Transactions of a Fifth.
+
+    Between begin() and commit() every operation records how to undo itself in
+    a journal, so rollback() can restore the stack at the cost of the operations
+    made rather than the size of the stack.
+    """
+    def __init__(self):
+        # (function, *args) calls undoing each operation, or None outside a transaction
+        self._journal: Optional[list] = None
+        # The length of the journal when each open transaction began
+        self._savepoints: List[int] = []
+
+    @property
+    def in_transaction(self) -> bool:
+        """Whether a transaction is open, so operations are journalled."""
+        return self._journal is not None
+
+    def begin(self):
+        """Begin a transaction. Transactions may be nested."""
+        if self._journal is None:
+            self._journal = []
+        self._savepoints.append(len(self._journal))
+
+    def commit(self):
+        """Keep the operations made since the last begin()."""
+        self._savepoints.pop()
+        if not self._savepoints:
+            self._journal = None
+
+    def rollback(self):
+        """Undo the operations made since the last begin()."""
+        savepoint = self._savepoints.pop()
+        journal = self._journal
+        while len(journal) > savepoint:
+            func, *args = journal.pop()
+            func(*args)
+        if not self._savepoints:
+            self._journal = None
+
+    @contextmanager
+    def transaction(self):
+        """A context in which the operations are undone if an exception is raised."""
+        self.begin()
+        try:
+            yield self
+        except BaseException:
+            self.rollback()
+            raise
+        self.commit()
+
+
+# One public method for each command and operator of the language
+class Fifth(Transactional):  # pylint: disable=too-many-public-methods
     """Fifth is a new stack-based language.
     A stack is a data structure which can only have elements added to the top.
     Fifth stores a stack of integers and supports commands to manipulate that stack.
     Operations always apply to the top of the stack.
+
+    The stack is held in a storage backend (see storage.py), a deque by default,
+    so operations on both the top and the bottom of the stack are O(1).
+
+    Transactions are in Transactional.
+
+    Arithmetic is on arbitrary precision integers by default. In the WRAP and
+    SATURATE modes every integer on the stack fits in 64 bits, so the cost of an
+    operation is bounded, and ArrayStorage stays compact.
     """
-    def __init__(self, data: List[int] = None):
-        if data:
-            self._stack: List[int] = list(data)
-        else:
-            self._stack: List[int] = []
+    def __init__(self, data: List[int] = None,
+                 storage: Callable[[Iterable[int]], object] = DEFAULT_STORAGE,
+                 arithmetic: ARITHMETIC = ARITHMETIC.BIGINT):
+        self._arithmetic = ARITHMETIC(arithmetic)
+        self._operations = OPERATIONS[self._arithmetic]
+        if data and self._arithmetic != ARITHMETIC.BIGINT:
+            data = list(map(self._operations.normalise, data))
+        self._stack = storage(data or ())
+        super().__init__()
 
     def __str__(self):
-        return str(self._stack)
+        if hasattr(self._stack, 'render'):
+            return str(self._stack)
+        if len(self._stack) <= RENDER_CHUNK:
+            return str(list(self._stack))
+        return ''.join(self.render())
+
+    def render(self) -> Iterator[str]:
+        """The string of the stack, as str() returns it, in pieces of at most
+        RENDER_CHUNK values, so a large stack is never held in a list.
+        A storage which renders itself gives the pieces."""
+        if hasattr(self._stack, 'render'):
+            yield from self._stack.render()
+            return
+        values = iter(self._stack)
+        yield '['
+        separator = ''
+        while chunk := ', '.join(map(repr, islice(values, RENDER_CHUNK))):
+            yield separator + chunk
+            separator = ', '
+        yield ']'
+
+    @property
+    def storage(self):
+        """The storage backend holding the stack."""
+        return self._stack
+
+    @property
+    def arithmetic(self) -> ARITHMETIC:
+        """The arithmetic mode."""
+        return self._arithmetic
+
+    def fork(self) -> 'Fifth':
+        """A new Fifth with a copy of the stack, outside any transaction.
+
+        With PersistentStorage the copy shares the stack, so forking is O(1).
+        """
+        stack = copy.copy(self._stack)
+        return Fifth(storage=lambda _: stack, arithmetic=self._arithmetic)
 
     @staticmethod
     def validate_min_stack_size(minimum):
@@ -108,69 +310,227 @@ class Fifth:
 
     def push(self, number: int):
         """Push a valid integer onto the top of the stack."""
-        self._stack.append(int(number))
+        self._stack.append(self._operations.normalise(number))
+        if self._journal is not None:
+            self._journal.append((self._stack.pop,))
 
     @validate_min_stack_size(1)
     def pop(self) -> int:
         """Remove the top element of the stack."""
-        return self._stack.pop()
+        number = self._stack.pop()
+        if self._journal is not None:
+            self._journal.append((self._stack.append, number))
+        return number
+
+    def _swap_top(self):
+        self._stack[-2], self._stack[-1] = self._stack[-1], self._stack[-2]
 
     @validate_min_stack_size(2)
     def swap(self):
         """Swap the top two elements of the stack."""
-        self._stack[-2], self._stack[-1] = self._stack[-1], self._stack[-2]
+        self._swap_top()
+        if self._journal is not None:
+            self._journal.append((self._swap_top,))
 
     @validate_min_stack_size(1)
     def dup(self):
         """Duplicate the top element of the stack."""
         self._stack.append(self._stack[-1])
+        if self._journal is not None:
+            self._journal.append((self._stack.pop,))
+
+    def drop(self, count: int):
+        """Remove the top count elements of the stack."""
+        self._check_size(count)
+        if self._journal is not None:
+            numbers = list(islice(reversed(self._stack), count))
+            numbers.reverse()
+            self._journal.append((self._stack.extend, numbers))
+        self._stack.drop(count)
+
+    def _check_size(self, count: int):
+        if self.size() < count:
+            raise InsufficientStackItemsError("ERROR: insufficient items on stack.")
+
+    def push_many(self, numbers: Iterable[int]):
+        """Push integers onto the top of the stack, the last ending on top."""
+        numbers = list(map(self._operations.normalise, numbers))
+        self._stack.extend(numbers)
+        if self._journal is not None:
+            self._journal.append((self._stack.drop, len(numbers)))
+
+    def push_range(self, start: int, stop: int):
+        """Push the integers from start to stop inclusive onto the top of the stack.
+
+        :raises InvalidCommandError If there are more than MAX_RANGE integers.
+        """
+        self.push_many(inclusive_range(start, stop))
+
+    def dup_many(self, count: int):
+        """Duplicate the top count elements of the stack, in order."""
+        self._check_size(count)
+        numbers = list(islice(reversed(self._stack), count))
+        numbers.reverse()
+        self._stack.extend(numbers)
+        if self._journal is not None:
+            self._journal.append((self._stack.drop, count))
+
+    def _top_items(self, count: int) -> List[int]:
+        """Remove the top count elements of the stack."""
+        self._check_size(count)
+        numbers = list(islice(reversed(self._stack), count))
+        self.drop(count)
+        return numbers
+
+    def sum(self, count: int):
+        """Replace the top count integers of the stack with their sum."""
+        self.push(sum(self._top_items(count)))
+
+    def product(self, count: int):
+        """Replace the top count integers of the stack with their product."""
+        self.push(math.prod(self._top_items(count)))
+
+    def peek(self, index: int = -1) -> int:
+        """Get an element of the stack without removing it.
+        The index is from the bottom of the stack, or from the top if negative."""
+        return self._stack[index]
 
     def size(self) -> int:
         """The number of items on the stack."""
         return len(self._stack)
 
+    def _restore_top(self, second_operand: int, first_operand: int):
+        self._stack[-1] = second_operand
+        self._stack.append(first_operand)
+
+    def _apply_top(self, func: Callable[[int, int], int]):
+        """Replace the top two integers of the stack with func(second, top)."""
+        first_operand = self._stack.pop()
+        # The second item from the top of the stack acts as
+        # the summend or multiplier or dividend or minuend
+        second_operand = self._stack[-1]
+        self._stack[-1] = func(second_operand, first_operand)
+        if self._journal is not None:
+            self._journal.append((self._restore_top, second_operand, first_operand))
+
+    @validate_min_stack_size(2)
+    def add(self):
+        """Adds the top two integers of the stack."""
+        self._apply_top(self._operations.add)
+
+    @validate_min_stack_size(2)
+    def subtract(self):
+        """Subtracts the top integer from the second integer of the stack."""
+        self._apply_top(self._operations.subtract)
+
+    @validate_min_stack_size(2)
+    def multiply(self):
+        """Multiplies the top two integers of the stack."""
+        self._apply_top(self._operations.multiply)
+
+    @validate_min_stack_size(2)
+    def floordiv(self):
+        """Divides the second integer of the stack by the top integer."""
+        if self._stack[-1] == 0:
+            raise InvalidOperationError("ERROR: cannot divide by zero.")
+
+        self._apply_top(self._operations.floordiv)
+
     def reverse_push(self, number: int):
         """Push a valid integer onto the bottom of the stack."""
-        self._stack.insert(0, int(number))
+        self._stack.appendleft(self._operations.normalise(number))
+        if self._journal is not None:
+            self._journal.append((self._stack.popleft,))
+
+    def _swap_bottom(self):
+        self._stack[0], self._stack[1] = self._stack[1], self._stack[0]
 
     @validate_min_stack_size(2)
     def reverse_swap(self):
-        """Swap the top two elements of the stack."""
-        self._stack[1], self._stack[2] = self._stack[0], self._stack[1]
+        """Swap the bottom two elements of the stack."""
+        self._swap_bottom()
+        if self._journal is not None:
+            self._journal.append((self._swap_bottom,))
 
     @validate_min_stack_size(1)
     def reverse_dup(self):
-        """Duplicate the top element of the stack."""
-        self._stack.insert(0, self._stack[1])
+        """Duplicate the bottom element of the stack."""
+        self._stack.appendleft(self._stack[0])
+        if self._journal is not None:
+            self._journal.append((self._stack.popleft,))
 
     @validate_min_stack_size(1)
     def reverse_pop(self) -> int:
-        """Remove the top element of the stack."""
-        return self._stack.pop(0)
+        """Remove the bottom element of the stack."""
+        number = self._stack.popleft()
+        if self._journal is not None:
+            self._journal.append((self._stack.appendleft, number))
+        return number
+
+    def _extend_bottom(self, numbers: List[int]):
+        """Push integers onto the bottom of the stack, the first ending at the bottom."""
+        deque(map(self._stack.appendleft, reversed(numbers)), maxlen=0)
+
+    def _drop_bottom(self, count: int):
+        # Consume count calls to popleft() in C
+        deque(starmap(self._stack.popleft, repeat((), count)), maxlen=0)
+
+    def reverse_push_many(self, numbers: Iterable[int]):
+        """Push integers onto the bottom of the stack in turn, the last ending at
+        the bottom."""
+        numbers = list(map(self._operations.normalise, numbers))
+        deque(map(self._stack.appendleft, numbers), maxlen=0)
+        if self._journal is not None:
+            self._journal.append((self._drop_bottom, len(numbers)))
+
+    def _bottom_items(self, count: int) -> List[int]:
+        """Remove the bottom count elements of the stack."""
+        self._check_size(count)
+        numbers = list(islice(self._stack, count))
+        self._drop_bottom(count)
+        if self._journal is not None:
+            self._journal.append((self._extend_bottom, numbers))
+        return numbers
+
+    def reverse_sum(self, count: int):
+        """Replace the bottom count integers of the stack with their sum."""
+        self.reverse_push(sum(self._bottom_items(count)))
+
+    def reverse_product(self, count: int):
+        """Replace the bottom count integers of the stack with their product."""
+        self.reverse_push(math.prod(self._bottom_items(count)))
+
+    def _restore_bottom(self, first_operand: int, second_operand: int):
+        self._stack[0] = second_operand
+        self._stack.appendleft(first_operand)
+
+    def _apply_bottom(self, func: Callable[[int, int], int]):
+        """Replace the bottom two integers of the stack with func(bottom, second)."""
+        first_operand = self._stack.popleft()
+        second_operand = self._stack[0]
+        self._stack[0] = func(first_operand, second_operand)
+        if self._journal is not None:
+            self._journal.append((self._restore_bottom, first_operand, second_operand))
 
     @validate_min_stack_size(2)
     def reverse_add(self):
         """Adds the bottom two integers of the stack"""
-        self._stack[1] = self._stack[0] + self._stack[1]
-        self._stack.pop(0)
+        self._apply_bottom(self._operations.add)
 
     @validate_min_stack_size(2)
     def reverse_subtract(self):
-        """Adds the bottom two integers of the stack"""
-        self._stack[1] = self._stack[0] - self._stack[1]
-        self._stack.pop(0)
+        """Subtracts the second integer from the bottom integer of the stack"""
+        self._apply_bottom(self._operations.subtract)
 
     @validate_min_stack_size(2)
     def reverse_multiply(self):
-        """Adds the bottom two integers of the stack"""
-        self._stack[1] = self._stack[0] * self._stack[1]
-        self._stack.pop(0)
+        """Multiplies the bottom two integers of the stack"""
+        self._apply_bottom(self._operations.multiply)
 
     @validate_min_stack_size(2)
     def reverse_floordiv(self):
-        """Adds the bottom two integers of the stack"""
+        """Divides the bottom integer of the stack by the second integer"""
         if self._stack[1] == 0:
             raise InvalidOperationError("ERROR: cannot divide by zero.")
 
-        self._stack[1] = self._stack[0] // self._stack[1]
-        self._stack.pop(0)
+        self._apply_bottom(self._operations.floordiv)
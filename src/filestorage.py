@@ -0,0 +1,547 @@
+"""
+File-backed storage backends for the Fifth stack, holding stacks larger than
+memory.
+
+MmapStorage holds machine integers in a memory-mapped file, for stacks larger
+than memory or which must persist. SpillStorage keeps only the ends of the
+stack in memory and spills the middle to a temporary file, so its memory is
+bounded.
+"""
+import marshal
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+from collections import deque
+from itertools import islice, repeat, starmap
+from typing import Dict, Iterable, Iterator, List, NamedTuple
+
+from storage import check_index
+
+
+class MmapStorage:
+    """A storage of 64-bit machine integers in a memory-mapped file.
+
+    The file is a header followed by a ring buffer of slots. The header holds
+    the position of the bottom of the stack in the ring and the size of the
+    stack, so both top and bottom operations are O(1), and reopening an existing
+    file only maps it. When the ring is full the file grows by at least a chunk.
+
+    Values which do not fit in 64 bits are stored as a reserved marker in their
+    slot, with the value appended to a side file (the path with '.big' appended)
+    as it is stored, so it survives a process which never closes the storage.
+    The latest line for an index wins; flush() and close() compact the file.
+
+    :param path The file, which is created if it does not exist.
+    :param data Values to push onto the top of the stack.
+    :param chunk The minimum number of slots the file grows by.
+    """
+
+    MAGIC = b'FIFTHMAP'
+    VERSION = 1
+    # magic, version, bottom index, size, bottom slot, capacity
+    HEADER = struct.Struct('<8s5q')
+    HEADER_SIZE = 64
+    CHUNK = 1 << 16
+    # The marker for a value held in the side file
+    OVERFLOW = -2 ** 63
+
+    def __init__(self, path: str, data: Iterable[int] = (), chunk: int = CHUNK):
+        self.path = path
+        self.chunk = chunk
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self._file = open(path, 'r+b' if exists else 'w+b')  # pylint: disable=consider-using-with
+        if not exists:
+            self._file.write(self.HEADER.pack(self.MAGIC, self.VERSION, 0, 0, 0, chunk))
+            self._file.truncate(self.HEADER_SIZE + chunk * 8)
+            self._file.flush()
+
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+        magic, version, *_ = self.HEADER.unpack_from(self._mmap)
+        if magic != self.MAGIC or version != self.VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {self.VERSION} stack file.")
+        self._map()
+
+        # A dict mapping the index of a value, counted from the original
+        # bottom of the stack, to a value which does not fit in 64 bits
+        self._big: Dict[int, int] = {}
+        # Whether the side file holds lines of values no longer stored
+        self._big_changed = False
+        self._big_file = None
+        if os.path.exists(self._big_path):
+            with open(self._big_path, encoding='ascii') as big:
+                for line in big:
+                    index, number = line.split()
+                    self._big[int(index)] = int(number)
+
+        self.extend(data)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.path!r})"
+
+    def __copy__(self):
+        raise TypeError(f"cannot copy a {type(self).__name__}, which owns its file")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def _big_path(self) -> str:
+        return self.path + '.big'
+
+    def _map(self):
+        # [version, bottom index, size, bottom slot, capacity]
+        self._meta = memoryview(self._mmap)[8:self.HEADER.size].cast('q')
+        self._slots = memoryview(self._mmap)[self.HEADER_SIZE:].cast('q')
+
+    def _unmap(self):
+        self._meta.release()
+        self._slots.release()
+
+    def flush(self):
+        """Write the stack to its files, compacting the side file."""
+        self._mmap.flush()
+        if self._big_changed:
+            if self._big_file is not None:
+                self._big_file.close()
+                self._big_file = None
+            # Replace the side file whole, so values are never lost mid-write
+            compacted = self._big_path + '.tmp'
+            with open(compacted, 'w', encoding='ascii') as big:
+                big.writelines(f"{index} {number}\n" for index, number in self._big.items())
+            os.replace(compacted, self._big_path)
+            self._big_changed = False
+
+    def close(self):
+        """Write the stack to its files and close them."""
+        if self._mmap.closed:
+            return
+        if hasattr(self, '_meta'):
+            self.flush()
+            self._unmap()
+        if getattr(self, '_big_file', None) is not None:
+            self._big_file.close()
+        self._mmap.close()
+        self._file.close()
+
+    def __len__(self):
+        return self._meta[2]
+
+    def _slot(self, index: int) -> int:
+        """The slot of an index from the bottom of the stack."""
+        return (self._meta[3] + index) % self._meta[4]
+
+    def _grow(self):
+        """Grow the ring, keeping the stack in place."""
+        _, _, size, bottom, capacity = self._meta
+        growth = max(self.chunk, capacity // 2)
+        self._unmap()
+        self._mmap.resize(self.HEADER_SIZE + (capacity + growth) * 8)
+        self._map()
+        if bottom + size > capacity:
+            # The stack wraps around: move the slots from the bottom of the
+            # stack to the end of the ring up to the new end
+            start = self.HEADER_SIZE + bottom * 8
+            self._mmap.move(start + growth * 8, start, (capacity - bottom) * 8)
+            self._meta[3] = bottom + growth
+        self._meta[4] = capacity + growth
+
+    def _get(self, index: int) -> int:
+        number = self._slots[self._slot(index)]
+        if number == self.OVERFLOW:
+            return self._big[self._meta[1] + index]
+        return number
+
+    def _set(self, index: int, number: int):
+        if self.OVERFLOW < number < -self.OVERFLOW:
+            self._slots[self._slot(index)] = number
+            if self._big:
+                self._forget(self._meta[1] + index)
+        else:
+            self._slots[self._slot(index)] = self.OVERFLOW
+            key = self._meta[1] + index
+            if key in self._big:
+                self._big_changed = True
+            self._big[key] = number
+            self._log_big(key, number)
+
+    def _log_big(self, key: int, number: int):
+        """Append a value which does not fit in 64 bits to the side file."""
+        if self._big_file is None:
+            # Kept open for appends until the file is compacted or closed
+            # pylint: disable-next=consider-using-with
+            self._big_file = open(self._big_path, 'a', encoding='ascii')
+        self._big_file.write(f"{key} {number}\n")
+        self._big_file.flush()
+
+    def _forget(self, key: int):
+        if self._big.pop(key, None) is not None:
+            self._big_changed = True
+
+    def _index(self, index: int) -> int:
+        return check_index(index, self._meta[2])
+
+    def __getitem__(self, index: int) -> int:
+        return self._get(self._index(index))
+
+    def __setitem__(self, index: int, number: int):
+        self._set(self._index(index), number)
+
+    def _values(self, start: int, stop: int) -> List[int]:
+        """The values from index start up to stop, from the bottom of the stack."""
+        first = self._slot(start)
+        end = first + stop - start
+        capacity = self._meta[4]
+        if end <= capacity:
+            values = self._slots[first:end].tolist()
+        else:
+            values = self._slots[first:].tolist() + self._slots[:end - capacity].tolist()
+        if self.OVERFLOW in values:
+            base = self._meta[1] + start
+            for offset, number in enumerate(values):
+                if number == self.OVERFLOW:
+                    values[offset] = self._big[base + offset]
+        return values
+
+    def __iter__(self) -> Iterator[int]:
+        size = len(self)
+        for start in range(0, size, self.chunk):
+            yield from self._values(start, min(start + self.chunk, size))
+
+    def __reversed__(self) -> Iterator[int]:
+        for stop in range(len(self), 0, -self.chunk):
+            yield from reversed(self._values(max(stop - self.chunk, 0), stop))
+
+    def append(self, number: int):
+        """Push an integer onto the top of the stack."""
+        if self._meta[2] == self._meta[4]:
+            self._grow()
+        self._meta[2] += 1
+        self._set(self._meta[2] - 1, number)
+
+    def appendleft(self, number: int):
+        """Push an integer onto the bottom of the stack."""
+        if self._meta[2] == self._meta[4]:
+            self._grow()
+        self._meta[1] -= 1
+        self._meta[2] += 1
+        self._meta[3] = (self._meta[3] - 1) % self._meta[4]
+        self._set(0, number)
+
+    def extend(self, numbers: Iterable[int]):
+        """Push integers onto the top of the stack."""
+        for number in numbers:
+            self.append(number)
+
+    def pop(self) -> int:
+        """Remove the top element of the stack."""
+        if not self._meta[2]:
+            raise IndexError("pop from an empty storage")
+        number = self._get(self._meta[2] - 1)
+        if self._big:
+            self._forget(self._meta[1] + self._meta[2] - 1)
+        self._meta[2] -= 1
+        return number
+
+    def popleft(self) -> int:
+        """Remove the bottom element of the stack."""
+        if not self._meta[2]:
+            raise IndexError("pop from an empty storage")
+        number = self._get(0)
+        if self._big:
+            self._forget(self._meta[1])
+        self._meta[1] += 1
+        self._meta[2] -= 1
+        self._meta[3] = (self._meta[3] + 1) % self._meta[4]
+        return number
+
+    def drop(self, count: int):
+        """Remove the top count elements of the stack."""
+        self._meta[2] -= count
+        if self._big:
+            top = self._meta[1] + self._meta[2]
+            for key in [key for key in self._big if key >= top]:
+                self._forget(key)
+
+    def clear(self):
+        """Remove all the elements of the stack."""
+        self._meta[2] = 0
+        if self._big:
+            self._big.clear()
+            self._big_changed = True
+
+
+class _Segment(NamedTuple):
+    """A run of values spilled to the file of a SpillStorage."""
+    offset: int
+    length: int
+    count: int
+    # Whether the values are 64-bit machine integers, or marshalled
+    compact: bool
+
+
+class SpillStorage:
+    """A storage which keeps a hot window at each end of the stack in memory and
+    spills the cold middle to a temporary file.
+
+    When a window grows past hot values, its segment values furthest from the
+    end are written to the file as one segment, as 64-bit machine integers, or
+    marshalled if any value does not fit in 64 bits. A window which runs out is
+    refilled with the nearest segment, so segments are only read back as the
+    stack shrinks towards them. Memory is bounded by about two windows, whatever
+    the size of the stack. The space of segments read back is reused.
+
+    :param data Values to push onto the top of the stack.
+    :param hot The most values held in each window.
+    :param segment The values written to the file at a time, at most hot.
+    :param directory The directory of the temporary file, the system's by default.
+    """
+
+    HOT = 1 << 16
+    SEGMENT = 1 << 14
+    TYPECODE = 'q'
+
+    def __init__(self, data: Iterable[int] = (), hot: int = HOT, segment: int = SEGMENT,
+                 directory: str = None):
+        if not 0 < segment <= hot:
+            raise ValueError(f"segment must be between 1 and hot ({hot}), not {segment}")
+        self.hot = hot
+        self.segment = segment
+        self._bottom: deque = deque()
+        self._top: deque = deque()
+        # The spilled segments, from the bottom of the stack to the top
+        self._cold: deque = deque()
+        self._cold_size = 0
+        self._file = tempfile.TemporaryFile(dir=directory)  # pylint: disable=consider-using-with
+        self._end = 0
+        # A dict mapping a length to the offsets of free space of that length
+        self._free: Dict[int, List[int]] = {}
+        self.extend(data)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(hot={self.hot}, segment={self.segment})"
+
+    def __copy__(self):
+        raise TypeError(f"cannot copy a {type(self).__name__}, which owns its file")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close and remove the file of the stack."""
+        self._file.close()
+
+    def __len__(self):
+        return len(self._bottom) + self._cold_size + len(self._top)
+
+    @property
+    def spilled(self) -> int:
+        """The number of values held in the file."""
+        return self._cold_size
+
+    def _write(self, values: List[int]) -> _Segment:
+        try:
+            data = array(self.TYPECODE, values).tobytes()
+            compact = True
+        except OverflowError:
+            data = marshal.dumps(values)
+            compact = False
+        free = self._free.get(len(data))
+        if free:
+            offset = free.pop()
+        else:
+            offset = self._end
+            self._end += len(data)
+        os.pwrite(self._file.fileno(), data, offset)
+        return _Segment(offset, len(data), len(values), compact)
+
+    def _read(self, segment: _Segment) -> List[int]:
+        data = os.pread(self._file.fileno(), segment.length, segment.offset)
+        if segment.compact:
+            return array(self.TYPECODE, data).tolist()
+        return marshal.loads(data)
+
+    def _release(self, segment: _Segment):
+        self._cold_size -= segment.count
+        if not self._cold:
+            # Nothing is left in the file, so start it again
+            self._file.truncate(0)
+            self._end = 0
+            self._free.clear()
+        else:
+            self._free.setdefault(segment.length, []).append(segment.offset)
+
+    def _spill_top(self):
+        top = self._top
+        while len(top) > self.hot:
+            values = list(starmap(top.popleft, repeat((), self.segment)))
+            self._cold.append(self._write(values))
+            self._cold_size += len(values)
+
+    def _spill_bottom(self):
+        bottom = self._bottom
+        while len(bottom) > self.hot:
+            values = list(starmap(bottom.pop, repeat((), self.segment)))
+            values.reverse()
+            self._cold.appendleft(self._write(values))
+            self._cold_size += len(values)
+
+    def _fill_top(self):
+        """Move the nearest values below the top window into it."""
+        if self._cold:
+            segment = self._cold.pop()
+            self._top.extendleft(reversed(self._read(segment)))
+            self._release(segment)
+        else:
+            # Move the upper half of the bottom window to the top
+            half = (len(self._bottom) + 1) // 2
+            self._top.extendleft(starmap(self._bottom.pop, repeat((), half)))
+
+    def _fill_bottom(self):
+        """Move the nearest values above the bottom window into it."""
+        if self._cold:
+            segment = self._cold.popleft()
+            self._bottom.extend(self._read(segment))
+            self._release(segment)
+        else:
+            # Move the lower half of the top window to the bottom
+            half = (len(self._top) + 1) // 2
+            self._bottom.extend(starmap(self._top.popleft, repeat((), half)))
+
+    def _index(self, index: int) -> int:
+        return check_index(index, len(self))
+
+    def _cold_locate(self, index: int):
+        """The position in the cold segments and the offset in its segment of
+        an index between the windows."""
+        index -= len(self._bottom)
+        for position, segment in enumerate(self._cold):
+            if index < segment.count:
+                return position, index
+            index -= segment.count
+        raise IndexError("storage index out of range")
+
+    def _locate(self, index: int):
+        """The window and the index in it of an index, or None and the index if
+        it is in the file. A window of fewer than segment values is filled first
+        if the index is in the segment next to it."""
+        index = self._index(index)
+        while True:
+            if index < len(self._bottom):
+                return self._bottom, index
+            top_start = len(self) - len(self._top)
+            if index >= top_start:
+                return self._top, index - top_start
+            if len(self._top) < self.segment and index >= top_start - self._cold[-1].count:
+                self._fill_top()
+            elif len(self._bottom) < self.segment and \
+                    index < len(self._bottom) + self._cold[0].count:
+                self._fill_bottom()
+            else:
+                return None, index
+
+    def __getitem__(self, index: int) -> int:
+        values, index = self._locate(index)
+        if values is None:
+            position, offset = self._cold_locate(index)
+            return self._read(self._cold[position])[offset]
+        return values[index]
+
+    def __setitem__(self, index: int, number: int):
+        values, index = self._locate(index)
+        if values is None:
+            position, offset = self._cold_locate(index)
+            segment = self._cold[position]
+            values = self._read(segment)
+            values[offset] = number
+            self._cold[position] = self._write(values)
+            self._free.setdefault(segment.length, []).append(segment.offset)
+            return
+        values[index] = number
+
+    def __iter__(self) -> Iterator[int]:
+        yield from self._bottom
+        for segment in list(self._cold):
+            yield from self._read(segment)
+        yield from self._top
+
+    def __reversed__(self) -> Iterator[int]:
+        yield from reversed(self._top)
+        for segment in list(reversed(self._cold)):
+            yield from reversed(self._read(segment))
+        yield from reversed(self._bottom)
+
+    def append(self, number: int):
+        """Push an integer onto the top of the stack."""
+        self._top.append(number)
+        if len(self._top) > self.hot:
+            self._spill_top()
+
+    def appendleft(self, number: int):
+        """Push an integer onto the bottom of the stack."""
+        self._bottom.appendleft(number)
+        if len(self._bottom) > self.hot:
+            self._spill_bottom()
+
+    def extend(self, numbers: Iterable[int]):
+        """Push integers onto the top of the stack."""
+        numbers = iter(numbers)
+        while True:
+            size = len(self._top)
+            self._top.extend(islice(numbers, self.segment))
+            if len(self._top) == size:
+                return
+            self._spill_top()
+
+    def pop(self) -> int:
+        """Remove the top element of the stack."""
+        if not self._top:
+            if not self._cold and not self._bottom:
+                raise IndexError("pop from an empty storage")
+            self._fill_top()
+        return self._top.pop()
+
+    def popleft(self) -> int:
+        """Remove the bottom element of the stack."""
+        if not self._bottom:
+            if not self._cold and not self._top:
+                raise IndexError("pop from an empty storage")
+            self._fill_bottom()
+        return self._bottom.popleft()
+
+    def drop(self, count: int):
+        """Remove the top count elements of the stack."""
+        while count > len(self._top) and self._cold:
+            # Whole segments are dropped without reading them
+            count -= len(self._top)
+            self._top.clear()
+            if count >= self._cold[-1].count:
+                segment = self._cold.pop()
+                self._release(segment)
+                count -= segment.count
+            else:
+                self._fill_top()
+        if count > len(self._top):
+            count -= len(self._top)
+            self._top.clear()
+            deque(starmap(self._bottom.pop, repeat((), count)), maxlen=0)
+        else:
+            deque(starmap(self._top.pop, repeat((), count)), maxlen=0)
+
+    def clear(self):
+        """Remove all the elements of the stack."""
+        self._bottom.clear()
+        self._top.clear()
+        self._cold.clear()
+        self._cold_size = 0
+        self._file.truncate(0)
+        self._end = 0
+        self._free.clear()
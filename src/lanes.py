@@ -0,0 +1,329 @@
+"""
+Runs one compiled Fifth program over many initial stacks at once.
+
+Each initial stack is a lane. The stacks of all the lanes are held in one NumPy
+array, a row per lane, so every instruction is executed once for the whole
+batch rather than once per lane. Lanes have their own bottom and top offsets
+into their row, so lanes of different depths are executed together.
+
+As with compiler.execute, a lane stops at the first instruction which fails.
+Failures are recorded per lane as an error code rather than raised. Lanes whose
+values do not fit in 64 bits, initially or after an arithmetic operation, are
+re-run with compiler.execute on Python integers, so results are exact. Programs
+with bulk commands are run that way for every lane.
+
+NumPy is an optional dependency, needed only by this module.
+"""
+from itertools import islice
+from typing import List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from compiler import OPCODE
+from compiler import ERRORS
+from compiler import Program
+from compiler import bind
+from fifth import Fifth
+from fifth import InsufficientStackItemsError
+from fifth import InvalidCommandError
+from fifth import InvalidOperationError
+
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+# Lane error codes
+LANE_OK = 0
+LANE_INSUFFICIENT_ITEMS = 1
+LANE_DIVIDE_BY_ZERO = 2
+LANE_INVALID_COMMAND = 3
+
+ERROR_CODES = {
+    InsufficientStackItemsError: LANE_INSUFFICIENT_ITEMS,
+    InvalidOperationError: LANE_DIVIDE_BY_ZERO,
+    InvalidCommandError: LANE_INVALID_COMMAND,
+}
+
+TOP_ARITHMETIC = (OPCODE.ADD, OPCODE.SUBTRACT, OPCODE.MULTIPLY, OPCODE.DIVIDE)
+BOTTOM_ARITHMETIC = (OPCODE.REVERSE_ADD, OPCODE.REVERSE_SUBTRACT,
+                     OPCODE.REVERSE_MULTIPLY, OPCODE.REVERSE_DIVIDE)
+
+# The opcodes executed on the lanes; programs with others, the bulk commands,
+# are run with compiler.execute for every lane
+LANE_OPCODES = frozenset((
+    OPCODE.PUSH, OPCODE.POP, OPCODE.SWAP, OPCODE.DUP, OPCODE.REVERSE_PUSH, OPCODE.REVERSE_POP,
+    OPCODE.REVERSE_SWAP, OPCODE.REVERSE_DUP, OPCODE.ERROR, OPCODE.DROP,
+    *TOP_ARITHMETIC, *BOTTOM_ARITHMETIC,
+))
+
+# A dict mapping arithmetic opcodes to the plain operation
+ARITHMETIC = dict(zip(TOP_ARITHMETIC, TOP_ARITHMETIC))
+ARITHMETIC.update(zip(BOTTOM_ARITHMETIC, TOP_ARITHMETIC))
+
+
+def _fits(number: int) -> bool:
+    return INT64_MIN <= number <= INT64_MAX
+
+
+def _arithmetic(opcode: OPCODE, left, right):
+    """Apply an operator to two int64 arrays.
+
+    :return The result and a mask of the results which overflowed.
+    """
+    if opcode == OPCODE.ADD:
+        result = left + right
+        return result, ((left ^ result) & (right ^ result)) < 0
+    if opcode == OPCODE.SUBTRACT:
+        result = left - right
+        return result, ((left ^ right) & (left ^ result)) < 0
+    if opcode == OPCODE.MULTIPLY:
+        result = left * right
+        divisor = np.where(right == 0, 1, right)
+        overflow = (right != 0) & (result // divisor != left)
+        overflow |= (right == -1) & (left == INT64_MIN)
+        return result, overflow
+    # Division by zero is masked out by the caller
+    overflow = (right == -1) & (left == INT64_MIN)
+    return left // np.where(overflow, 1, right), overflow
+
+
+class LaneResults:
+    """The outcome of executing a program in many lanes.
+
+    :param lanes The lanes after execution.
+    :param exact A dict mapping the lanes re-run on Python integers to their stacks.
+
+    The errors attribute holds the error code of each lane, LANE_OK if it did
+    not fail, and failed_at the index of the failing instruction in each lane,
+    or -1.
+    """
+
+    def __init__(self, program: Program, lanes: '_Lanes', exact: dict):
+        self._program = program
+        self._values = lanes.values
+        self._bottoms = lanes.bottoms
+        self._tops = lanes.tops
+        self._exact = exact
+        self.errors = lanes.errors
+        self.failed_at = lanes.failed_at
+
+    def __len__(self):
+        return len(self.errors)
+
+    @property
+    def ok(self):
+        """A mask of the lanes which did not fail."""
+        return self.errors == LANE_OK
+
+    def stack(self, lane: int) -> List[int]:
+        """The final stack of a lane, bottom first."""
+        if lane in self._exact:
+            return list(self._exact[lane])
+        return self._values[lane, self._bottoms[lane]:self._tops[lane]].tolist()
+
+    def stacks(self) -> List[List[int]]:
+        """The final stacks of all the lanes."""
+        return [self.stack(lane) for lane in range(len(self))]
+
+    def error(self, lane: int) -> Optional[Exception]:
+        """The error which stopped a lane, or None."""
+        code = self.errors[lane]
+        if code == LANE_OK:
+            return None
+        if code == LANE_INSUFFICIENT_ITEMS:
+            return InsufficientStackItemsError("ERROR: insufficient items on stack.")
+        if code == LANE_DIVIDE_BY_ZERO:
+            return InvalidOperationError("ERROR: cannot divide by zero.")
+        _, (error_class, message) = next(islice(self._program.instructions(),
+                                                self.failed_at[lane], None))
+        return error_class(message)
+
+
+class _Lanes:
+    """The state of the lanes during execution."""
+
+    def __init__(self, program: Program, stacks: Sequence[Sequence[int]]):
+        opcodes = program.opcodes
+        bottom_growth = opcodes.count(OPCODE.REVERSE_PUSH) + opcodes.count(OPCODE.REVERSE_DUP)
+        top_growth = opcodes.count(OPCODE.PUSH) + opcodes.count(OPCODE.DUP)
+
+        count = len(stacks)
+        sizes = np.fromiter(map(len, stacks), dtype=np.int64, count=count)
+        self.fallback = np.fromiter((not all(map(_fits, stack)) for stack in stacks),
+                                    dtype=bool, count=count)
+        if not LANE_OPCODES.issuperset(set(opcodes)):
+            self.fallback[:] = True
+        sizes[self.fallback] = 0
+        depth = int(sizes.max()) if count else 0
+
+        self.values = np.zeros((count, bottom_growth + depth + top_growth), dtype=np.int64)
+        self.bottoms = np.full(count, bottom_growth, dtype=np.int64)
+        self.tops = self.bottoms + sizes
+        rows = np.repeat(np.arange(count), sizes)
+        columns = bottom_growth + np.arange(len(rows)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        self.values[rows, columns] = np.fromiter(
+            (number for lane, stack in enumerate(stacks) if not self.fallback[lane]
+             for number in stack),
+            dtype=np.int64, count=len(rows))
+
+        self.errors = np.zeros(count, dtype=np.int8)
+        self.failed_at = np.full(count, -1, dtype=np.int64)
+        # The live lanes
+        self.rows = np.flatnonzero(~self.fallback)
+
+    def fail(self, mask, code: int, index: int):
+        """Stop the live lanes in mask with an error."""
+        rows = self.rows[mask]
+        self.errors[rows] = code
+        self.failed_at[rows] = index
+        self.rows = self.rows[~mask]
+
+    def overflow(self, mask):
+        """Stop the live lanes in mask to re-run them exactly."""
+        rows = self.rows[mask]
+        self.fallback[rows] = True
+        self.rows = self.rows[~mask]
+
+    def require(self, minimum: int, index: int):
+        """Fail the live lanes with fewer than minimum items."""
+        short = (self.tops[self.rows] - self.bottoms[self.rows]) < minimum
+        if short.any():
+            self.fail(short, LANE_INSUFFICIENT_ITEMS, index)
+
+    def run(self, index: int, opcode: OPCODE, operand):
+        """Execute one instruction in all the live lanes."""
+        if opcode == OPCODE.ERROR:
+            self.fail(np.ones(len(self.rows), dtype=bool), LANE_INVALID_COMMAND, index)
+        elif opcode in (OPCODE.PUSH, OPCODE.REVERSE_PUSH):
+            self._run_push(opcode, operand)
+        elif opcode == OPCODE.DROP:
+            self._run_drop(index, operand)
+        elif opcode in (OPCODE.POP, OPCODE.DUP, OPCODE.REVERSE_POP, OPCODE.REVERSE_DUP):
+            self._run_one(index, opcode)
+        elif opcode in (OPCODE.SWAP, OPCODE.REVERSE_SWAP):
+            self._run_swap(index, opcode)
+        else:
+            self._run_arithmetic(index, opcode)
+
+    def _run_push(self, opcode: OPCODE, number: int):
+        if not _fits(number):
+            self.overflow(np.ones(len(self.rows), dtype=bool))
+        elif opcode == OPCODE.PUSH:
+            self.values[self.rows, self.tops[self.rows]] = number
+            self.tops[self.rows] += 1
+        else:
+            self.bottoms[self.rows] -= 1
+            self.values[self.rows, self.bottoms[self.rows]] = number
+
+    def _run_drop(self, index: int, count: int):
+        rows = self.rows
+        short = (self.tops[rows] - self.bottoms[rows]) < count
+        # As the POPs it replaces, DROP empties a short stack before failing
+        self.tops[rows[short]] = self.bottoms[rows[short]]
+        self.tops[rows[~short]] -= count
+        if short.any():
+            self.fail(short, LANE_INSUFFICIENT_ITEMS, index)
+
+    def _run_one(self, index: int, opcode: OPCODE):
+        """Execute an instruction on one item: POP, DUP, rPOP or rDUP."""
+        self.require(1, index)
+        values = self.values
+        rows = self.rows
+        if opcode == OPCODE.POP:
+            self.tops[rows] -= 1
+        elif opcode == OPCODE.DUP:
+            tops = self.tops[rows]
+            values[rows, tops] = values[rows, tops - 1]
+            self.tops[rows] += 1
+        elif opcode == OPCODE.REVERSE_POP:
+            self.bottoms[rows] += 1
+        else:
+            bottoms = self.bottoms[rows]
+            values[rows, bottoms - 1] = values[rows, bottoms]
+            self.bottoms[rows] -= 1
+
+    def _run_swap(self, index: int, opcode: OPCODE):
+        self.require(2, index)
+        values = self.values
+        rows = self.rows
+        if opcode == OPCODE.SWAP:
+            first, second = self.tops[rows] - 1, self.tops[rows] - 2
+        else:
+            first, second = self.bottoms[rows], self.bottoms[rows] + 1
+        values[rows, first], values[rows, second] = values[rows, second], values[rows, first]
+
+    def _run_arithmetic(self, index: int, opcode: OPCODE):
+        self.require(2, index)
+        values = self.values
+        if opcode in TOP_ARITHMETIC:
+            # The second item from the top is the left operand
+            left_columns = self.tops[self.rows] - 2
+            right_columns = left_columns + 1
+        else:
+            # The bottom item is the left operand
+            left_columns = self.bottoms[self.rows]
+            right_columns = left_columns + 1
+        right = values[self.rows, right_columns]
+
+        if opcode in (OPCODE.DIVIDE, OPCODE.REVERSE_DIVIDE):
+            zero = right == 0
+            if zero.any():
+                self.fail(zero, LANE_DIVIDE_BY_ZERO, index)
+                left_columns, right_columns = left_columns[~zero], right_columns[~zero]
+                right = right[~zero]
+
+        rows = self.rows
+        left = values[rows, left_columns]
+        result, overflow = _arithmetic(ARITHMETIC[opcode], left, right)
+        if overflow.any():
+            self.overflow(overflow)
+            rows, result = self.rows, result[~overflow]
+            left_columns, right_columns = left_columns[~overflow], right_columns[~overflow]
+
+        if opcode in TOP_ARITHMETIC:
+            values[rows, left_columns] = result
+            self.tops[rows] -= 1
+        else:
+            values[rows, right_columns] = result
+            self.bottoms[rows] += 1
+
+
+def execute_lanes(program: Program, stacks: Sequence[Sequence[int]]) -> LaneResults:
+    """Execute a program against each of the initial stacks.
+
+    :param program The program, optimised or not.
+    :param stacks The initial stacks, bottom first.
+    """
+    if np is None:
+        raise ImportError("execute_lanes requires NumPy.")
+
+    lanes = _Lanes(program, stacks)
+    with np.errstate(all='ignore'):
+        for index, (opcode, operand) in enumerate(program.instructions()):
+            if not lanes.rows.size:
+                break
+            lanes.run(index, opcode, operand)
+    return LaneResults(program, lanes, _run_exact(program, stacks, lanes))
+
+
+def _run_exact(program: Program, stacks: Sequence[Sequence[int]], lanes: _Lanes) -> dict:
+    """Re-run the lanes which do not fit in 64 bits with Python integers,
+    recording their errors in lanes.
+
+    :return A dict mapping the lanes to their final stacks.
+    """
+    exact = {}
+    for lane in np.flatnonzero(lanes.fallback).tolist():
+        fifth = Fifth(stacks[lane])
+        table = bind(program, fifth)
+        for index, opcode in enumerate(program.opcodes):
+            try:
+                table[opcode]()
+            except ERRORS as error:
+                lanes.errors[lane] = ERROR_CODES[type(error)]
+                lanes.failed_at[lane] = index
+                break
+        exact[lane] = list(fifth.storage)
+    return exact
@@ -0,0 +1,222 @@
+"""
+A peephole optimiser for compiled Fifth programs.
+
+The optimiser rewrites short runs of instructions into fewer instructions:
+
+PUSH a, PUSH b, + - * /  -> PUSH (a op b)
+rPUSH a, rPUSH b, r+ r- r* r/  -> rPUSH (b op a)
+PUSH a, DUP  -> PUSH a, PUSH a
+PUSH a, PUSH b, SWAP  -> PUSH b, PUSH a
+PUSH a, POP and rPUSH a, rPOP  -> nothing
+DUP, POP and rDUP, rPOP  -> nothing
+SWAP, SWAP and rSWAP, rSWAP  -> nothing
+POP, POP, ...  -> DROP n
+
+An optimised program has the same effect as the original under compiler.execute
+with arbitrary precision arithmetic, including which error it raises and the
+state of the stack when it does. Folds which would divide by zero are not made,
+and rewrites which would hide an error are only made when enough items are known
+to be on the stack. Instructions after a compile error can never run, so they
+are removed.
+
+An optimised program no longer has one instruction per line, so it cannot be
+used with compiler.execute_each.
+"""
+import operator
+from typing import List, Optional, Tuple
+
+from compiler import OPCODE
+from compiler import Program
+
+Instruction = Tuple[OPCODE, object]
+
+# The number of the last instructions to replace, and the instructions replacing
+# them and the instruction emitted
+Rewrite = Tuple[int, List[Instruction]]
+
+# A dict mapping top arithmetic opcodes to functions of (second, top)
+TOP_ARITHMETIC = {
+    OPCODE.ADD: operator.add,
+    OPCODE.SUBTRACT: operator.sub,
+    OPCODE.MULTIPLY: operator.mul,
+    OPCODE.DIVIDE: operator.floordiv,
+}
+
+# A dict mapping bottom arithmetic opcodes to functions of (bottom, second)
+BOTTOM_ARITHMETIC = {
+    OPCODE.REVERSE_ADD: operator.add,
+    OPCODE.REVERSE_SUBTRACT: operator.sub,
+    OPCODE.REVERSE_MULTIPLY: operator.mul,
+    OPCODE.REVERSE_DIVIDE: operator.floordiv,
+}
+
+# A dict mapping opcodes to the items they need on the stack and the change they make
+# to the stack size
+STACK_EFFECT = {
+    OPCODE.PUSH: (0, 1),
+    OPCODE.POP: (1, -1),
+    OPCODE.SWAP: (2, 0),
+    OPCODE.DUP: (1, 1),
+    OPCODE.REVERSE_PUSH: (0, 1),
+    OPCODE.REVERSE_POP: (1, -1),
+    OPCODE.REVERSE_SWAP: (2, 0),
+    OPCODE.REVERSE_DUP: (1, 1),
+    **{opcode: (2, -1) for opcode in TOP_ARITHMETIC},
+    **{opcode: (2, -1) for opcode in BOTTOM_ARITHMETIC},
+}
+
+# A dict mapping opcodes whose effect depends on their operand to functions of the
+# operand giving the items they need on the stack and the change they make to its size
+OPERAND_STACK_EFFECT = {
+    OPCODE.DROP: lambda count: (count, -count),
+    OPCODE.PUSH_MANY: lambda numbers: (0, len(numbers)),
+    OPCODE.REVERSE_PUSH_MANY: lambda numbers: (0, len(numbers)),
+    OPCODE.PUSH_RANGE: lambda numbers: (0, len(numbers)),
+    OPCODE.DROPN: lambda count: (count, -count),
+    OPCODE.DUPN: lambda count: (count, count),
+    OPCODE.SUM: lambda count: (count, 1 - count),
+    OPCODE.PRODUCT: lambda count: (count, 1 - count),
+    OPCODE.REVERSE_SUM: lambda count: (count, 1 - count),
+    OPCODE.REVERSE_PRODUCT: lambda count: (count, 1 - count),
+}
+
+# A dict mapping opcodes duplicating an item to the opcode pushing it
+DUPLICATED_PUSHES = {
+    OPCODE.DUP: OPCODE.PUSH,
+    OPCODE.REVERSE_DUP: OPCODE.REVERSE_PUSH,
+}
+
+# Pairs of opcodes which cancel out, given the minimum stack size they need
+CANCELLING = {
+    (OPCODE.PUSH, OPCODE.POP): 0,
+    (OPCODE.REVERSE_PUSH, OPCODE.REVERSE_POP): 0,
+    (OPCODE.DUP, OPCODE.POP): 1,
+    (OPCODE.REVERSE_DUP, OPCODE.REVERSE_POP): 1,
+    (OPCODE.SWAP, OPCODE.SWAP): 2,
+    (OPCODE.REVERSE_SWAP, OPCODE.REVERSE_SWAP): 2,
+}
+
+
+def _drop(count: int) -> Instruction:
+    return (OPCODE.POP, None) if count == 1 else (OPCODE.DROP, count)
+
+
+def stack_effect(opcode: OPCODE, operand) -> Tuple[int, int]:
+    """The items an instruction needs on the stack and the change it makes to its size."""
+    if opcode in OPERAND_STACK_EFFECT:
+        return OPERAND_STACK_EFFECT[opcode](operand)
+    return STACK_EFFECT[opcode]
+
+
+def _cancel(peephole: '_Peephole', opcode: OPCODE, _operand) -> Optional[Rewrite]:
+    """Remove a pair of instructions which cancel out."""
+    last_opcode, _ = peephole.instructions[-1]
+    need = CANCELLING.get((last_opcode, opcode))
+    if need is not None and peephole.min_sizes[-2] >= need:
+        return 1, []
+    return None
+
+
+def _push_twice(peephole: '_Peephole', opcode: OPCODE, _operand) -> Optional[Rewrite]:
+    """Push a pushed value again rather than duplicate it."""
+    last_opcode, last_operand = peephole.instructions[-1]
+    if DUPLICATED_PUSHES.get(opcode) == last_opcode:
+        return 1, [(last_opcode, last_operand), (last_opcode, last_operand)]
+    return None
+
+
+def _merge_drops(peephole: '_Peephole', opcode: OPCODE, operand) -> Optional[Rewrite]:
+    """Merge POPs and DROPs into one, and drop a pushed value by not pushing it."""
+    if opcode not in (OPCODE.POP, OPCODE.DROP):
+        return None
+    count = 1 if opcode == OPCODE.POP else operand
+    last_opcode, last_operand = peephole.instructions[-1]
+    if last_opcode == OPCODE.POP:
+        return 1, [_drop(count + 1)]
+    if last_opcode == OPCODE.DROP:
+        return 1, [_drop(last_operand + count)]
+    if last_opcode == OPCODE.PUSH and count > 1:
+        return 1, [_drop(count - 1)]
+    return None
+
+
+def _fold_top(peephole: '_Peephole', opcode: OPCODE, _operand) -> Optional[Rewrite]:
+    """Fold two PUSHes followed by SWAP or an arithmetic operator."""
+    if len(peephole.instructions) < 2:
+        return None
+    (second_opcode, second_operand), (last_opcode, last_operand) = peephole.instructions[-2:]
+    if not second_opcode == last_opcode == OPCODE.PUSH:
+        return None
+    if opcode == OPCODE.SWAP:
+        return 2, [(OPCODE.PUSH, last_operand), (OPCODE.PUSH, second_operand)]
+    if opcode in TOP_ARITHMETIC and not (opcode == OPCODE.DIVIDE and last_operand == 0):
+        return 2, [(OPCODE.PUSH, TOP_ARITHMETIC[opcode](second_operand, last_operand))]
+    return None
+
+
+def _fold_bottom(peephole: '_Peephole', opcode: OPCODE, _operand) -> Optional[Rewrite]:
+    """Fold two rPUSHes followed by a bottom arithmetic operator."""
+    if len(peephole.instructions) < 2 or opcode not in BOTTOM_ARITHMETIC:
+        return None
+    (second_opcode, second_operand), (last_opcode, last_operand) = peephole.instructions[-2:]
+    if not second_opcode == last_opcode == OPCODE.REVERSE_PUSH:
+        return None
+    if opcode == OPCODE.REVERSE_DIVIDE and second_operand == 0:
+        return None
+    return 2, [(OPCODE.REVERSE_PUSH, BOTTOM_ARITHMETIC[opcode](last_operand, second_operand))]
+
+
+# The rewrite rules, tried in turn on each instruction emitted. Each is a function
+# of the peephole and the instruction giving a Rewrite, or None.
+REWRITE_RULES = (_cancel, _push_twice, _merge_drops, _fold_top, _fold_bottom)
+
+
+class _Peephole:
+    """The optimised instructions, with a lower bound of the stack size before
+    each instruction and after the last."""
+
+    def __init__(self):
+        self.instructions: List[Instruction] = []
+        self.min_sizes: List[int] = [0]
+
+    def emit(self, opcode: OPCODE, operand):
+        """Append an instruction, rewriting the end of the instructions if possible."""
+        rewrite = self._rewrite(opcode, operand)
+        if rewrite is None:
+            need, change = stack_effect(opcode, operand)
+            self.instructions.append((opcode, operand))
+            self.min_sizes.append(max(self.min_sizes[-1], need) + change)
+            return
+
+        count, replacement = rewrite
+        if count:
+            del self.instructions[-count:]
+            del self.min_sizes[-count:]
+        for instruction in replacement:
+            self.emit(*instruction)
+
+    def _rewrite(self, opcode: OPCODE, operand) -> Optional[Rewrite]:
+        """Find a rewrite of the last instructions followed by this instruction,
+        trying each rule in REWRITE_RULES in turn."""
+        if not self.instructions:
+            return None
+        for rule in REWRITE_RULES:
+            if (rewrite := rule(self, opcode, operand)) is not None:
+                return rewrite
+        return None
+
+
+def optimise(program: Program) -> Tuple[Program, int]:
+    """Optimise a program.
+
+    :return The optimised program and the number of instructions removed.
+    """
+    peephole = _Peephole()
+    for opcode, operand in program.instructions():
+        if opcode == OPCODE.ERROR:
+            peephole.instructions.append((opcode, operand))
+            break
+        peephole.emit(opcode, operand)
+
+    optimised = Program.from_instructions(peephole.instructions)
+    return optimised, len(program) - len(optimised)
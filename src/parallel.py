@@ -0,0 +1,91 @@
+"""
+Runs many independent Fifth scripts in parallel in a pool of processes.
+
+Scripts are sent to the workers in chunks, so small scripts are not dominated
+by the cost of passing them between processes. The workers are reused for
+every chunk, so modules are imported once per worker, and each worker keeps a
+cache of compiled programs, so a script which is run many times is parsed once
+per worker. At most CHUNKS_PER_WORKER chunks per worker are queued at a time,
+so scripts are read from their iterable only as workers become free.
+
+Each script runs as a program, as compiler.execute runs it: it stops at the
+first error, and the result holds the stack at that point. This differs from
+Stack, which reports an error for a line and carries on with the next.
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+from compiler import ERRORS
+from compiler import Program
+from compiler import compile_script
+from compiler import execute
+from fifth import Fifth
+from optimiser import optimise
+
+# The number of scripts sent to a worker at a time
+CHUNK_SIZE = 64
+
+# The most chunks waiting for or running in each worker
+CHUNKS_PER_WORKER = 2
+
+# The number of compiled programs cached by each worker
+PROGRAM_CACHE_SIZE = 1024
+
+
+class ScriptResult(NamedTuple):
+    """The outcome of running a script on an empty stack."""
+    stack: List[int]
+    error: Optional[Exception]
+
+
+@lru_cache(maxsize=PROGRAM_CACHE_SIZE)
+def _compile(script: str) -> Program:
+    program, _ = optimise(compile_script(script))
+    return program
+
+
+def run_script(script: str) -> ScriptResult:
+    """Run a script on an empty stack, stopping at the first error, unlike
+    Stack, which carries on after a line which fails."""
+    fifth = Fifth()
+    try:
+        execute(_compile(script), fifth)
+    except ERRORS as error:
+        return ScriptResult(list(fifth.storage), error)
+    return ScriptResult(list(fifth.storage), None)
+
+
+def _run_chunk(scripts: List[str]) -> List[ScriptResult]:
+    return [run_script(script) for script in scripts]
+
+
+def _chunks(scripts: Iterable[str], chunk_size: int) -> Iterator[List[str]]:
+    scripts = iter(scripts)
+    while chunk := list(islice(scripts, chunk_size)):
+        yield chunk
+
+
+def run_parallel(scripts: Iterable[str], workers: int = None,
+                 chunk_size: int = CHUNK_SIZE) -> Iterator[ScriptResult]:
+    """Run scripts in a pool of processes.
+
+    :param scripts The scripts, each run on an empty stack and stopping at its
+    first error.
+    :param workers The number of processes, the number of CPUs by default.
+    :param chunk_size The number of scripts sent to a process at a time.
+    :return An iterator of the results in the order of the scripts, yielding
+    each result as soon as it and all those before it are complete.
+    """
+    workers = workers or os.cpu_count() or 1
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in _chunks(scripts, chunk_size):
+            if len(pending) == workers * CHUNKS_PER_WORKER:
+                yield from pending.popleft().result()
+            pending.append(executor.submit(_run_chunk, chunk))
+        while pending:
+            yield from pending.popleft().result()
@@ -0,0 +1,185 @@
+"""
+Opt-in profiling of a Stack: counts and times every command executed.
+
+Time is split into parsing a command line, executing the command and rendering
+the output, and the execution time is kept per opcode. Latencies are kept in
+histograms with four significant bits, so percentiles are within about 6%
+and memory use does not grow with the number of commands.
+
+A Stack is only instrumented when it is given a Profiler, by replacing its
+methods on the instance, so an unprofiled Stack runs unchanged. Rendering is
+timed in Stack.render(). Stack.interpret() formats the stack itself rather than
+through render(), so that formatting is not timed.
+"""
+from collections import Counter
+from functools import wraps
+from time import perf_counter_ns
+from typing import Dict, Iterator, Optional
+
+from compiler import ERRORS
+from compiler import OPCODE
+from compiler import MANY_OPCODES
+from compiler import OPCODES
+from compiler import Program
+from compiler import Script
+from compiler import compile_script
+from compiler import execute_each
+
+# A dict mapping opcodes to the command or operator shown in reports
+OPCODE_NAMES = {opcode: command.value for command, opcode in OPCODES.items()}
+OPCODE_NAMES.update({many: f"{OPCODE_NAMES[opcode]}*" for opcode, many in MANY_OPCODES.items()})
+
+
+def _bucket(ns: int) -> int:
+    # Round down to four significant bits
+    shift = max(ns.bit_length() - 4, 0)
+    return ns >> shift << shift
+
+
+class Timings:
+    """The count, total and distribution of a set of durations."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.errors = 0
+        self.histogram = Counter()
+
+    def add(self, ns: int):
+        """Record a duration in nanoseconds."""
+        self.count += 1
+        self.total_ns += ns
+        self.histogram[_bucket(ns)] += 1
+
+    def percentile(self, fraction: float) -> int:
+        """The duration in nanoseconds below which a fraction of the durations fall."""
+        rank = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.histogram):
+            seen += self.histogram[bucket]
+            if seen >= rank:
+                return bucket
+        return 0
+
+
+class Profiler:
+    """Counts and times the commands executed by a Stack."""
+
+    def __init__(self):
+        self.parse = Timings()
+        self.execute = Timings()
+        self.render = Timings()
+        # A dict mapping opcodes to the time taken executing them
+        self.opcodes: Dict[OPCODE, Timings] = {}
+        # Time spent in commands during the current Stack.execute
+        self._inner = 0
+
+    def _opcode(self, opcode: OPCODE) -> Timings:
+        if (timings := self.opcodes.get(opcode)) is None:
+            timings = self.opcodes[opcode] = Timings()
+        return timings
+
+    def _timed(self, opcode: OPCODE, func):
+        timings = self._opcode(opcode)
+
+        @wraps(func)
+        def timed(*args):
+            start = perf_counter_ns()
+            try:
+                return func(*args)
+            except ERRORS:
+                timings.errors += 1
+                raise
+            finally:
+                elapsed = perf_counter_ns() - start
+                timings.add(elapsed)
+                self._inner += elapsed
+        return timed
+
+    def instrument(self, stack):
+        """Profile every command and output line of a Stack."""
+        for table in (stack.command_func, stack.operator_func):
+            for command, func in table.items():
+                table[command] = self._timed(OPCODES[command], func)
+        for command, func in stack.push_many_func.items():
+            stack.push_many_func[command] = self._timed(MANY_OPCODES[OPCODES[command]], func)
+
+        execute = stack.execute
+        render = stack.render
+
+        @wraps(execute)
+        def profiled_execute(command_line: str) -> OPCODE:
+            self._inner = 0
+            rejected = False
+            start = perf_counter_ns()
+            try:
+                return execute(command_line)
+            except ERRORS:
+                # Rejected before a command was executed
+                rejected = not self._inner
+                raise
+            finally:
+                elapsed = perf_counter_ns() - start
+                self.parse.add(elapsed - self._inner)
+                if rejected:
+                    timings = self._opcode(OPCODE.ERROR)
+                    timings.add(elapsed)
+                    timings.errors += 1
+                elif self._inner:
+                    self.execute.add(self._inner)
+
+        @wraps(render)
+        def profiled_render(opcode: OPCODE, operand=None) -> Optional[str]:
+            start = perf_counter_ns()
+            try:
+                return render(opcode, operand)
+            finally:
+                self.render.add(perf_counter_ns() - start)
+
+        stack.execute = profiled_execute
+        stack.render = profiled_render
+
+    def compile_script(self, script: Script) -> Program:
+        """compile_script, timed as parsing."""
+        start = perf_counter_ns()
+        program = compile_script(script)
+        self.parse.add(perf_counter_ns() - start)
+        return program
+
+    def execute_each(self, program: Program, fifth) -> Iterator[Optional[Exception]]:
+        """execute_each, timing each instruction, and the time before the next
+        instruction is asked for as rendering."""
+        start = perf_counter_ns()
+        for opcode, error in zip(program.opcodes, execute_each(program, fifth)):
+            executed = perf_counter_ns()
+            timings = self._opcode(OPCODE(opcode))
+            timings.add(executed - start)
+            self.execute.add(executed - start)
+            if error is not None:
+                timings.errors += 1
+            yield error
+            start = perf_counter_ns()
+            self.render.add(start - executed)
+
+    def report(self) -> str:
+        """A table of the time taken by each phase and each opcode."""
+        header = (f"{'':<10} {'count':>10} {'errors':>8} {'total ms':>10} {'mean us':>9}"
+                  f" {'p50 us':>9} {'p90 us':>9} {'p99 us':>9}")
+        lines = [header]
+
+        def row(name: str, timings: Timings):
+            mean = timings.total_ns / timings.count if timings.count else 0
+            lines.append(f"{name:<10} {timings.count:>10} {timings.errors:>8}"
+                         f" {timings.total_ns / 1e6:>10.3f} {mean / 1e3:>9.3f}"
+                         f" {timings.percentile(0.5) / 1e3:>9.3f}"
+                         f" {timings.percentile(0.9) / 1e3:>9.3f}"
+                         f" {timings.percentile(0.99) / 1e3:>9.3f}")
+
+        row("parse", self.parse)
+        row("execute", self.execute)
+        row("render", self.render)
+        lines.append("")
+        for opcode in sorted(self.opcodes, key=lambda opcode: -self.opcodes[opcode].total_ns):
+            if self.opcodes[opcode].count:
+                row(OPCODE_NAMES.get(opcode, opcode.name), self.opcodes[opcode])
+        return "\n".join(lines)
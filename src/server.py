@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+"""
+An asyncio server for Fifth sessions over TCP or a Unix socket.
+
+Each connection is a session with its own Stack. The protocol is the same as
+Stack.main: the server sends the initial stack, then one line of output for
+each line of input, and the session ends on an empty line or end of input.
+
+Clients may pipeline commands: the server executes the commands which have
+arrived and answers them with one write, and only waits for a client to read
+its output once too much output is buffered. Output is written, and other
+sessions run, after at most COMMANDS_PER_TURN commands or HIGH_WATER bytes of
+output, so one pipelining client does not stall the others. Sessions which are
+idle for too long are closed. Input which is not UTF-8 is answered with an
+error like any other unknown command.
+"""
+import argparse
+import asyncio
+from typing import List, Optional
+
+from fifth import InsufficientStackItemsError
+from fifth import InvalidCommandError
+from fifth import InvalidOperationError
+from stack import OUTPUT
+from stack import Stack
+
+# Seconds a session may wait for a command before it is closed
+IDLE_TIMEOUT = 300.0
+
+# Bytes of output buffered for a client before waiting for it to read
+HIGH_WATER = 64 * 1024
+
+# Commands executed before writing their output and letting other sessions run
+COMMANDS_PER_TURN = 256
+
+# The maximum length of a line of input
+LINE_LIMIT = 64 * 1024
+
+# Bytes of input read at a time
+READ_SIZE = 64 * 1024
+
+# Connections waiting to be accepted
+BACKLOG = 4096
+
+
+class Server:
+    """A Fifth server.
+
+    :param output The output mode of each session.
+    :param idle_timeout Seconds a session may be idle, or None to wait forever.
+    """
+
+    def __init__(self, output: OUTPUT = OUTPUT.FULL,
+                 idle_timeout: Optional[float] = IDLE_TIMEOUT):
+        self.output = OUTPUT(output)
+        self.idle_timeout = idle_timeout
+        self.sessions = 0
+
+    async def start_tcp(self, host: str = None, port: int = 0) -> asyncio.AbstractServer:
+        """Start serving on a TCP port."""
+        return await asyncio.start_server(self.handle, host, port, backlog=BACKLOG)
+
+    async def start_unix(self, path: str) -> asyncio.AbstractServer:
+        """Start serving on a Unix socket."""
+        return await asyncio.start_unix_server(self.handle, path, backlog=BACKLOG)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Run a session for a connection."""
+        self.sessions += 1
+        writer.transport.set_write_buffer_limits(high=HIGH_WATER)
+        stack = Stack(output=self.output)
+        try:
+            await self._session(stack, reader, writer)
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            # Idle, gone away or sent a line that is too long
+            pass
+        finally:
+            self.sessions -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, output: List[str]):
+        """Write lines of output with one write, then let other sessions run."""
+        if output:
+            output.append('')
+            writer.write('\n'.join(output).encode())
+            output.clear()
+        # Waits only if the client is not reading its output
+        await writer.drain()
+        # drain() does not yield while little output is buffered
+        await asyncio.sleep(0)
+
+    async def _session(self, stack: Stack, reader: asyncio.StreamReader,
+                       writer: asyncio.StreamWriter):
+        output = []
+        if (line := stack.render_start()) is not None:
+            output.append(line)
+
+        remainder = b''
+        finished = False
+        while not finished:
+            await self._send(writer, output)
+
+            # Handle every command which has arrived, so pipelined commands
+            # are answered with one write
+            block = await asyncio.wait_for(reader.read(READ_SIZE), self.idle_timeout)
+            if block:
+                lines = (remainder + block).split(b'\n')
+                remainder = lines.pop()
+                if len(remainder) > LINE_LIMIT:
+                    raise ValueError("line too long")
+            else:
+                # End of input, which may follow a last line without a newline
+                lines = [remainder] if remainder else []
+                finished = True
+
+            buffered = 0
+            for count, command_line in enumerate(lines, 1):
+                command_line = command_line.rstrip(b'\r')
+                if not command_line:
+                    finished = True
+                    break
+                try:
+                    # Bytes which are not UTF-8 decode to replacement characters,
+                    # which no command accepts
+                    command = command_line.decode(errors='replace')
+                    line = stack.render(stack.execute(command))
+                except (InvalidCommandError,
+                        InvalidOperationError,
+                        InsufficientStackItemsError) as error:
+                    line = str(error)
+                if line is not None:
+                    output.append(line)
+                    buffered += len(line) + 1
+                if buffered >= HIGH_WATER or not count % COMMANDS_PER_TURN:
+                    await self._send(writer, output)
+                    buffered = 0
+
+        if (line := stack.render_end()) is not None:
+            output.append(line)
+        await self._send(writer, output)
+
+
+async def serve(server: Server, host: str = None, port: int = None, path: str = None):
+    """Serve until cancelled."""
+    if path is not None:
+        listener = await server.start_unix(path)
+    else:
+        listener = await server.start_tcp(host, port)
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    """Runs a Fifth server."""
+    parser = argparse.ArgumentParser(description="A Fifth server.")
+    parser.add_argument("--host", default="127.0.0.1", help="the address to listen on")
+    parser.add_argument("--port", type=int, default=7070, help="the TCP port to listen on")
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead")
+    parser.add_argument("--output", choices=OUTPUT.list(), default=OUTPUT.FULL.value,
+                        help="the output mode of each session")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                        help="seconds before an idle session is closed")
+    args = parser.parse_args()
+
+    server = Server(output=args.output, idle_timeout=args.idle_timeout)
+    try:
+        asyncio.run(serve(server, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -4,29 +4,194 @@
 Stack is a python program which works as a fifth interpreter.
 Each line of input to the program represents a single fifth command.
 
-The result of each command is output to the terminal.
+The result of each command is output to the terminal, or yielded as a Result
+by Stack.interpret_stream().
 """
-import operator
+import io
+import sys
+from enum import unique
+from functools import partial
+from typing import AsyncIterable, AsyncIterator, BinaryIO, Callable, Iterable, Iterator, List, \
+    NamedTuple, Optional
 
+from compiler import OPCODE
+from compiler import COUNT_OPCODES
+from compiler import MANY_OPCODES
+from compiler import OPCODES
+from compiler import Program
+from compiler import compile_script
+from compiler import execute_each
+from fifth import ARITHMETIC
+from fifth import BaseEnum
 from fifth import Fifth
 from fifth import COMMAND
 from fifth import OPERATORS
 from fifth import commands
 from fifth import operators
+from fifth import inclusive_range
 from fifth import InsufficientStackItemsError
 from fifth import InvalidOperationError
+from fifth import InvalidCommandError
+from profiler import Profiler
+from storage import ArrayStorage
+from storage import DEFAULT_STORAGE
+from storage import RenderedStorage
 
 
-class InvalidCommandError(Exception):
-    """For commands that caused an error."""
+@unique
+class OUTPUT(str, BaseEnum):
+    """Output modes."""
+    # The stack after every command
+    FULL = 'full'
+    # The change to the stack made by every command
+    DELTA = 'delta'
+    # The stack after the last command
+    FINAL = 'final'
+    # Errors only
+    QUIET = 'quiet'
+
+
+@unique
+class STATUS(str, BaseEnum):
+    """The outcomes of a command."""
+    OK = 'ok'
+    ERROR = 'error'
+
+
+class Result(NamedTuple):
+    """The outcome of a command run by Stack.interpret_stream()."""
+    status: STATUS
+    # The opcode of the command, or None if it failed
+    opcode: Optional[OPCODE] = None
+    # The class and message of the error, or None if the command succeeded
+    error: Optional[type] = None
+    message: Optional[str] = None
+    # The top of the stack after the command, if asked for and not empty
+    top: Optional[int] = None
+    # The change to the stack as the DELTA output mode renders it, if asked for
+    delta: Optional[str] = None
+
+
+# A dict mapping opcodes to functions describing the change made by a command
+# to the stack, given the stack after the command
+DELTA_FORMAT = {
+    OPCODE.PUSH: lambda fifth: f"+{fifth.peek(-1)}",
+    OPCODE.POP: lambda fifth: "-1",
+    OPCODE.SWAP: lambda fifth: f"-2 +{fifth.peek(-2)} +{fifth.peek(-1)}",
+    OPCODE.DUP: lambda fifth: f"+{fifth.peek(-1)}",
+    OPCODE.REVERSE_PUSH: lambda fifth: f"bottom+{fifth.peek(0)}",
+    OPCODE.REVERSE_POP: lambda fifth: "bottom-1",
+    OPCODE.REVERSE_SWAP: lambda fifth: f"bottom-2 bottom+{fifth.peek(1)} bottom+{fifth.peek(0)}",
+    OPCODE.REVERSE_DUP: lambda fifth: f"bottom+{fifth.peek(0)}",
+    OPCODE.ADD: lambda fifth: f"-2 +{fifth.peek(-1)}",
+    OPCODE.SUBTRACT: lambda fifth: f"-2 +{fifth.peek(-1)}",
+    OPCODE.MULTIPLY: lambda fifth: f"-2 +{fifth.peek(-1)}",
+    OPCODE.DIVIDE: lambda fifth: f"-2 +{fifth.peek(-1)}",
+    OPCODE.REVERSE_ADD: lambda fifth: f"bottom-2 bottom+{fifth.peek(0)}",
+    OPCODE.REVERSE_SUBTRACT: lambda fifth: f"bottom-2 bottom+{fifth.peek(0)}",
+    OPCODE.REVERSE_MULTIPLY: lambda fifth: f"bottom-2 bottom+{fifth.peek(0)}",
+    OPCODE.REVERSE_DIVIDE: lambda fifth: f"bottom-2 bottom+{fifth.peek(0)}",
+}
+
+
+def _pushed(fifth: Fifth, count: int) -> str:
+    return " ".join(f"+{fifth.peek(index)}" for index in range(-count, 0))
+
+
+def _reverse_pushed(fifth: Fifth, count: int) -> str:
+    return " ".join(f"bottom+{fifth.peek(index)}" for index in reversed(range(count)))
+
+
+# A dict mapping the opcodes of bulk commands to functions describing the change
+# made to the stack, given the stack after the command and the operand
+BULK_DELTA_FORMAT = {
+    OPCODE.PUSH_MANY: lambda fifth, numbers: _pushed(fifth, len(numbers)),
+    OPCODE.REVERSE_PUSH_MANY: lambda fifth, numbers: _reverse_pushed(fifth, len(numbers)),
+    OPCODE.PUSH_RANGE: lambda fifth, numbers: _pushed(fifth, len(numbers)),
+    OPCODE.DROPN: lambda fifth, count: f"-{count}",
+    OPCODE.DUPN: _pushed,
+    OPCODE.SUM: lambda fifth, count: f"-{count} +{fifth.peek(-1)}",
+    OPCODE.PRODUCT: lambda fifth, count: f"-{count} +{fifth.peek(-1)}",
+    OPCODE.REVERSE_SUM: lambda fifth, count: f"bottom-{count} bottom+{fifth.peek(0)}",
+    OPCODE.REVERSE_PRODUCT: lambda fifth, count: f"bottom-{count} bottom+{fifth.peek(0)}",
+}
+
+
+# The number of bytes read at a time in batch mode
+BLOCK_SIZE = 1 << 20
+
+# The most output lines buffered before they are written in batch mode
+OUTPUT_LINES = 1 << 16
+
+
+def read_lines(infile: BinaryIO, block_size: int = BLOCK_SIZE) -> Iterator[List[bytes]]:
+    """Read a binary file in blocks, yielding the complete lines in each block.
+
+    Like stdin in text mode, \\r\\n and \\r are read as line endings.
+    """
+    remainder = b''
+    while block := infile.read(block_size):
+        data = remainder + block
+        # A trailing \r may be the start of a \r\n split across blocks
+        held = b'\r' if data.endswith(b'\r') else b''
+        if held:
+            data = data[:-1]
+        if b'\r' in data:
+            data = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+        lines = data.split(b'\n')
+        remainder = lines.pop() + held
+        yield lines
+    if remainder:
+        yield [remainder.rstrip(b'\r')]
+
+
+def default_storage(arithmetic: ARITHMETIC = ARITHMETIC.BIGINT):
+    """The storage backend of a Stack in an arithmetic mode."""
+    if ARITHMETIC(arithmetic) == ARITHMETIC.BIGINT:
+        return DEFAULT_STORAGE
+    return ArrayStorage
+
+
+def rendered_storage(arithmetic: ARITHMETIC = ARITHMETIC.BIGINT):
+    """The default storage backend of an arithmetic mode, in a RenderedStorage."""
+    return partial(RenderedStorage, storage=default_storage(arithmetic))
+
+
+def read_script_lines(infile: BinaryIO, block_size: int = BLOCK_SIZE) -> Iterator[List[bytes]]:
+    """Read the lines of a script from a binary file in blocks, as read_lines(),
+    stopping like main() at the first empty line."""
+    for lines in read_lines(infile, block_size):
+        try:
+            end = lines.index(b'')
+        except ValueError:
+            yield lines
+        else:
+            yield lines[:end]
+            return
 
 
 class Stack:
     """An interpreter for the Fifth stack-based language.
+
+    :param output The output mode.
+    :param profiler A Profiler to count and time every command, or None.
+    :param arithmetic The arithmetic mode. In the fixed width modes the stack is
+    held in compact storage by default.
+    :param storage The storage backend of the stack, or None for the default of
+    the arithmetic mode. For the FULL output mode of large stacks,
+    rendered_storage(arithmetic) keeps the string of the stack up to date, so
+    rendering it after a command costs the chunks the command changed.
     """
 
-    def __init__(self):
-        self.fifth = Fifth()
+    def __init__(self, output: OUTPUT = OUTPUT.FULL, profiler: Profiler = None,
+                 arithmetic: ARITHMETIC = ARITHMETIC.BIGINT,
+                 storage: Callable[[Iterable[int]], object] = None):
+        arithmetic = ARITHMETIC(arithmetic)
+        self.output = OUTPUT(output)
+        if storage is None:
+            storage = default_storage(arithmetic)
+        self.fifth = Fifth(storage=storage, arithmetic=arithmetic)
+        self.profiler = profiler
 
         # A dict mapping input commands to functions
         self.command_func = {
@@ -39,20 +204,40 @@ class Stack:
             COMMAND.REVERSE_POP: self.fifth.reverse_pop,
             COMMAND.REVERSE_SWAP: self.fifth.reverse_swap,
             COMMAND.REVERSE_DUP: self.fifth.reverse_dup,
+            #
+            COMMAND.PUSH_RANGE: self.fifth.push_range,
+            COMMAND.DROPN: self.fifth.drop,
+            COMMAND.DUPN: self.fifth.dup_many,
+            COMMAND.SUM: self.fifth.sum,
+            COMMAND.PRODUCT: self.fifth.product,
+            COMMAND.REVERSE_SUM: self.fifth.reverse_sum,
+            COMMAND.REVERSE_PRODUCT: self.fifth.reverse_product,
         }
 
+        # A dict mapping the push commands to functions pushing many integers
+        self.push_many_func = {
+            COMMAND.PUSH: self.fifth.push_many,
+            COMMAND.REVERSE_PUSH: self.fifth.reverse_push_many,
+        }
+
+        # The operand of the last command executed, for render()
+        self.operand = None
+
         # A dict mapping input operators to functions
         self.operator_func = {
-            OPERATORS.ADD: operator.add,
-            OPERATORS.SUBTRACT: operator.sub,
-            OPERATORS.MULTIPLY: operator.mul,
-            OPERATORS.DIVIDE: operator.floordiv,
+            OPERATORS.ADD: self.fifth.add,
+            OPERATORS.SUBTRACT: self.fifth.subtract,
+            OPERATORS.MULTIPLY: self.fifth.multiply,
+            OPERATORS.DIVIDE: self.fifth.floordiv,
             OPERATORS.REVERSE_ADD: self.fifth.reverse_add,
             OPERATORS.REVERSE_SUBTRACT: self.fifth.reverse_subtract,
             OPERATORS.REVERSE_MULTIPLY: self.fifth.reverse_multiply,
             OPERATORS.REVERSE_DIVIDE: self.fifth.reverse_floordiv,
         }
 
+        if profiler is not None:
+            profiler.instrument(self)
+
     def __str__(self):
         return str(self.fifth)
 
@@ -65,73 +250,182 @@ class Stack:
             if required_args != 1:
                 raise InvalidCommandError(f"ERROR: expected {required_args} arguments.")
 
+    @staticmethod
+    def __validate_integer_args(cmd: list):
+        if not all(map(str.isdigit, cmd)):
+            raise InvalidCommandError("ERROR: an integer argument expected.")
+
     def interpret(self, command_line: str) -> str:
         """Interprets the Fifth commands and operators.
 
         :param command_line The command line input.
+        :return The stack after the command.
         :raises InvalidCommandError If a command cannot be performed.
         :raises InvalidOperationError If an operation cannot be performed.
         """
-        if not command_line:
-            raise InvalidCommandError("ERROR: no command specified.")
+        self.execute(command_line)
+        return str(self.fifth)
+
+    def execute(self, command_line: str) -> OPCODE:
+        """Executes the Fifth commands and operators without rendering the stack.
 
+        :param command_line The command line input.
+        :return The opcode of the command.
+        :raises InvalidCommandError If a command cannot be performed.
+        :raises InvalidOperationError If an operation cannot be performed.
+        """
         command_line_split = command_line.split()
+        if not command_line_split:
+            raise InvalidCommandError("ERROR: no command specified.")
+
         command = command_line_split[0]
 
         if command not in commands and command not in operators:
             raise InvalidCommandError("ERROR: unknown command/operator.")
 
+        opcode = OPCODES[command]
+        self.operand = None
         if command in commands:
             cmd_func = self.command_func.get(command)
             # Handle any specific arguments to functions
             command_args = command_line_split[1:]
             if command in (COMMAND.PUSH, COMMAND.REVERSE_PUSH):
+                if not command_args:
+                    raise InvalidCommandError("ERROR: expected 1 argument.")
+                self.__validate_integer_args(command_args)
+                if len(command_args) == 1:
+                    cmd_func(int(command_args[0]))
+                else:
+                    self.operand = tuple(map(int, command_args))
+                    self.push_many_func[command](self.operand)
+                    opcode = MANY_OPCODES[opcode]
+            elif command == COMMAND.PUSH_RANGE:
+                self.__validate_command_args_count(command_args, 2)
+                self.__validate_integer_args(command_args)
+                start, stop = map(int, command_args)
+                self.operand = inclusive_range(start, stop)
+                cmd_func(start, stop)
+            elif opcode in COUNT_OPCODES:
                 self.__validate_command_args_count(command_args, 1)
-                first_argument = command_line_split.pop()
-                if not first_argument.isdigit():
-                    raise InvalidCommandError("ERROR: an integer argument expected.")
-                cmd_func(int(first_argument))
+                self.__validate_integer_args(command_args)
+                self.operand = int(command_args[0])
+                cmd_func(self.operand)
             else:
                 self.__validate_command_args_count(command_args, 0)
                 cmd_func()
         else:
-            # Arithmetic Operators
-            if command.startswith('r'):
-                # Reverse Arithmetic operators
-                op_func = self.operator_func.get(command)
-                op_func()
-            else:
-                first_operand = self.fifth.pop()
-                try:
-                    # The second item from the top of the stack acts as
-                    # the summend or multiplier or dividend or minuend
-                    second_operand = self.fifth.pop()
-                except InsufficientStackItemsError as error:
-                    # reset the stack to its original state
-                    self.fifth.push(first_operand)
-                    raise error
-
-                if command == OPERATORS.DIVIDE and first_operand == 0:
-                    # reset the stack to its original state
-                    self.fifth.push(second_operand)
-                    self.fifth.push(first_operand)
-                    raise InvalidOperationError("ERROR: cannot divide by zero.")
-
-                op_func = self.operator_func.get(command)
-                # The order of operands affects division and subtraction arithmetic
-                result = op_func(second_operand, first_operand)
-                self.fifth.push(result)
+            # Arithmetic Operators, which leave the stack unchanged if they fail
+            op_func = self.operator_func.get(command)
+            op_func()
 
-        return str(self.fifth)
+        return opcode
+
+    def result(self, command_line: str, top: bool = False, delta: bool = False) -> Result:
+        """Executes the Fifth commands and operators, describing the outcome
+        without rendering the stack.
+
+        :param command_line The command line input.
+        :param top Give the top of the stack after the command.
+        :param delta Render the change to the stack made by the command.
+        """
+        try:
+            opcode = self.execute(command_line)
+        except (InvalidCommandError,
+                InvalidOperationError,
+                InsufficientStackItemsError) as error:
+            return Result(STATUS.ERROR, error=type(error), message=str(error))
+        return Result(STATUS.OK, opcode,
+                      top=self.fifth.peek(-1) if top and self.fifth.size() else None,
+                      delta=self.render_delta(opcode) if delta else None)
+
+    def interpret_stream(self, command_lines: Iterable[str], top: bool = False,
+                         delta: bool = False) -> Iterator[Result]:
+        """Interprets a stream of Fifth commands and operators, yielding the
+        outcome of each. A command is read only when the result of the one
+        before has been taken, so any number run in constant memory.
+
+        Unlike main(), an empty line is an error rather than the end of input.
+
+        :param command_lines The command line inputs.
+        :param top Give the top of the stack after each command.
+        :param delta Render the change to the stack made by each command.
+        """
+        for command_line in command_lines:
+            yield self.result(command_line, top, delta)
+
+    async def interpret_async_stream(self, command_lines: AsyncIterable[str], top: bool = False,
+                                     delta: bool = False) -> AsyncIterator[Result]:
+        """As interpret_stream(), for an asynchronous stream of commands."""
+        async for command_line in command_lines:
+            yield self.result(command_line, top, delta)
+
+    def execute_atomic(self, command_lines: Iterable[str]):
+        """Executes many Fifth commands and operators as one: if any fails, the
+        stack is left as it was before the first.
+
+        :param command_lines The command line inputs.
+        :raises InvalidCommandError If a command cannot be performed.
+        :raises InvalidOperationError If an operation cannot be performed.
+        """
+        with self.fifth.transaction():
+            for command_line in command_lines:
+                self.execute(command_line)
+
+    def render(self, opcode: OPCODE, operand=None) -> Optional[str]:
+        """Renders the output line for a successful command in the output mode.
+
+        :param operand The operand of the command, that of the last command
+        executed by default.
+        :return The line, or None if nothing is output in the output mode.
+        """
+        if self.output == OUTPUT.FULL:
+            return f"stack is {self.fifth}"
+        if self.output == OUTPUT.DELTA:
+            return self.render_delta(opcode, operand)
+        return None
+
+    def render_delta(self, opcode: OPCODE, operand=None) -> str:
+        """Renders the change to the stack made by a successful command.
+
+        :param operand The operand of the command, that of the last command
+        executed by default.
+        """
+        if opcode in BULK_DELTA_FORMAT:
+            return BULK_DELTA_FORMAT[opcode](self.fifth,
+                                             self.operand if operand is None else operand)
+        return DELTA_FORMAT[opcode](self.fifth)
+
+    def render_start(self) -> Optional[str]:
+        """Renders the output line before the first command in the output mode."""
+        if self.output in (OUTPUT.FULL, OUTPUT.DELTA):
+            return str(self)
+        return None
+
+    def render_end(self) -> Optional[str]:
+        """Renders the output line after the last command in the output mode."""
+        if self.output == OUTPUT.FINAL:
+            return f"stack is {self}"
+        return None
+
+    def write_end(self, write: Callable[[str], object]):
+        """Writes the output line after the last command in the output mode, as
+        render_end() renders it, a piece at a time so a large stack is streamed."""
+        if self.output == OUTPUT.FINAL:
+            write("stack is ")
+            for piece in self.fifth.render():
+                write(piece)
+            write("\n")
 
     def main(self):
         """Reads in supported commands and operators from stdin until EOF."""
-        print(str(self))
+        if (line := self.render_start()) is not None:
+            print(line)
 
         try:
             while command_line := input():
                 try:
-                    print(f"stack is {self.interpret(command_line)}")
+                    if (line := self.render(self.execute(command_line))) is not None:
+                        print(line)
                 except (InvalidCommandError,
                         InvalidOperationError,
                         InsufficientStackItemsError) as error:
@@ -139,6 +433,100 @@ class Stack:
         except EOFError:
             pass
 
+        self.write_end(sys.stdout.write)
+
+    def run_file(self, infile: BinaryIO = None, outfile: BinaryIO = None):
+        """Batch mode: runs the commands and operators in a binary file until EOF.
+
+        Input is read, compiled and executed in large blocks and the results of
+        each block are written with a single write. The output is identical
+        to main().
+
+        :param infile The binary file to read, stdin by default.
+        :param outfile The binary file to write, stdout by default.
+        """
+        if infile is None:
+            infile = sys.stdin.buffer
+        if outfile is None:
+            sys.stdout.flush()
+            outfile = sys.stdout.buffer
+
+        if self.profiler is None:
+            compile_ = compile_script
+        else:
+            compile_ = self.profiler.compile_script
+        if (line := self.render_start()) is not None:
+            outfile.write(f"{line}\n".encode())
+        for lines in read_script_lines(infile):
+            self._write_results(compile_(line.decode() for line in lines), outfile)
+
+        self.write_end(lambda piece: outfile.write(piece.encode()))
+        outfile.flush()
+
+    def run_program(self, program: Program, outfile: BinaryIO = None):
+        """Batch mode for a compiled script: runs a program, writing the output
+        run_file() would write for the script.
+
+        :param outfile The binary file to write, stdout by default.
+        """
+        if outfile is None:
+            sys.stdout.flush()
+            outfile = sys.stdout.buffer
+
+        if (line := self.render_start()) is not None:
+            outfile.write(f"{line}\n".encode())
+        self._write_results(program, outfile)
+        self.write_end(lambda piece: outfile.write(piece.encode()))
+        outfile.flush()
+
+    def _write_results(self, program: Program, outfile: BinaryIO):
+        """Execute a program, writing the output of its instructions in blocks."""
+        fifth = self.fifth
+        render = self.render
+        if self.profiler is None:
+            execute_each_ = execute_each
+        else:
+            execute_each_ = self.profiler.execute_each
+            # The profiled execute_each times rendering between instructions
+            render = partial(type(self).render, self)
+
+        output = []
+        append = output.append
+
+        def flush():
+            output.append('')
+            outfile.write('\n'.join(output).encode())
+            output.clear()
+
+        results = execute_each_(program, fifth)
+        if self.output == OUTPUT.FULL:
+            for error in results:
+                append(f"stack is {fifth}" if error is None else str(error))
+                if len(output) == OUTPUT_LINES:
+                    flush()
+        elif self.output == OUTPUT.DELTA:
+            for (opcode, operand), error in zip(program.instructions(), results):
+                append(render(opcode, operand) if error is None else str(error))
+                if len(output) == OUTPUT_LINES:
+                    flush()
+        else:
+            for error in results:
+                if error is not None:
+                    append(str(error))
+                    if len(output) == OUTPUT_LINES:
+                        flush()
+        if output:
+            flush()
+
+    def run_script(self, script: str) -> str:
+        """Batch mode: runs the commands and operators in a script.
+
+        :return The output main() would give for the script.
+        """
+        outfile = io.BytesIO()
+        self.run_file(io.BytesIO(script.encode()), outfile)
+        return outfile.getvalue().decode()
+
 
 if __name__ == "__main__":
     app = Stack()
@@ -0,0 +1,656 @@
+"""
+Storage backends for the Fifth stack.
+
+A storage backend is a double-ended sequence of integers. Fifth only ever
+touches the two ends of its stack, so a backend must support:
+
+append(x) / pop() - push and pop at the top of the stack
+appendleft(x) / popleft() - push and pop at the bottom of the stack
+extend(iterable) - push many values at the top of the stack
+drop(n) - remove the top n values of the stack
+s[i] / s[i] = x - read and write items near either end
+len(s), iter(s) - size and bottom-to-top iteration
+reversed(s) - top-to-bottom iteration
+
+A backend which keeps its own string, such as RenderedStorage, also has
+render(), yielding the string of the stack in pieces, and str() of it is the
+whole string.
+
+DequeStorage, a deque, is the default backend. ArrayStorage holds machine
+integers for a fraction of the memory. PersistentStorage shares structure
+between copies, so copying it is O(1). RenderedStorage wraps another backend,
+keeping the string of the stack up to date as it changes. The file-backed
+backends, MmapStorage and SpillStorage, are in filestorage.py.
+"""
+
+import copy
+from array import array
+from collections import deque
+from itertools import chain, islice, repeat, starmap
+from typing import Iterable, Iterator, List
+
+
+class ListStorage(list):
+    """A list backed storage.
+
+    Top operations are O(1), bottom operations are O(n).
+    """
+
+    def appendleft(self, number: int):
+        """Push an integer onto the bottom of the stack."""
+        self.insert(0, number)
+
+    def popleft(self) -> int:
+        """Remove the bottom element of the stack."""
+        return self.pop(0)
+
+    def drop(self, count: int):
+        """Remove the top count elements of the stack."""
+        del self[len(self) - count:]
+
+
+class DequeStorage(deque):
+    """A deque backed storage.
+
+    Both top and bottom operations are O(1).
+    """
+
+    def drop(self, count: int):
+        """Remove the top count elements of the stack."""
+        # A deque cannot delete a slice, so consume count calls to pop() in C
+        deque(starmap(self.pop, repeat((), count)), maxlen=0)
+
+
+# The storage of a new Fifth, named as the module's other constants are
+DEFAULT_STORAGE = DequeStorage  # pylint: disable=invalid-name
+
+
+def check_index(index: int, size: int) -> int:
+    """The index from the bottom of an item of a stack of size items, given its
+    index from the bottom, or from the top if negative.
+
+    :raises IndexError If there is no such item.
+    """
+    if index < 0:
+        index += size
+    if not 0 <= index < size:
+        raise IndexError("storage index out of range")
+    return index
+
+
+class ArrayStorage:
+    """A compact storage of 64-bit machine integers.
+
+    The stack is held as two arrays growing away from each other: the bottom
+    half reversed, and the top half. Both top and bottom operations are
+    amortised O(1). When a value does not fit in 64 bits the arrays are promoted
+    to lists, so arbitrary precision is kept at the usual memory cost.
+    """
+    __slots__ = ('_bottom', '_top')
+
+    TYPECODE = 'q'
+
+    def __init__(self, data: Iterable[int] = ()):
+        self._bottom = array(self.TYPECODE)
+        self._top = array(self.TYPECODE)
+        self.extend(data)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({list(self)})"
+
+    def __copy__(self):
+        storage = ArrayStorage.__new__(ArrayStorage)
+        storage._bottom = self._bottom[:]
+        storage._top = self._top[:]
+        return storage
+
+    def __len__(self):
+        return len(self._bottom) + len(self._top)
+
+    def __iter__(self) -> Iterator[int]:
+        return chain(reversed(self._bottom), self._top)
+
+    def __reversed__(self) -> Iterator[int]:
+        return chain(reversed(self._top), self._bottom)
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + self._bottom.__sizeof__() + self._top.__sizeof__()
+
+    @property
+    def compact(self) -> bool:
+        """Whether the values are still held as machine integers."""
+        return isinstance(self._top, array)
+
+    def _promote(self):
+        self._bottom = list(self._bottom)
+        self._top = list(self._top)
+
+    def _locate(self, index: int):
+        index = check_index(index, len(self))
+        bottom_size = len(self._bottom)
+        if index < bottom_size:
+            return self._bottom, bottom_size - 1 - index
+        return self._top, index - bottom_size
+
+    def __getitem__(self, index: int) -> int:
+        values, index = self._locate(index)
+        return values[index]
+
+    def __setitem__(self, index: int, number: int):
+        values, position = self._locate(index)
+        try:
+            values[position] = number
+        except OverflowError:
+            self._promote()
+            self[index] = number
+
+    def append(self, number: int):
+        """Push an integer onto the top of the stack."""
+        try:
+            self._top.append(number)
+        except OverflowError:
+            self._promote()
+            self._top.append(number)
+
+    def appendleft(self, number: int):
+        """Push an integer onto the bottom of the stack."""
+        try:
+            self._bottom.append(number)
+        except OverflowError:
+            self._promote()
+            self._bottom.append(number)
+
+    def extend(self, numbers: Iterable[int]):
+        """Push integers onto the top of the stack."""
+        if not isinstance(numbers, (list, tuple, array)):
+            numbers = list(numbers)
+        size = len(self._top)
+        try:
+            self._top.extend(numbers)
+        except OverflowError:
+            del self._top[size:]
+            self._promote()
+            self._top.extend(numbers)
+
+    def pop(self) -> int:
+        """Remove the top element of the stack."""
+        if not self._top:
+            if not self._bottom:
+                raise IndexError("pop from an empty storage")
+            # Move the upper half of the bottom to the top
+            half = (len(self._bottom) + 1) // 2
+            self._top = self._bottom[half - 1::-1]
+            del self._bottom[:half]
+        return self._top.pop()
+
+    def popleft(self) -> int:
+        """Remove the bottom element of the stack."""
+        if not self._bottom:
+            if not self._top:
+                raise IndexError("pop from an empty storage")
+            # Move the lower half of the top to the bottom
+            half = (len(self._top) + 1) // 2
+            self._bottom = self._top[half - 1::-1]
+            del self._top[:half]
+        return self._bottom.pop()
+
+    def drop(self, count: int):
+        """Remove the top count elements of the stack."""
+        from_bottom = count - len(self._top)
+        if from_bottom > 0:
+            del self._top[:]
+            del self._bottom[:from_bottom]
+        else:
+            del self._top[len(self._top) - count:]
+
+    def clear(self):
+        """Remove all the elements of the stack."""
+        del self._bottom[:]
+        del self._top[:]
+
+
+# A finger tree is None when empty, (item,) for a single item, or a
+# (prefix, middle, suffix) triple. The prefix and suffix are tuples of 1 to 4
+# items, and middle is a finger tree whose items are nodes: tuples of 2 or 3
+# items one level down. The items of the outermost tree are the values.
+
+def _push_left(tree, item):
+    if tree is None:
+        return (item,)
+    if len(tree) == 1:
+        return (item,), None, tree
+    prefix, middle, suffix = tree
+    if len(prefix) == 4:
+        return (item, prefix[0]), _push_left(middle, prefix[1:]), suffix
+    return (item,) + prefix, middle, suffix
+
+
+def _push_right(tree, item):
+    if tree is None:
+        return (item,)
+    if len(tree) == 1:
+        return tree, None, (item,)
+    prefix, middle, suffix = tree
+    if len(suffix) == 4:
+        return prefix, _push_right(middle, suffix[:3]), (suffix[3], item)
+    return prefix, middle, suffix + (item,)
+
+
+def _pop_left(tree):
+    """The leftmost item of a non-empty finger tree, and the rest of the tree."""
+    if len(tree) == 1:
+        return tree[0], None
+    prefix, middle, suffix = tree
+    if len(prefix) > 1:
+        return prefix[0], (prefix[1:], middle, suffix)
+    if middle is not None:
+        # A node of the middle becomes the prefix
+        node, middle = _pop_left(middle)
+        return prefix[0], (node, middle, suffix)
+    if len(suffix) == 1:
+        return prefix[0], suffix
+    return prefix[0], (suffix[:1], None, suffix[1:])
+
+
+def _pop_right(tree):
+    """The rightmost item of a non-empty finger tree, and the rest of the tree."""
+    if len(tree) == 1:
+        return tree[0], None
+    prefix, middle, suffix = tree
+    if len(suffix) > 1:
+        return suffix[-1], (prefix, middle, suffix[:-1])
+    if middle is not None:
+        node, middle = _pop_right(middle)
+        return suffix[0], (prefix, middle, node)
+    if len(prefix) == 1:
+        return suffix[0], prefix
+    return suffix[0], (prefix[:-1], None, prefix[-1:])
+
+
+def _build(items: list):
+    """A finger tree of items, in O(n)."""
+    size = len(items)
+    if size == 0:
+        return None
+    if size == 1:
+        return (items[0],)
+    if size <= 8:
+        half = size // 2
+        return tuple(items[:half]), None, tuple(items[half:])
+    inner = items[3:-3]
+    # Group the inner items into nodes of 3, with up to two nodes of 2 at the end
+    threes = len(inner) - 2 * (-len(inner) % 3)
+    nodes = list(zip(inner[0:threes:3], inner[1:threes:3], inner[2:threes:3]))
+    nodes.extend(zip(inner[threes::2], inner[threes + 1::2]))
+    return tuple(items[:3]), _build(nodes), tuple(items[-3:])
+
+
+def _flatten(items, depth: int, values: list):
+    """Append the values in items, nested depth levels down, to values."""
+    if depth:
+        for node in items:
+            _flatten(node, depth - 1, values)
+    else:
+        values.extend(items)
+
+
+def _spine(tree) -> List[tuple]:
+    """The (prefix, suffix) of each level of a finger tree, outermost first."""
+    levels = []
+    while tree is not None:
+        if len(tree) == 1:
+            levels.append((tree, ()))
+            break
+        prefix, tree, suffix = tree
+        levels.append((prefix, suffix))
+    return levels
+
+
+def _values(tree) -> Iterator[int]:
+    """The values of a finger tree from left to right, flattening one item at a time."""
+    levels = _spine(tree)
+    for depth, (prefix, _) in enumerate(levels):
+        for item in prefix:
+            values = []
+            _flatten((item,), depth, values)
+            yield from values
+    for depth in range(len(levels) - 1, -1, -1):
+        for item in levels[depth][1]:
+            values = []
+            _flatten((item,), depth, values)
+            yield from values
+
+
+def _values_reversed(tree) -> Iterator[int]:
+    """The values of a finger tree from right to left, flattening one item at a time."""
+    levels = _spine(tree)
+    for depth, (_, suffix) in enumerate(levels):
+        for item in reversed(suffix):
+            values = []
+            _flatten((item,), depth, values)
+            yield from reversed(values)
+    for depth in range(len(levels) - 1, -1, -1):
+        for item in reversed(levels[depth][0]):
+            values = []
+            _flatten((item,), depth, values)
+            yield from reversed(values)
+
+
+class PersistentStorage:
+    """A persistent storage whose copies share structure.
+
+    The stack is held as an immutable finger tree, with the bottom of the stack
+    on the left. An operation builds new nodes rather than changing old ones, so
+    copy.copy() is O(1) and a copy shares every node with the original until
+    either changes.
+
+    Operations at either end are amortised O(1) and O(log n) at worst, however
+    many copies share the tree, so exploring many forks of a large stack stays
+    cheap. Reading or writing an item costs its distance from the nearer end.
+    """
+    __slots__ = ('_tree', '_size')
+
+    def __init__(self, data: Iterable[int] = ()):
+        self._tree = None
+        self._size = 0
+        self.extend(data)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({list(self)})"
+
+    def __copy__(self):
+        storage = PersistentStorage.__new__(PersistentStorage)
+        storage._tree, storage._size = self._tree, self._size
+        return storage
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self) -> Iterator[int]:
+        return _values(self._tree)
+
+    def __reversed__(self) -> Iterator[int]:
+        return _values_reversed(self._tree)
+
+    def _locate(self, index: int):
+        """Whether an item is nearer the top, and its distance from that end."""
+        index = check_index(index, self._size)
+        depth = self._size - 1 - index
+        if depth <= index:
+            return True, depth
+        return False, index
+
+    def __getitem__(self, index: int) -> int:
+        from_top, distance = self._locate(index)
+        values = reversed(self) if from_top else iter(self)
+        return next(islice(values, distance, None))
+
+    def __setitem__(self, index: int, number: int):
+        from_top, distance = self._locate(index)
+        pop, push = (_pop_right, _push_right) if from_top else (_pop_left, _push_left)
+        tree = self._tree
+        above = []
+        for _ in range(distance):
+            value, tree = pop(tree)
+            above.append(value)
+        _, tree = pop(tree)
+        tree = push(tree, number)
+        for value in reversed(above):
+            tree = push(tree, value)
+        self._tree = tree
+
+    def append(self, number: int):
+        """Push an integer onto the top of the stack."""
+        self._tree = _push_right(self._tree, number)
+        self._size += 1
+
+    def appendleft(self, number: int):
+        """Push an integer onto the bottom of the stack."""
+        self._tree = _push_left(self._tree, number)
+        self._size += 1
+
+    def extend(self, numbers: Iterable[int]):
+        """Push integers onto the top of the stack."""
+        if self._tree is None:
+            numbers = list(numbers)
+            self._tree, self._size = _build(numbers), len(numbers)
+            return
+        tree, size = self._tree, self._size
+        for number in numbers:
+            tree = _push_right(tree, number)
+            size += 1
+        self._tree, self._size = tree, size
+
+    def pop(self) -> int:
+        """Remove the top element of the stack."""
+        if self._tree is None:
+            raise IndexError("pop from an empty storage")
+        number, self._tree = _pop_right(self._tree)
+        self._size -= 1
+        return number
+
+    def popleft(self) -> int:
+        """Remove the bottom element of the stack."""
+        if self._tree is None:
+            raise IndexError("pop from an empty storage")
+        number, self._tree = _pop_left(self._tree)
+        self._size -= 1
+        return number
+
+    def drop(self, count: int):
+        """Remove the top count elements of the stack."""
+        kept = self._size - count
+        if kept < count:
+            # Cheaper to rebuild from the values kept
+            values = list(islice(self, kept))
+            self._tree, self._size = _build(values), kept
+            return
+        tree = self._tree
+        for _ in range(count):
+            _, tree = _pop_right(tree)
+        self._tree, self._size = tree, kept
+
+    def clear(self):
+        """Remove all the elements of the stack."""
+        self._tree = None
+        self._size = 0
+
+
+class _Chunk:
+    """A run of the reprs of adjacent values, and their joined text once rendered."""
+    __slots__ = ('reprs', 'text')
+
+    def __init__(self, reprs: List[str], text: str = None):
+        self.reprs = reprs
+        self.text = text
+
+    def __copy__(self):
+        return _Chunk(self.reprs[:], self.text)
+
+
+class RenderedStorage:
+    """A storage which keeps the string of the stack, as str(list(storage))
+    returns it, up to date as the stack changes.
+
+    The values are held in another storage, and the repr of each value in
+    chunks of at most chunk reprs, each with its joined text cached until it
+    changes. Pushing and popping at either end only changes the chunk at that
+    end, so rendering the stack after an operation at an end renders at most
+    two chunks and joins the cached texts of the rest, rather than every value.
+
+    :param data Values to push onto the top of the stack.
+    :param storage The storage holding the values.
+    :param chunk The most reprs in a chunk.
+    """
+    __slots__ = ('_storage', '_chunks', '_chunk', '_text')
+
+    CHUNK = 256
+
+    def __init__(self, data: Iterable[int] = (), storage=DEFAULT_STORAGE, chunk: int = CHUNK):
+        self._storage = storage(())
+        self._chunks: deque = deque()
+        self._chunk = chunk
+        # The string of the stack, or None if it has changed since rendered
+        self._text = None
+        self.extend(data)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self._storage!r})"
+
+    def __copy__(self):
+        storage = RenderedStorage.__new__(RenderedStorage)
+        storage._storage = copy.copy(self._storage)
+        storage._chunks = deque(map(copy.copy, self._chunks))
+        storage._chunk = self._chunk
+        storage._text = self._text
+        return storage
+
+    def __len__(self):
+        return len(self._storage)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._storage)
+
+    def __reversed__(self) -> Iterator[int]:
+        return reversed(self._storage)
+
+    @property
+    def storage(self):
+        """The storage holding the values."""
+        return self._storage
+
+    @property
+    def compact(self) -> bool:
+        """Whether the values are held as machine integers."""
+        return getattr(self._storage, 'compact', False)
+
+    def _texts(self) -> List[str]:
+        texts = []
+        for chunk in self._chunks:
+            if chunk.text is None:
+                chunk.text = ', '.join(chunk.reprs)
+            texts.append(chunk.text)
+        return texts
+
+    def render(self) -> Iterator[str]:
+        """The string of the stack in pieces, each the text of a chunk."""
+        yield '['
+        separator = ''
+        for text in self._texts():
+            yield separator + text
+            separator = ', '
+        yield ']'
+
+    def __str__(self):
+        if self._text is None:
+            self._text = f"[{', '.join(self._texts())}]"
+        return self._text
+
+    def _locate(self, index: int):
+        """The chunk holding an item, and the index of the item in it, searching
+        from the nearer end of the stack."""
+        size = len(self._storage)
+        index = check_index(index, size)
+        if index < size // 2:
+            for chunk in self._chunks:
+                if index < len(chunk.reprs):
+                    return chunk, index
+                index -= len(chunk.reprs)
+        depth = size - 1 - index
+        for chunk in reversed(self._chunks):
+            if depth < len(chunk.reprs):
+                return chunk, len(chunk.reprs) - 1 - depth
+            depth -= len(chunk.reprs)
+        raise IndexError("storage index out of range")
+
+    def __getitem__(self, index: int) -> int:
+        return self._storage[index]
+
+    def __setitem__(self, index: int, number: int):
+        self._storage[index] = number
+        chunk, index = self._locate(index)
+        chunk.reprs[index] = repr(number)
+        chunk.text = self._text = None
+
+    def append(self, number: int):
+        """Push an integer onto the top of the stack."""
+        self._storage.append(number)
+        chunks = self._chunks
+        if chunks and len(chunks[-1].reprs) < self._chunk:
+            chunk = chunks[-1]
+            chunk.reprs.append(repr(number))
+            chunk.text = None
+        else:
+            chunks.append(_Chunk([repr(number)]))
+        self._text = None
+
+    def appendleft(self, number: int):
+        """Push an integer onto the bottom of the stack."""
+        self._storage.appendleft(number)
+        chunks = self._chunks
+        if chunks and len(chunks[0].reprs) < self._chunk:
+            chunk = chunks[0]
+            chunk.reprs.insert(0, repr(number))
+            chunk.text = None
+        else:
+            chunks.appendleft(_Chunk([repr(number)]))
+        self._text = None
+
+    def extend(self, numbers: Iterable[int]):
+        """Push integers onto the top of the stack."""
+        numbers = list(numbers)
+        self._storage.extend(numbers)
+        reprs = list(map(repr, numbers))
+        chunks = self._chunks
+        if chunks and reprs:
+            chunk = chunks[-1]
+            room = self._chunk - len(chunk.reprs)
+            if room > 0:
+                chunk.reprs += reprs[:room]
+                chunk.text = None
+                del reprs[:room]
+        for start in range(0, len(reprs), self._chunk):
+            chunks.append(_Chunk(reprs[start:start + self._chunk]))
+        self._text = None
+
+    def pop(self) -> int:
+        """Remove the top element of the stack."""
+        number = self._storage.pop()
+        chunk = self._chunks[-1]
+        chunk.reprs.pop()
+        if chunk.reprs:
+            chunk.text = None
+        else:
+            self._chunks.pop()
+        self._text = None
+        return number
+
+    def popleft(self) -> int:
+        """Remove the bottom element of the stack."""
+        number = self._storage.popleft()
+        chunk = self._chunks[0]
+        del chunk.reprs[0]
+        if chunk.reprs:
+            chunk.text = None
+        else:
+            self._chunks.popleft()
+        self._text = None
+        return number
+
+    def drop(self, count: int):
+        """Remove the top count elements of the stack."""
+        self._storage.drop(count)
+        chunks = self._chunks
+        while count and count >= len(chunks[-1].reprs):
+            count -= len(chunks.pop().reprs)
+        if count:
+            chunk = chunks[-1]
+            del chunk.reprs[-count:]
+            chunk.text = None
+        self._text = None
+
+    def clear(self):
+        """Remove all the elements of the stack."""
+        self._storage.clear()
+        self._chunks.clear()
+        self._text = None
@@ -0,0 +1,128 @@
+"""
+A Fifth stack shared by threads.
+
+Every operation runs on one Fifth while holding one lock, so the operations are
+linearisable. Under the GIL only one thread runs Python code at a time, so
+locking the two ends of the stack separately would not let operations run in
+parallel, and costs more per operation than it saves in contention.
+
+pop() and reverse_pop() can block until an item arrives rather than failing,
+with a timeout, waiting on a condition of the lock. Operations only notify it
+while a thread waits. Transactions are not supported.
+"""
+import threading
+from functools import partialmethod
+from typing import Callable, Iterable, Optional
+
+from fifth import ARITHMETIC
+from fifth import Fifth
+from fifth import InsufficientStackItemsError
+
+
+class ConcurrentFifth:
+    """A Fifth whose operations may be called from many threads at once.
+
+    :param data The stack, bottom first.
+    :param arithmetic The arithmetic mode.
+    """
+
+    def __init__(self, data: Iterable[int] = None, arithmetic: ARITHMETIC = ARITHMETIC.BIGINT):
+        self._fifth = Fifth(list(data or ()), arithmetic=arithmetic)
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        # The number of threads blocked in pop() or reverse_pop()
+        self._waiting = 0
+
+    def __str__(self):
+        with self._lock:
+            return str(self._fifth)
+
+    @property
+    def arithmetic(self) -> ARITHMETIC:
+        """The arithmetic mode."""
+        return self._fifth.arithmetic
+
+    def _call(self, method: Callable, *args):
+        """Run a Fifth method on the stack while holding the lock, and wake any
+        waiting threads."""
+        with self._lock:
+            result = method(self._fifth, *args)
+            if self._waiting:
+                self._available.notify_all()
+            return result
+
+    size = partialmethod(_call, Fifth.size)
+    peek = partialmethod(_call, Fifth.peek)
+
+    push_many = partialmethod(_call, Fifth.push_many)
+    push_range = partialmethod(_call, Fifth.push_range)
+    swap = partialmethod(_call, Fifth.swap)
+    dup = partialmethod(_call, Fifth.dup)
+    drop = partialmethod(_call, Fifth.drop)
+    dup_many = partialmethod(_call, Fifth.dup_many)
+    add = partialmethod(_call, Fifth.add)
+    subtract = partialmethod(_call, Fifth.subtract)
+    multiply = partialmethod(_call, Fifth.multiply)
+    floordiv = partialmethod(_call, Fifth.floordiv)
+    sum = partialmethod(_call, Fifth.sum)
+    product = partialmethod(_call, Fifth.product)
+
+    reverse_push_many = partialmethod(_call, Fifth.reverse_push_many)
+    reverse_swap = partialmethod(_call, Fifth.reverse_swap)
+    reverse_dup = partialmethod(_call, Fifth.reverse_dup)
+    reverse_add = partialmethod(_call, Fifth.reverse_add)
+    reverse_subtract = partialmethod(_call, Fifth.reverse_subtract)
+    reverse_multiply = partialmethod(_call, Fifth.reverse_multiply)
+    reverse_floordiv = partialmethod(_call, Fifth.reverse_floordiv)
+    reverse_sum = partialmethod(_call, Fifth.reverse_sum)
+    reverse_product = partialmethod(_call, Fifth.reverse_product)
+
+    def push(self, number: int):
+        """Push a valid integer onto the top of the stack."""
+        with self._lock:
+            self._fifth.push(number)
+            if self._waiting:
+                self._available.notify()
+
+    def reverse_push(self, number: int):
+        """Push a valid integer onto the bottom of the stack."""
+        with self._lock:
+            self._fifth.reverse_push(number)
+            if self._waiting:
+                self._available.notify()
+
+    def _wait(self, timeout: Optional[float]):
+        """Wait for an item while holding the lock.
+
+        :raises InsufficientStackItemsError If the stack is still empty after timeout seconds.
+        """
+        self._waiting += 1
+        try:
+            if not self._available.wait_for(self._fifth.size, timeout):
+                raise InsufficientStackItemsError("ERROR: insufficient items on stack.")
+        finally:
+            self._waiting -= 1
+
+    def pop(self, block: bool = False, timeout: float = None) -> int:
+        """Remove the top element of the stack.
+
+        :param block Wait for an element if the stack is empty.
+        :param timeout The most seconds to wait, or None to wait for ever.
+        :raises InsufficientStackItemsError If the stack is empty, after waiting.
+        """
+        with self._lock:
+            if block and not self._fifth.size():
+                self._wait(timeout)
+            return self._fifth.pop()
+
+    def reverse_pop(self, block: bool = False, timeout: float = None) -> int:
+        """Remove the bottom element of the stack.
+
+        :param block Wait for an element if the stack is empty.
+        :param timeout The most seconds to wait, or None to wait for ever.
+        :raises InsufficientStackItemsError If the stack is empty, after waiting.
+        """
+        with self._lock:
+            if block and not self._fifth.size():
+                self._wait(timeout)
+            return self._fifth.reverse_pop()
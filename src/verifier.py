@@ -0,0 +1,114 @@
+"""
+A static verifier of the stack depth of compiled Fifth programs.
+
+Every instruction changes the depth of the stack by a fixed amount when it
+succeeds, so from the depth before a program the depth before each instruction
+is known, as is the first instruction which must fail: a compile error, or an
+instruction needing more items than there are. Operations on the top and on the
+bottom of the stack draw on the same items, so one depth serves for both.
+
+A program which cannot run out of items is run on an unchecked path, which
+calls the Fifth methods without their stack size checks. Division by zero
+depends on the values, so it is still checked when the program runs.
+"""
+from functools import lru_cache
+from types import MethodType
+from typing import Callable, List, NamedTuple, Optional
+
+from compiler import OPCODE
+from compiler import Program
+from compiler import bind
+from fifth import Fifth
+from optimiser import stack_effect
+
+# The number of verified programs cached
+VERIFIED_CACHE_SIZE = 1024
+
+
+class Verification(NamedTuple):
+    """The depths of the stack as a program runs."""
+    # The depth before each instruction, then after the last which runs
+    depths: List[int]
+    # The index of the first instruction which must fail, or None
+    failure: Optional[int]
+
+
+def verify(program: Program, depth: int) -> Verification:
+    """Find the depth of the stack before each instruction of a program.
+
+    :param depth The depth of the stack before the program.
+    """
+    depths = [depth]
+    for index, (opcode, operand) in enumerate(program.instructions()):
+        if opcode == OPCODE.ERROR:
+            return Verification(depths, index)
+        need, change = stack_effect(opcode, operand)
+        if depth < need:
+            return Verification(depths, index)
+        depth += change
+        depths.append(depth)
+    return Verification(depths, None)
+
+
+def required_depth(program: Program) -> Optional[int]:
+    """The least depth of the stack before a program for which no instruction
+    runs out of items, or None if the program has a compile error."""
+    required = 0
+    change = 0
+    for opcode, operand in program.instructions():
+        if opcode == OPCODE.ERROR:
+            return None
+        need, effect = stack_effect(opcode, operand)
+        required = max(required, need - change)
+        change += effect
+    return required
+
+
+@lru_cache(maxsize=VERIFIED_CACHE_SIZE)
+def _required_depth(opcodes: bytes, operands: tuple) -> Optional[int]:
+    return required_depth(Program(opcodes, list(operands)))
+
+
+def _unchecked(method: Callable) -> Callable:
+    """A Fifth method without its stack size check."""
+    return getattr(method, '__wrapped__', method)
+
+
+def bind_unchecked(program: Program, fifth: Fifth) -> List[Callable[[], None]]:
+    """As compiler.bind, with functions which do not check the stack size."""
+    table = bind(program, fifth)
+    for opcode, method in (
+            (OPCODE.POP, Fifth.pop),
+            (OPCODE.SWAP, Fifth.swap),
+            (OPCODE.DUP, Fifth.dup),
+            (OPCODE.REVERSE_POP, Fifth.reverse_pop),
+            (OPCODE.REVERSE_SWAP, Fifth.reverse_swap),
+            (OPCODE.REVERSE_DUP, Fifth.reverse_dup),
+            (OPCODE.ADD, Fifth.add),
+            (OPCODE.SUBTRACT, Fifth.subtract),
+            (OPCODE.MULTIPLY, Fifth.multiply),
+            (OPCODE.DIVIDE, Fifth.floordiv),
+            (OPCODE.REVERSE_ADD, Fifth.reverse_add),
+            (OPCODE.REVERSE_SUBTRACT, Fifth.reverse_subtract),
+            (OPCODE.REVERSE_MULTIPLY, Fifth.reverse_multiply),
+            (OPCODE.REVERSE_DIVIDE, Fifth.reverse_floordiv)):
+        table[opcode] = MethodType(_unchecked(method), fifth)
+    return table
+
+
+def execute(program: Program, fifth: Fifth) -> Fifth:
+    """Execute a program against fifth as compiler.execute does, on the unchecked
+    path if the stack is deep enough for every instruction.
+
+    :raises InvalidCommandError If a command cannot be performed.
+    :raises InvalidOperationError If an operation cannot be performed.
+    :raises InsufficientStackItemsError If there are too few items on the stack.
+    """
+    required = _required_depth(program.opcodes, tuple(program.operands))
+    if required is None or fifth.size() < required:
+        table = bind(program, fifth)
+    else:
+        table = bind_unchecked(program, fifth)
+    for opcode in program.opcodes:
+        table[opcode]()
+    return fifth
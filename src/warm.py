@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+"""
+A warm server for short Fifth runs, with a pool of pre-forked workers.
+
+Starting the program for a tiny script costs far more than running it: the
+interpreter starts, and the modules are imported and their enums built. The
+server does that once, then forks workers which accept connections on a Unix
+socket and each run one session at a time, so a client (see client.py) only
+pays for starting itself and connecting.
+
+A request is a header line, "FIFTH 1 <mode> <output>", followed by the input.
+In batch mode the input is read to its end and the output is buffered, as with
+--batch; in interactive mode each line is answered as it arrives. Workers which
+exit are replaced.
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+from typing import BinaryIO, Set
+
+from client import VERSION
+from client import socket_path
+from fifth import InsufficientStackItemsError
+from fifth import InvalidCommandError
+from fifth import InvalidOperationError
+from stack import OUTPUT
+from stack import Stack
+
+# The number of worker processes
+WORKERS = 4
+
+# The maximum length of the request header
+HEADER_LIMIT = 256
+
+# Connections waiting to be accepted
+BACKLOG = 1024
+
+
+def run_interactive(stack: Stack, infile: BinaryIO, outfile: BinaryIO):
+    """Answer each line as it arrives, as Stack.main does."""
+    def write(line):
+        if line is not None:
+            outfile.write(f"{line}\n".encode())
+            outfile.flush()
+
+    write(stack.render_start())
+    while command_line := infile.readline():
+        command_line = command_line.rstrip(b'\r\n')
+        if not command_line:
+            break
+        try:
+            write(stack.render(stack.execute(command_line.decode())))
+        except (InvalidCommandError,
+                InvalidOperationError,
+                InsufficientStackItemsError) as error:
+            write(str(error))
+    stack.write_end(lambda piece: outfile.write(piece.encode()))
+    outfile.flush()
+
+
+def handle(connection: socket.socket):
+    """Run the session requested on a connection."""
+    with connection, connection.makefile('rb') as infile, \
+            connection.makefile('wb') as outfile:
+        header = infile.readline(HEADER_LIMIT).split()
+        if len(header) != 4 or header[:2] != [b"FIFTH", str(VERSION).encode()]:
+            return
+        mode, output = header[2].decode(), header[3].decode()
+        if output not in OUTPUT.list():
+            outfile.write(f"unknown output mode: {output}\n".encode())
+            return
+        stack = Stack(output=output)
+        if mode == "interactive":
+            run_interactive(stack, infile, outfile)
+        else:
+            stack.run_file(infile, outfile)
+
+
+def _work(listener: socket.socket):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    while True:
+        connection, _ = listener.accept()
+        try:
+            handle(connection)
+        except (ConnectionError, UnicodeDecodeError):
+            pass
+
+
+class WarmServer:
+    """A pool of pre-forked workers serving Fifth sessions on a Unix socket.
+
+    :param path The path of the socket.
+    :param workers The number of worker processes.
+    """
+
+    def __init__(self, path: str = None, workers: int = WORKERS):
+        self.path = path or socket_path()
+        self.workers = workers
+        self._pids: Set[int] = set()
+        self._listener = None
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                _work(self._listener)
+            except Exception:  # pylint: disable=broad-exception-caught
+                # Any failure ends the worker, which is replaced
+                status = 1
+            finally:
+                # Never return into the server's code, even when interrupted
+                os._exit(status)
+        self._pids.add(pid)
+
+    def serve(self):
+        """Listen and keep the workers running until SIGTERM or SIGINT."""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.path)
+        self._listener.listen(BACKLOG)
+
+        def stop(*_):
+            raise KeyboardInterrupt
+        signal.signal(signal.SIGTERM, stop)
+
+        # Keep the imported modules out of collections, so the workers share
+        # their pages with this process
+        gc.collect()
+        gc.freeze()
+        try:
+            for _ in range(self.workers):
+                self._spawn()
+            while True:
+                pid, _ = os.wait()
+                if pid in self._pids:
+                    self._pids.remove(pid)
+                    self._spawn()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for pid in self._pids:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+            for pid in self._pids:
+                try:
+                    os.waitpid(pid, 0)
+                except ChildProcessError:
+                    pass
+            self._listener.close()
+            os.unlink(self.path)
+
+
+def main():
+    """Runs a warm Fifth server."""
+    parser = argparse.ArgumentParser(description="A warm Fifth server for client.py.")
+    parser.add_argument("--socket", default=None,
+                        help=f"the Unix socket to listen on, {socket_path()} by default")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="the number of worker processes")
+    args = parser.parse_args()
+    print(f"serving on {args.socket or socket_path()}", file=sys.stderr)
+    WarmServer(args.socket, args.workers).serve()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""
+Random scripts, and running them, shared by the tests comparing executors.
+"""
+from compiler import ERRORS
+from fifth import Fifth
+from storage import DEFAULT_STORAGE
+
+# Lines of every kind of instruction, from which random scripts are drawn
+SCRIPT_LINES = [
+    "PUSH 0", "PUSH 1", "PUSH 7", "PUSH 9223372036854775807", "PUSH 99999999999999999999",
+    "rPUSH 0", "rPUSH 3",
+    "POP", "SWAP", "DUP", "rPOP", "rSWAP", "rDUP",
+    "+", "-", "*", "/", "r+", "r-", "r*", "r/",
+    "PUSH 1 2 3", "rPUSH 4 5", "PUSHN 3 1", "DROPN 2", "DUPN 2",
+    "SUM 3", "PROD 2", "rSUM 2", "rPROD 3",
+]
+
+
+def random_script(rng, count):
+    """A script of count lines drawn from SCRIPT_LINES by rng."""
+    return [rng.choice(SCRIPT_LINES) for _ in range(count)]
+
+
+def outcome(run, program, data, storage=DEFAULT_STORAGE):
+    """Run a program on a new Fifth holding data, giving the stack afterwards
+    and the class and message of any error."""
+    fifth = Fifth(data, storage=storage)
+    try:
+        run(program, fifth)
+    except ERRORS as error:
+        return str(fifth), type(error), str(error)
+    return str(fifth), None, None
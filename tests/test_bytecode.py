@@ -0,0 +1,128 @@
+import os
+import random
+from io import BytesIO
+
+import pytest
+from bytecode import ProgramCache
+from bytecode import dumps
+from bytecode import loads
+from compiler import OPCODE
+from compiler import Program
+from compiler import compile_script
+from fifth import MAX_RANGE
+from optimiser import optimise
+from stack import Stack
+
+LINES = [
+    "PUSH 1", "PUSH 9223372036854775807", "PUSH 9223372036854775808",
+    "rPUSH 123456789012345678901234567890", "POP", "DUP", "rSWAP", "+", "/",
+    "PUSH", "PUSH x", "DUP 1", "nonsense",
+    "PUSH 1 99999999999999999999 3", "rPUSH 4 5", "PUSHN 7 2", "PUSHN 1 1", "SUM 3", "DUPN 2",
+]
+
+
+class TestSerialisation:
+    @pytest.mark.parametrize("seed", range(10))
+    def test_round_trip(self, seed):
+        rng = random.Random(seed)
+        program = compile_script([rng.choice(LINES) for _ in range(200)])
+        assert loads(dumps(program)) == program
+        optimised, _ = optimise(program)
+        assert loads(dumps(optimised)) == optimised
+
+    def test_empty(self):
+        assert loads(dumps(Program())) == Program()
+
+    def test_negative_operands(self):
+        program = Program.from_instructions([(0, -1), (0, -2 ** 100), (4, 2 ** 64)])
+        assert loads(dumps(program)) == program
+
+    def test_rejects_other_versions(self):
+        data = bytearray(dumps(compile_script("PUSH 1")))
+        data[8] += 1
+        with pytest.raises(ValueError, match="version"):
+            loads(bytes(data))
+
+    def test_rejects_truncated(self):
+        with pytest.raises(ValueError):
+            loads(dumps(compile_script("PUSH 1"))[:-1])
+
+    def test_rejects_corrupt_bytes(self):
+        data = dumps(compile_script(LINES))
+        for position, original in enumerate(data):
+            for byte in (0, 0x7f, 0xff, original ^ 1):
+                corrupt = bytearray(data)
+                corrupt[position] = byte
+                try:
+                    loads(bytes(corrupt))
+                except ValueError:
+                    pass
+
+    @pytest.mark.parametrize("operand", [range(0, MAX_RANGE), range(MAX_RANGE, 0, -1)])
+    def test_longest_range(self, operand):
+        program = Program.from_instructions([(OPCODE.PUSH_RANGE, operand)])
+        assert loads(dumps(program)) == program
+
+    @pytest.mark.parametrize("operand", [range(0, MAX_RANGE + 1), range(MAX_RANGE + 1, 0, -1)])
+    def test_rejects_longer_ranges(self, operand):
+        with pytest.raises(ValueError, match="corrupt"):
+            loads(dumps(Program.from_instructions([(OPCODE.PUSH_RANGE, operand)])))
+
+    def test_rejects_other_scripts(self):
+        with pytest.raises(ValueError, match="script"):
+            loads(dumps(compile_script("PUSH 1"), bytes(32)), b'\1' * 32)
+
+
+class TestProgramCache:
+    SCRIPT = b"PUSH 3\r\nPUSH 4\nx\n*\n\nPUSH 5\n"
+
+    @pytest.fixture
+    def script(self, tmp_path):
+        path = tmp_path / "script.txt"
+        path.write_bytes(self.SCRIPT)
+        return str(path)
+
+    def test_caches(self, tmp_path, script):
+        cache = ProgramCache(str(tmp_path / "cache"))
+        program = cache.load(script)
+        assert program == compile_script(["PUSH 3", "PUSH 4", "x", "*"])
+        assert os.path.exists(cache.path(script))
+        assert cache.load(script) == program
+
+    def test_output_matches_run_file(self, tmp_path, script):
+        expected = BytesIO()
+        Stack().run_file(BytesIO(self.SCRIPT), expected)
+        for _ in range(2):
+            outfile = BytesIO()
+            Stack().run_program(ProgramCache(str(tmp_path / "cache")).load(script), outfile)
+            assert outfile.getvalue() == expected.getvalue()
+
+    def test_changed_script_is_recompiled(self, tmp_path, script):
+        cache = ProgramCache(str(tmp_path / "cache"))
+        cache.load(script)
+        status = os.stat(script)
+        with open(script, "wb") as file:
+            file.write(self.SCRIPT.replace(b"3", b"8"))
+        # Even with the same modification time and size, the digest differs
+        os.utime(script, ns=(status.st_atime_ns, status.st_mtime_ns))
+        assert cache.load(script).operands[0] == 8
+
+    def test_corrupt_file_is_replaced(self, tmp_path, script):
+        cache = ProgramCache(str(tmp_path / "cache"))
+        cache.load(script)
+        with open(cache.path(script), "wb") as file:
+            file.write(b"garbage")
+        assert cache.load(script).operands[0] == 3
+        assert cache.get(script, None) is not None
+
+    def test_corrupt_error_is_replaced(self, tmp_path, script):
+        cache = ProgramCache(str(tmp_path / "cache"))
+        cache.load(script)
+        with open(cache.path(script), "r+b") as file:
+            data = bytearray(file.read())
+            # The byte of the error class of the only error, after its index
+            data[data.rindex(b"ERROR: unknown") - 2] = 0xff
+            file.seek(0)
+            file.write(data)
+        assert cache.get(script, None) is None
+        assert cache.load(script) == compile_script(["PUSH 3", "PUSH 4", "x", "*"])
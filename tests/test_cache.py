@@ -0,0 +1,76 @@
+import pytest
+from cache import ResultCache
+from cache import normalise
+from fifth import Fifth
+from fifth import InsufficientStackItemsError
+from fifth import InvalidOperationError
+from storage import ArrayStorage
+
+
+class TestNormalise:
+    def test_whitespace(self):
+        assert normalise("  PUSH   1 \n\tDUP\n") == "PUSH 1\nDUP"
+        assert normalise(["PUSH 1", " + "]) == "PUSH 1\n+"
+
+
+class TestResultCache:
+    def test_hit(self):
+        cache = ResultCache()
+        assert str(cache.run("PUSH 3\nDUP\n*", [1])) == str([1, 9])
+        assert str(cache.run(" PUSH  3\nDUP\n*\n", [1])) == str([1, 9])
+        info = cache.cache_info()
+        assert (info.hits, info.misses, info.entries) == (1, 1, 1)
+
+    def test_keyed_on_initial_stack(self):
+        cache = ResultCache()
+        assert str(cache.run("DUP\n+", [1])) == str([2])
+        assert str(cache.run("DUP\n+", [2])) == str([4])
+        assert cache.cache_info().misses == 2
+
+    def test_keyed_on_arithmetic(self):
+        cache = ResultCache()
+        script = "PUSH 9223372036854775807\nPUSH 1\n+"
+        assert str(cache.run(script)) == str([2 ** 63])
+        assert str(cache.execute(script, Fifth(arithmetic="saturate"))) == str([2 ** 63 - 1])
+
+    def test_errors_are_cached(self):
+        cache = ResultCache()
+        for _ in range(2):
+            fifth = Fifth([5], storage=ArrayStorage)
+            with pytest.raises(InvalidOperationError, match="cannot divide by zero"):
+                cache.execute("PUSH 2\n*\nPUSH 0\n/\nPUSH 1", fifth)
+            assert str(fifth) == str([10, 0])
+        assert cache.cache_info().hits == 1
+
+    def test_lru_eviction_by_entries(self):
+        cache = ResultCache(max_entries=2)
+        cache.run("PUSH 1")
+        cache.run("PUSH 2")
+        cache.run("PUSH 1")
+        cache.run("PUSH 3")
+        info = cache.cache_info()
+        assert (info.entries, info.evictions) == (2, 1)
+        cache.run("PUSH 1")
+        assert cache.cache_info().hits == 2
+
+    def test_eviction_by_bytes(self):
+        cache = ResultCache(max_bytes=2000)
+        for number in range(20):
+            cache.run(f"PUSH {number}\nDUP\nDUP")
+        info = cache.cache_info()
+        assert 0 < info.bytes <= 2000
+        assert info.evictions == 20 - info.entries
+
+    def test_too_large_to_cache(self):
+        cache = ResultCache(max_bytes=10)
+        assert str(cache.run("PUSH 1")) == str([1])
+        assert len(cache) == 0
+
+    def test_bypassed_in_transaction(self):
+        cache = ResultCache()
+        fifth = Fifth([1])
+        with pytest.raises(InsufficientStackItemsError):
+            with fifth.transaction():
+                cache.execute("DUP\n+\n+", fifth)
+        assert str(fifth) == str([1])
+        assert len(cache) == 0
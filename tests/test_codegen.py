@@ -0,0 +1,82 @@
+import random
+
+import pytest
+from codegen import MAX_INSTRUCTIONS
+from codegen import MAX_LOCALS
+from codegen import compile_program
+from codegen import generate
+from compiler import compile_script
+from compiler import execute
+from compiler import ERRORS
+from fifth import Fifth
+from optimiser import optimise
+from storage import ArrayStorage
+from storage import ListStorage
+
+from helpers import outcome
+from helpers import random_script
+
+
+def run_compiled(program, fifth):
+    return compile_program(program)(fifth)
+
+
+class TestCodegen:
+    def test_straight_line(self):
+        program = compile_script("PUSH 3\nDUP\n*\nPUSH 2\nSWAP\n-")
+        assert compile_program(program)(Fifth([5])).storage == Fifth([5, -7]).storage
+        assert "len(s)" not in generate(program)
+
+    def test_checks_only_unproven_depth(self):
+        source = generate(compile_script("SWAP\n+\nDUP\nPUSH 2\n*\n-\nPOP\nPOP"))
+        assert source.count("len(s)") == 2
+
+    @pytest.mark.parametrize("script,error", [
+        ("PUSH 1\n+", "ERROR: insufficient items on stack."),
+        ("PUSH 1\nPUSH 0\n/", "ERROR: cannot divide by zero."),
+        ("PUSH 1\nFOO", "ERROR: unknown command/operator."),
+        ("rPUSH 0\nrPUSH 1\nr/", "ERROR: cannot divide by zero."),
+    ])
+    def test_errors(self, script, error):
+        program = compile_script(script)
+        assert outcome(run_compiled, program, []) == outcome(execute, program, [])
+        assert outcome(run_compiled, program, [])[2] == error
+
+    def test_many_locals(self):
+        script = [f"PUSH {number}" for number in range(3 * MAX_LOCALS)] + ["+"] * 10
+        program = compile_script(script)
+        assert outcome(run_compiled, program, []) == outcome(execute, program, [])
+
+    def test_cached(self):
+        program = compile_script("PUSH 1\nDUP")
+        assert compile_program(program) is compile_program(compile_script("PUSH 1\nDUP"))
+
+    def test_fixed_width_falls_back(self):
+        fifth = Fifth([2 ** 62], arithmetic="wrap")
+        compile_program(compile_script("DUP\n+\nDUP\n+"))(fifth)
+        assert str(fifth) == str([0])
+
+    def test_transaction_falls_back(self):
+        fifth = Fifth([1, 2])
+        with pytest.raises(ERRORS):
+            with fifth.transaction():
+                compile_program(compile_script("+\nDUP\nrPOP\n/\nPOP\nPOP"))(fifth)
+        assert str(fifth) == str([1, 2])
+
+    def test_large_programs_are_executed(self):
+        program = compile_script(["PUSH 1", "DUP", "+"] * (MAX_INSTRUCTIONS // 3 + 1))
+        assert compile_program(program).func is execute
+        fifth = compile_program(program)(Fifth())
+        assert str(fifth) == str([2] * (MAX_INSTRUCTIONS // 3 + 1))
+
+    @pytest.mark.parametrize("seed", range(50))
+    def test_same_outcome(self, seed):
+        rng = random.Random(seed)
+        script = random_script(rng, rng.randint(1, 60))
+        data = [rng.randint(0, 5) for _ in range(rng.randint(0, 6))]
+        program = compile_script(script)
+        expected = outcome(execute, program, data)
+        assert outcome(run_compiled, program, data) == expected
+        assert outcome(run_compiled, optimise(program)[0], data) == expected
+        for storage in (ListStorage, ArrayStorage):
+            assert outcome(run_compiled, program, data, storage) == expected
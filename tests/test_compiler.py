@@ -0,0 +1,68 @@
+import pytest
+from compiler import OPCODE
+from compiler import Program
+from compiler import compile_script
+from compiler import execute
+from compiler import execute_each
+from fifth import Fifth
+from stack import Stack
+from stack import InvalidCommandError
+from stack import InsufficientStackItemsError
+from stack import InvalidOperationError
+
+SCRIPTS = [
+    "PUSH 3\nPUSH 11\n+\nDUP\nPUSH 2\n*\nSWAP\n/\n+",
+    "PUSH 1\nrPUSH 2\nrPUSH 3\nr+\nrDUP\nrSWAP\nr*\nrPOP\nr-",
+    "PUSH 2\nPUSH 0\n/\nr/\nPOP\nPOP\nPOP",
+    "PUSH\nPUSH 1 2\nPUSH A\nPOP 1\nINVALID\n\n   \nrPUSH -1\n+ 7",
+    "PUSH 1 2 3\nPUSHN 5 1\nSUM 3\nPROD 2\nrPUSH 4 5\nrSUM 2\nDUPN 2\nDROPN 3\nrPROD 2\n"
+    "SUM 0\nPROD 0\nrPROD 9\nDUPN\nPUSHN 1\nSUM x\nPUSH 1 x\nDROPN 99\nPUSHN 0 99999999999",
+]
+
+
+def interpret_each(script):
+    stack = Stack()
+    for command_line in script.splitlines():
+        try:
+            stack.interpret(command_line)
+        except (InvalidCommandError, InvalidOperationError, InsufficientStackItemsError) as error:
+            yield str(stack), type(error), str(error)
+        else:
+            yield str(stack), None, None
+
+
+class TestCompile:
+    def test_one_instruction_per_line(self):
+        program = compile_script("PUSH 1\nPOP\n\nrPUSH 2")
+        assert list(program.opcodes) == [OPCODE.PUSH, OPCODE.POP, OPCODE.ERROR, OPCODE.REVERSE_PUSH]
+        assert program.operands[0] == 1
+        assert program.operands[2] == 2
+
+    def test_from_lines(self):
+        assert compile_script(["PUSH 1", "DUP"]) == compile_script("PUSH 1\nDUP")
+
+    def test_instructions_round_trip(self):
+        program = compile_script(SCRIPTS[3])
+        assert Program.from_instructions(program.instructions()) == program
+
+
+class TestExecute:
+    def test_executes_many_times(self):
+        program = compile_script("PUSH 3\nPUSH 11\n+")
+        assert str(execute(program, Fifth())) == str([14])
+        assert str(execute(program, Fifth([1]))) == str([1, 14])
+
+    def test_stops_at_first_error(self):
+        fifth = Fifth()
+        with pytest.raises(InvalidCommandError, match="ERROR: unknown command/operator."):
+            execute(compile_script("PUSH 1\nINVALID\nPUSH 2"), fifth)
+        assert str(fifth) == str([1])
+
+    @pytest.mark.parametrize("script", SCRIPTS)
+    def test_matches_interpret(self, script):
+        fifth = Fifth()
+        results = [
+            (str(fifth), type(error) if error else None, str(error) if error else None)
+            for error in execute_each(compile_script(script), fifth)
+        ]
+        assert results == list(interpret_each(script))
@@ -1,5 +1,21 @@
+import random
+from functools import partial
+
 import pytest
+from fifth import ARITHMETIC
+from fifth import INT64_MAX
+from fifth import INT64_MIN
+from fifth import RENDER_CHUNK
+from fifth import Fifth
 from fifth import InsufficientStackItemsError
+from fifth import InvalidOperationError
+from filestorage import SpillStorage
+from storage import ArrayStorage
+from storage import DequeStorage
+from storage import ListStorage
+from storage import PersistentStorage
+
+STORAGES = [DequeStorage, ListStorage, ArrayStorage, PersistentStorage]
 
 
 class TestPush:
@@ -7,7 +23,8 @@ class TestPush:
         with pytest.raises(TypeError) as exc_info:
             fifth_is_empty.push()
         assert exc_info.type is TypeError
-        assert exc_info.value.args[0] == "Fifth.push() missing 1 required positional argument: 'number'"
+        assert exc_info.value.args[0] == \
+            "Fifth.push() missing 1 required positional argument: 'number'"
 
         with pytest.raises(TypeError, match=r".*missing 1 required positional argument"):
             fifth_is_empty.push()
@@ -93,3 +110,252 @@ class TestSwap:
         assert str(fifth_has_two_items) == str([2, 1])
         fifth_has_two_items.swap()
         assert str(fifth_has_two_items) == str([1, 2])
+
+
+class TestReverseSwap:
+    def test_on_single_item_stack(self, fifth_has_one_item):
+        with pytest.raises(InsufficientStackItemsError):
+            fifth_has_one_item.reverse_swap()
+
+    def test_on_three_item_stack(self):
+        fifth = Fifth([1, 2, 3])
+        fifth.reverse_swap()
+        assert str(fifth) == str([2, 1, 3])
+
+
+class TestReverseDup:
+    def test_on_empty_stack(self, fifth_is_empty):
+        with pytest.raises(InsufficientStackItemsError):
+            fifth_is_empty.reverse_dup()
+
+    def test_on_double_item_stack(self, fifth_has_two_items):
+        fifth_has_two_items.reverse_dup()
+        assert str(fifth_has_two_items) == str([1, 1, 2])
+
+
+class TestReversePop:
+    def test_on_empty_stack(self, fifth_is_empty):
+        with pytest.raises(InsufficientStackItemsError):
+            fifth_is_empty.reverse_pop()
+
+    def test_on_double_item_stack(self, fifth_has_two_items):
+        assert fifth_has_two_items.reverse_pop() == 1
+        assert str(fifth_has_two_items) == str([2])
+
+
+class TestStorage:
+    def test_default_is_deque(self, fifth_is_empty):
+        assert isinstance(fifth_is_empty.storage, DequeStorage)
+
+    @pytest.mark.parametrize("storage", [DequeStorage, ListStorage, PersistentStorage])
+    def test_backends_agree(self, storage):
+        fifth = Fifth([1, 2, 3], storage=storage)
+        fifth.reverse_push(4)
+        fifth.push(5)
+        fifth.reverse_add()
+        fifth.reverse_dup()
+        fifth.swap()
+        fifth.reverse_pop()
+        assert str(fifth) == str([5, 2, 5, 3])
+        assert fifth.size() == 4
+
+    @pytest.mark.parametrize("size", [0, 1, RENDER_CHUNK, RENDER_CHUNK + 1, 3 * RENDER_CHUNK])
+    def test_render_streams_str(self, size):
+        data = [-2 ** 70, *range(size - 1)][:size]
+        fifth = Fifth(data, storage=partial(SpillStorage, hot=64, segment=32))
+        assert str(fifth) == str(data)
+        assert ''.join(fifth.render()) == str(data)
+        assert max(map(len, fifth.render())) < len(str(data)) or size <= RENDER_CHUNK
+
+
+class TestBulk:
+    @pytest.mark.parametrize("storage", STORAGES)
+    def test_bulk_operations(self, storage):
+        fifth = Fifth([1, 2], storage=storage)
+        fifth.push_many([3, 4])
+        fifth.push_range(7, 5)
+        fifth.reverse_push_many([8, 9])
+        assert str(fifth) == str([9, 8, 1, 2, 3, 4, 7, 6, 5])
+        fifth.sum(3)
+        fifth.product(2)
+        fifth.reverse_sum(2)
+        fifth.reverse_product(2)
+        fifth.dup_many(2)
+        assert str(fifth) == str([17, 2, 3, 72, 3, 72])
+        fifth.drop(4)
+        assert str(fifth) == str([17, 2])
+
+    def test_empty_sum_and_product(self, fifth_is_empty):
+        fifth_is_empty.sum(0)
+        fifth_is_empty.product(0)
+        assert str(fifth_is_empty) == str([0, 1])
+
+    @pytest.mark.parametrize("method", ["sum", "product", "reverse_sum", "reverse_product",
+                                        "dup_many"])
+    def test_insufficient_items_leaves_stack(self, fifth_has_two_items, method):
+        with pytest.raises(InsufficientStackItemsError):
+            getattr(fifth_has_two_items, method)(3)
+        assert str(fifth_has_two_items) == str([1, 2])
+
+    def test_fixed_width(self):
+        fifth = Fifth([INT64_MAX, 1, -1], arithmetic=ARITHMETIC.SATURATE)
+        fifth.sum(3)
+        fifth.push_many([2 ** 64])
+        assert str(fifth) == str([INT64_MAX, INT64_MAX])
+
+
+class TestFork:
+    @pytest.mark.parametrize("storage", [DequeStorage, ArrayStorage, PersistentStorage])
+    def test_forks_are_independent(self, storage):
+        fifth = Fifth([1, 2, 3], storage=storage)
+        fork = fifth.fork()
+        fork.add()
+        fork.reverse_push(9)
+        fifth.reverse_pop()
+        assert str(fifth) == str([2, 3])
+        assert str(fork) == str([9, 1, 5])
+
+    def test_fork_in_transaction(self, fifth_has_two_items):
+        with fifth_has_two_items.transaction():
+            fifth_has_two_items.push(3)
+            fork = fifth_has_two_items.fork()
+        assert not fork.in_transaction
+        fork.pop()
+        assert str(fifth_has_two_items) == str([1, 2, 3])
+
+
+class TestArithmetic:
+    @pytest.mark.parametrize("method,expected", [
+        ("add", [3]),
+        ("subtract", [-1]),
+        ("multiply", [2]),
+        ("floordiv", [0]),
+    ])
+    def test_on_double_item_stack(self, fifth_has_two_items, method, expected):
+        getattr(fifth_has_two_items, method)()
+        assert str(fifth_has_two_items) == str(expected)
+
+    def test_on_single_item_stack(self, fifth_has_one_item):
+        with pytest.raises(InsufficientStackItemsError):
+            fifth_has_one_item.add()
+        assert str(fifth_has_one_item) == str([1])
+
+    def test_divide_by_zero(self):
+        fifth = Fifth([2, 0])
+        with pytest.raises(InvalidOperationError):
+            fifth.floordiv()
+        assert str(fifth) == str([2, 0])
+
+
+class TestTransaction:
+    OPERATIONS = [
+        ("push", 7), ("pop",), ("swap",), ("dup",), ("drop", 2),
+        ("add",), ("subtract",), ("multiply",), ("floordiv",),
+        ("reverse_push", 5), ("reverse_pop",), ("reverse_swap",), ("reverse_dup",),
+        ("reverse_add",), ("reverse_subtract",), ("reverse_multiply",), ("reverse_floordiv",),
+        ("push_many", (1, 2)), ("reverse_push_many", range(3)), ("dup_many", 2),
+        ("sum", 3), ("product", 2), ("reverse_sum", 2), ("reverse_product", 3),
+    ]
+
+    @pytest.mark.parametrize("storage", STORAGES)
+    def test_rollback_restores_stack(self, storage):
+        fifth = Fifth([3, 1, 4, 1, 5], storage=storage)
+        fifth.begin()
+        for method, *args in self.OPERATIONS * 3:
+            try:
+                getattr(fifth, method)(*args)
+            except (InsufficientStackItemsError, InvalidOperationError):
+                pass
+        fifth.rollback()
+        assert str(fifth) == str([3, 1, 4, 1, 5])
+
+    def test_commit_keeps_operations(self, fifth_has_two_items):
+        fifth_has_two_items.begin()
+        assert fifth_has_two_items.in_transaction
+        fifth_has_two_items.add()
+        fifth_has_two_items.commit()
+        assert str(fifth_has_two_items) == str([3])
+        assert not fifth_has_two_items.in_transaction
+
+    def test_nested(self, fifth_has_two_items):
+        fifth_has_two_items.begin()
+        fifth_has_two_items.push(3)
+        fifth_has_two_items.begin()
+        fifth_has_two_items.multiply()
+        fifth_has_two_items.rollback()
+        assert str(fifth_has_two_items) == str([1, 2, 3])
+        fifth_has_two_items.rollback()
+        assert str(fifth_has_two_items) == str([1, 2])
+
+    def test_context_manager(self, fifth_has_two_items):
+        with pytest.raises(InsufficientStackItemsError):
+            with fifth_has_two_items.transaction():
+                fifth_has_two_items.add()
+                fifth_has_two_items.add()
+        assert str(fifth_has_two_items) == str([1, 2])
+
+
+class TestArithmeticModes:
+    @pytest.mark.parametrize("arithmetic,method,data,expected", [
+        ("wrap", "add", [INT64_MAX, 1], INT64_MIN),
+        ("wrap", "subtract", [INT64_MIN, 1], INT64_MAX),
+        ("wrap", "multiply", [2 ** 62, 4], 0),
+        ("wrap", "floordiv", [INT64_MIN, -1], INT64_MIN),
+        ("saturate", "add", [INT64_MAX, 1], INT64_MAX),
+        ("saturate", "subtract", [INT64_MIN, 1], INT64_MIN),
+        ("saturate", "multiply", [2 ** 62, -4], INT64_MIN),
+        ("saturate", "floordiv", [INT64_MIN, -1], INT64_MAX),
+        ("bigint", "add", [INT64_MAX, 1], 2 ** 63),
+    ])
+    def test_overflow(self, arithmetic, method, data, expected):
+        fifth = Fifth(data, arithmetic=arithmetic)
+        getattr(fifth, method)()
+        assert str(fifth) == str([expected])
+
+    @pytest.mark.parametrize("arithmetic", ARITHMETIC.list())
+    def test_floor_division(self, arithmetic):
+        fifth = Fifth([-7, 2, 7, -2], arithmetic=arithmetic)
+        fifth.floordiv()
+        fifth.reverse_floordiv()
+        assert str(fifth) == str([-4, -4])
+
+    @pytest.mark.parametrize("arithmetic", ARITHMETIC.list())
+    def test_divide_by_zero(self, arithmetic):
+        fifth = Fifth([1, 0, 0], arithmetic=arithmetic)
+        with pytest.raises(InvalidOperationError):
+            fifth.floordiv()
+        fifth.pop()
+        with pytest.raises(InvalidOperationError):
+            fifth.reverse_floordiv()
+        assert str(fifth) == str([1, 0])
+
+    def test_pushes_are_normalised(self):
+        fifth = Fifth([2 ** 64 + 5], arithmetic=ARITHMETIC.WRAP)
+        fifth.push(2 ** 63)
+        fifth.reverse_push(2 ** 100)
+        assert str(fifth) == str([0, 5, INT64_MIN])
+        fifth = Fifth([2 ** 64], arithmetic=ARITHMETIC.SATURATE)
+        fifth.reverse_push(2 ** 63)
+        assert str(fifth) == str([INT64_MAX, INT64_MAX])
+
+    def test_stays_compact(self):
+        fifth = Fifth([3], storage=ArrayStorage, arithmetic=ARITHMETIC.WRAP)
+        for _ in range(100):
+            fifth.dup()
+            fifth.multiply()
+            fifth.reverse_dup()
+            fifth.reverse_multiply()
+        assert fifth.storage.compact
+
+    @pytest.mark.parametrize("seed", range(10))
+    def test_wrap_is_modular(self, seed):
+        rng = random.Random(seed)
+        data = [rng.randint(-2 ** 70, 2 ** 70) for _ in range(30)]
+        exact = Fifth(data)
+        wrapped = Fifth(data, arithmetic=ARITHMETIC.WRAP)
+        for _ in range(29):
+            method = rng.choice(["add", "subtract", "multiply", "reverse_add",
+                                 "reverse_subtract", "reverse_multiply"])
+            getattr(exact, method)()
+            getattr(wrapped, method)()
+        assert wrapped.peek() == (exact.peek() + 2 ** 63) % 2 ** 64 - 2 ** 63
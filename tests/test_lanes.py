@@ -0,0 +1,58 @@
+import random
+
+import pytest
+from compiler import compile_script
+from compiler import execute
+from optimiser import optimise
+
+from helpers import outcome
+from helpers import random_script
+
+pytest.importorskip("numpy")
+
+
+@pytest.fixture(name="lanes")
+def lanes_module():
+    # Imported once NumPy is known to be installed
+    import lanes  # pylint: disable=import-outside-toplevel
+    yield lanes
+
+
+class TestExecuteLanes:
+    def test_lanes_of_different_depths(self, lanes):
+        results = lanes.execute_lanes(compile_script("PUSH 2\n*\nrPUSH 1\nr+"), [[3], [4, 5], []])
+        assert results.stacks() == [[7], [5, 10], [2]]
+        assert results.errors.tolist() == [lanes.LANE_OK, lanes.LANE_OK,
+                                           lanes.LANE_INSUFFICIENT_ITEMS]
+        assert results.ok.tolist() == [True, True, False]
+        assert str(results.error(2)) == "ERROR: insufficient items on stack."
+
+    def test_divide_by_zero(self, lanes):
+        results = lanes.execute_lanes(compile_script("/"), [[6, 0], [6, 4]])
+        assert results.stacks() == [[6, 0], [1]]
+        assert results.errors.tolist() == [lanes.LANE_DIVIDE_BY_ZERO, lanes.LANE_OK]
+
+    def test_invalid_command(self, lanes):
+        results = lanes.execute_lanes(compile_script("PUSH 1\nINVALID"), [[]])
+        assert results.errors.tolist() == [lanes.LANE_INVALID_COMMAND]
+        assert str(results.error(0)) == "ERROR: unknown command/operator."
+        assert results.failed_at.tolist() == [1]
+
+    def test_overflow_falls_back_to_python_integers(self, lanes):
+        results = lanes.execute_lanes(compile_script("DUP\n*\nDUP\n*"), [[2 ** 40], [3], [2 ** 70]])
+        assert results.stacks() == [[2 ** 160], [81], [2 ** 280]]
+        assert results.ok.all()
+
+    @pytest.mark.parametrize("seed", range(10))
+    def test_matches_execute(self, lanes, seed):
+        rng = random.Random(seed)
+        program = compile_script(random_script(rng, 30))
+        if seed % 2:
+            program, _ = optimise(program)
+        stacks = [[rng.randint(-3, 3) for _ in range(rng.randint(0, 5))] for _ in range(50)]
+        results = lanes.execute_lanes(program, stacks)
+        for lane, stack in enumerate(stacks):
+            error = results.error(lane)
+            stack_after, _, message = outcome(execute, program, stack)
+            assert str(results.stack(lane)) == stack_after
+            assert (str(error) if error else None) == message
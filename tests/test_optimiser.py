@@ -0,0 +1,52 @@
+import random
+
+import pytest
+from compiler import OPCODE
+from compiler import compile_script
+from compiler import execute
+from optimiser import optimise
+
+from helpers import outcome
+from helpers import random_script
+
+
+class TestOptimise:
+    @pytest.mark.parametrize("script,expected", [
+        ("PUSH 2\nPUSH 3\n+\nPUSH 4\n*", ["PUSH 20"]),
+        ("rPUSH 2\nrPUSH 7\nr-", ["REVERSE_PUSH 5"]),
+        ("PUSH 3\nDUP\n*", ["PUSH 9"]),
+        ("PUSH 1\nPUSH 2\nSWAP\n-", ["PUSH 1"]),
+        ("PUSH 1\nPOP", []),
+        ("POP\nPOP\nPOP", ["DROP 3"]),
+        ("PUSH 1\nDUP\nPOP\nPOP\nPOP", ["POP"]),
+    ])
+    def test_folds(self, script, expected):
+        program, removed = optimise(compile_script(script))
+        assert [f"{opcode.name} {operand}" if operand is not None else opcode.name
+                for opcode, operand in program.instructions()] == expected
+        assert removed == len(script.splitlines()) - len(expected)
+
+    def test_keeps_divide_by_zero(self):
+        program, removed = optimise(compile_script("PUSH 2\nPUSH 0\n/"))
+        assert list(program.opcodes) == [OPCODE.PUSH, OPCODE.PUSH, OPCODE.DIVIDE]
+        assert removed == 0
+
+    def test_keeps_errors_for_short_stacks(self):
+        program, removed = optimise(compile_script("DUP\nPOP\nSWAP\nSWAP"))
+        assert list(program.opcodes) == [OPCODE.DUP, OPCODE.POP, OPCODE.SWAP, OPCODE.SWAP]
+        assert removed == 0
+
+    def test_removes_code_after_an_error(self):
+        program, removed = optimise(compile_script("PUSH 1\nINVALID\nPUSH 2\nPUSH 3"))
+        assert list(program.opcodes) == [OPCODE.PUSH, OPCODE.ERROR]
+        assert removed == 2
+
+    @pytest.mark.parametrize("seed", range(20))
+    def test_same_outcome(self, seed):
+        rng = random.Random(seed)
+        script = random_script(rng, 40)
+        program = compile_script(script)
+        optimised, _ = optimise(program)
+        for size in range(4):
+            data = [rng.randint(-5, 5) for _ in range(size)]
+            assert outcome(execute, optimised, data) == outcome(execute, program, data)
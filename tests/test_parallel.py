@@ -0,0 +1,47 @@
+from itertools import count
+from itertools import islice
+
+from fifth import InsufficientStackItemsError
+from parallel import CHUNKS_PER_WORKER
+from parallel import ScriptResult
+from parallel import run_parallel
+from parallel import run_script
+
+
+class TestRunScript:
+    def test_success(self):
+        assert run_script("PUSH 3\nPUSH 4\n*") == ScriptResult([12], None)
+
+    def test_error(self):
+        result = run_script("PUSH 3\n+\nPUSH 4")
+        assert result.stack == [3]
+        assert isinstance(result.error, InsufficientStackItemsError)
+
+
+class TestRunParallel:
+    def test_results_in_order(self):
+        scripts = [f"PUSH {number}\nDUP\n*" if number % 3 else "POP" for number in range(100)]
+        results = list(run_parallel(scripts, workers=2, chunk_size=7))
+        assert len(results) == 100
+        for number, result in enumerate(results):
+            if number % 3:
+                assert result == ScriptResult([number * number], None)
+            else:
+                assert result.stack == []
+                assert str(result.error) == "ERROR: insufficient items on stack."
+
+    def test_no_scripts(self):
+        assert not list(run_parallel([], workers=1))
+
+    def test_reads_scripts_as_needed(self):
+        read = []
+
+        def scripts():
+            for number in count():
+                read.append(number)
+                yield f"PUSH {number}"
+
+        results = run_parallel(scripts(), workers=1, chunk_size=2)
+        assert list(islice(results, 3)) == [ScriptResult([number], None) for number in range(3)]
+        results.close()
+        assert len(read) <= (CHUNKS_PER_WORKER + 2) * 2
@@ -0,0 +1,68 @@
+import pytest
+from io import BytesIO
+from compiler import OPCODE
+from profiler import Profiler
+from profiler import Timings
+from stack import OUTPUT
+from stack import Stack
+from stack import InsufficientStackItemsError
+from stack import InvalidCommandError
+
+SCRIPT = "PUSH 3\nPUSH 4\n+\nPOP\nPOP\nFOO\nrPUSH 2\n"
+
+
+class TestTimings:
+    def test_percentiles(self):
+        timings = Timings()
+        for ns in range(1, 1001):
+            timings.add(ns)
+        assert timings.count == 1000
+        assert timings.total_ns == 500500
+        assert 470 <= timings.percentile(0.5) <= 500
+        assert 940 <= timings.percentile(0.99) <= 990
+
+    def test_empty(self):
+        assert Timings().percentile(0.5) == 0
+
+
+class TestProfiler:
+    def test_unprofiled_stack_is_unchanged(self):
+        stack = Stack()
+        assert 'execute' not in vars(stack)
+        assert 'render' not in vars(stack)
+
+    def test_interpret(self):
+        profiler = Profiler()
+        stack = Stack(profiler=profiler)
+        for command_line in SCRIPT.splitlines():
+            try:
+                stack.interpret(command_line)
+            except (InsufficientStackItemsError, InvalidCommandError):
+                pass
+        assert stack.interpret("PUSH 1") == str([2, 1])
+        assert profiler.parse.count == 8
+        assert profiler.execute.count == 7
+        assert profiler.opcodes[OPCODE.PUSH].count == 3
+        assert profiler.opcodes[OPCODE.POP].count == 2
+        assert profiler.opcodes[OPCODE.POP].errors == 1
+        assert profiler.opcodes[OPCODE.ERROR].errors == 1
+        assert OPCODE.SWAP not in profiler.opcodes or not profiler.opcodes[OPCODE.SWAP].count
+
+    @pytest.mark.parametrize('output', OUTPUT.list())
+    def test_batch_output_is_unchanged(self, output):
+        outfile = BytesIO()
+        profiler = Profiler()
+        Stack(output=output, profiler=profiler).run_file(BytesIO(SCRIPT.encode()), outfile)
+        assert outfile.getvalue().decode() == Stack(output=output).run_script(SCRIPT)
+        assert profiler.parse.count == 1
+        assert profiler.execute.count == 7
+        assert profiler.opcodes[OPCODE.ERROR].errors == 1
+        assert profiler.opcodes[OPCODE.REVERSE_PUSH].count == 1
+
+    def test_report(self):
+        profiler = Profiler()
+        Stack(profiler=profiler).run_script(SCRIPT)
+        report = profiler.report()
+        assert report.splitlines()[1].startswith("parse")
+        assert "rPUSH" in report
+        assert "SWAP" not in report
@@ -0,0 +1,78 @@
+import asyncio
+
+from server import Server
+from stack import OUTPUT
+from stack import Stack
+
+
+async def session(server, request: bytes) -> bytes:
+    listener = await server.start_tcp("127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    async with listener:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(request)
+        if not request.endswith(b"\n\n"):
+            writer.write_eof()
+        response = await reader.read()
+        writer.close()
+        await writer.wait_closed()
+    return response
+
+
+class TestServer:
+    def test_pipelined_session(self):
+        response = asyncio.run(session(Server(), b"PUSH 1\nPUSH 2\n+\nINVALID\n\nPUSH 3\n"))
+        assert response == (b"[]\nstack is [1]\nstack is [1, 2]\nstack is [3]\n"
+                            b"ERROR: unknown command/operator.\n")
+
+    def test_last_line_without_newline(self):
+        response = asyncio.run(session(Server(), b"PUSH 1\r\nDUP"))
+        assert response == b"[]\nstack is [1]\nstack is [1, 1]\n"
+
+    def test_invalid_utf8(self):
+        response = asyncio.run(session(Server(), b"PUSH 1\n\xff\nPUSH \xfe\nDUP\n"))
+        assert response.splitlines() == [b"[]", b"stack is [1]",
+                                         b"ERROR: unknown command/operator.",
+                                         b"ERROR: an integer argument expected.",
+                                         b"stack is [1, 1]"]
+
+    def test_output_larger_than_the_high_water_mark(self):
+        request = b"PUSH 1\nPOP\n" * 20000
+        response = asyncio.run(session(Server(output=OUTPUT.DELTA), request))
+        assert response.decode() == Stack(output=OUTPUT.DELTA).run_script(request.decode())
+
+    def test_output_mode(self):
+        response = asyncio.run(session(Server(output=OUTPUT.FINAL), b"PUSH 1\nPUSH 2\n"))
+        assert response == b"stack is [1, 2]\n"
+
+    def test_idle_timeout(self):
+        async def idle():
+            server = Server(idle_timeout=0.05)
+            listener = await server.start_tcp("127.0.0.1", 0)
+            port = listener.sockets[0].getsockname()[1]
+            async with listener:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                response = await asyncio.wait_for(reader.read(), 5)
+                writer.close()
+            return response
+
+        assert asyncio.run(idle()) == b"[]\n"
+
+    def test_many_sessions(self):
+        async def many():
+            server = Server()
+            listener = await server.start_tcp("127.0.0.1", 0)
+            port = listener.sockets[0].getsockname()[1]
+
+            async def client(number):
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.write(f"PUSH {number}\nDUP\n*\n\n".encode())
+                response = await reader.read()
+                writer.close()
+                return response.splitlines()[-1]
+
+            async with listener:
+                return await asyncio.gather(*(client(number) for number in range(100)))
+
+        assert asyncio.run(many()) == [f"stack is [{number * number}]".encode()
+                                       for number in range(100)]
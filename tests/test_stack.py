@@ -1,6 +1,20 @@
+import asyncio
+import itertools
+
 import pytest
+from io import BytesIO
 from io import StringIO
 from stack import COMMAND
+from stack import OPCODE
+from stack import OUTPUT
+from stack import STATUS
+from stack import Result
+from stack import ARITHMETIC
+from fifth import MAX_RANGE
+from stack import Stack
+from stack import read_lines
+from stack import rendered_storage
+from storage import RenderedStorage
 from stack import OPERATORS
 from stack import InvalidCommandError
 from stack import InvalidOperationError
@@ -37,7 +51,8 @@ class TestStdInStdOut:
         captured = capsys.readouterr()
         assert captured.out == '[]\nERROR: expected 0 arguments.\n'
 
-    def test_stdout_after_operation_error(self, capsys, monkeypatch, double_item_stack_push_2_push_0):
+    def test_stdout_after_operation_error(self, capsys, monkeypatch,
+                                          double_item_stack_push_2_push_0):
         command_line = StringIO('/')
         monkeypatch.setattr('sys.stdin', command_line)
 
@@ -69,8 +84,10 @@ class TestInterpretInvalid:
 
     @pytest.mark.parametrize("command_line,error_msg", [
             (f"{COMMAND.PUSH}", "ERROR: expected 1 argument."),
-            (f"{COMMAND.PUSH} 1 2 3", "ERROR: expected 1 argument."),
-            (f"{COMMAND.PUSH} A B C", "ERROR: expected 1 argument."),
+            (f"{COMMAND.PUSH.value} 1 B 3", "ERROR: an integer argument expected."),
+            (f"{COMMAND.PUSH_RANGE.value} 1", "ERROR: expected 2 arguments."),
+            (f"{COMMAND.SUM.value}", "ERROR: expected 1 argument."),
+            (f"{COMMAND.DROPN.value} 1 2", "ERROR: expected 1 argument."),
             (f"{COMMAND.POP} 1", "ERROR: expected 0 arguments."),
             (f"{COMMAND.DUP} 1", "ERROR: expected 0 arguments."),
             (f"{COMMAND.SWAP} 1", "ERROR: expected 0 arguments."),
@@ -93,7 +110,8 @@ class TestInsufficientStackItemsError:
         ]
     )
     def test_errors_on_empty_stack(self, empty_stack, command_line):
-        with pytest.raises(InsufficientStackItemsError, match="ERROR: insufficient items on stack."):
+        with pytest.raises(InsufficientStackItemsError,
+                           match="ERROR: insufficient items on stack."):
             empty_stack.interpret(command_line)
         assert str(empty_stack) == str([])
 
@@ -107,7 +125,8 @@ class TestInsufficientStackItemsError:
         ]
     )
     def test_errors_on_single_item_stack(self, single_item_stack, command_line):
-        with pytest.raises(InsufficientStackItemsError, match="ERROR: insufficient items on stack."):
+        with pytest.raises(InsufficientStackItemsError,
+                           match="ERROR: insufficient items on stack."):
             single_item_stack.interpret(command_line)
         assert str(single_item_stack) == str([1])
 
@@ -283,3 +302,192 @@ class TestSubtract:
         """Check which stack value is used as the first operand."""
         double_item_stack_push_2_push_0.interpret(OPERATORS.SUBTRACT)
         assert str(double_item_stack_push_2_push_0) == str([2])
+
+
+class TestBatch:
+    @pytest.mark.parametrize("script", [
+        "",
+        "PUSH 1\nPUSH 2",
+        "PUSH 1\nPUSH 2\n+\nINVALID\n/\nPOP 1\n",
+        "PUSH 1\r\nDUP\r\n\r\nPUSH 2\r\n",
+        "PUSH 1\n\nPUSH 2\n",
+        "rPUSH 3\nrPUSH 4\nr-\n   \nrPOP\nrPOP",
+    ])
+    def test_output_matches_main(self, capsys, monkeypatch, script):
+        monkeypatch.setattr('sys.stdin', StringIO(script, newline=None))
+        interactive = Stack()
+        interactive.main()
+        expected = capsys.readouterr().out
+
+        batch = Stack()
+        assert batch.run_script(script) == expected
+        assert str(batch) == str(interactive)
+
+    def test_lines_split_across_blocks(self):
+        lines = list(read_lines(BytesIO(b"PUSH 1\r\nPUSH 22\r\n\r\nPOP"), block_size=3))
+        assert [line for block in lines for line in block] == [b"PUSH 1", b"PUSH 22", b"", b"POP"]
+
+    def test_run_file(self, empty_stack):
+        outfile = BytesIO()
+        empty_stack.run_file(BytesIO(b"PUSH 1\n+\n"), outfile)
+        assert outfile.getvalue() == b"[]\nstack is [1]\nERROR: insufficient items on stack.\n"
+
+
+class TestOutputModes:
+    SCRIPT = "PUSH 1\nPUSH 2\nSWAP\n+\nINVALID\nrPUSH 5\nrDUP\nr+\nrPOP\nPOP"
+
+    @pytest.mark.parametrize("output,expected", [
+        (OUTPUT.DELTA, "[]\n+1\n+2\n-2 +2 +1\n-2 +3\nERROR: unknown command/operator.\n"
+                       "bottom+5\nbottom+5\nbottom-2 bottom+10\nbottom-1\n-1\n"),
+        (OUTPUT.FINAL, "ERROR: unknown command/operator.\nstack is []\n"),
+        (OUTPUT.QUIET, "ERROR: unknown command/operator.\n"),
+    ])
+    def test_main(self, capsys, monkeypatch, output, expected):
+        monkeypatch.setattr('sys.stdin', StringIO(self.SCRIPT))
+        Stack(output=output).main()
+        assert capsys.readouterr().out == expected
+
+    @pytest.mark.parametrize("output", OUTPUT.list())
+    def test_batch_matches_main(self, capsys, monkeypatch, output):
+        monkeypatch.setattr('sys.stdin', StringIO(self.SCRIPT))
+        Stack(output=output).main()
+        assert Stack(output=output).run_script(self.SCRIPT) == capsys.readouterr().out
+
+    def test_quiet_does_not_render(self, monkeypatch):
+        stack = Stack(output=OUTPUT.QUIET)
+        monkeypatch.setattr(type(stack.fifth), '__str__', lambda fifth: pytest.fail("rendered"))
+        stack.run_script("PUSH 1\nDUP\n+")
+
+
+class TestBulkCommands:
+    SCRIPT = ("PUSH 1 2 3\nPUSHN 4 6\nSUM 3\nPROD 2\nrPUSH 7 8\nrSUM 2\nDUPN 2\n"
+              "DROPN 3\nrPROD 3\nSUM 4\nPUSH 1 x")
+
+    def test_interpret(self, empty_stack):
+        stacks = [empty_stack.interpret(line) for line in self.SCRIPT.splitlines()[:8]]
+        assert stacks == [str([1, 2, 3]), str([1, 2, 3, 4, 5, 6]), str([1, 2, 3, 15]),
+                          str([1, 2, 45]), str([8, 7, 1, 2, 45]), str([15, 1, 2, 45]),
+                          str([15, 1, 2, 45, 2, 45]), str([15, 1, 2])]
+
+    @pytest.mark.parametrize("output", OUTPUT.list())
+    def test_batch_matches_main(self, capsys, monkeypatch, output):
+        monkeypatch.setattr('sys.stdin', StringIO(self.SCRIPT))
+        Stack(output=output).main()
+        assert Stack(output=output).run_script(self.SCRIPT) == capsys.readouterr().out
+
+    def test_delta(self):
+        assert Stack(output=OUTPUT.DELTA).run_script(self.SCRIPT) == (
+            "[]\n+1 +2 +3\n+4 +5 +6\n-3 +15\n-2 +45\nbottom+7 bottom+8\nbottom-2 bottom+15\n"
+            "+2 +45\n-3\nbottom-3 bottom+30\nERROR: insufficient items on stack.\n"
+            "ERROR: an integer argument expected.\n")
+
+    def test_huge_range_is_rejected(self, empty_stack):
+        with pytest.raises(InvalidCommandError, match="at most"):
+            empty_stack.interpret(f"PUSHN 0 {MAX_RANGE}")
+        assert str(empty_stack) == str([])
+        assert empty_stack.interpret(f"PUSHN {MAX_RANGE} 1") == str(list(range(MAX_RANGE, 0, -1)))
+
+
+class TestArithmeticModes:
+    @pytest.mark.parametrize("arithmetic,expected", [
+        ("bigint", [2 ** 64]),
+        ("wrap", [0]),
+        ("saturate", [2 ** 63 - 1]),
+    ])
+    def test_modes(self, arithmetic, expected):
+        stack = Stack(arithmetic=arithmetic)
+        stack.interpret("PUSH 4294967296")
+        stack.interpret("DUP")
+        assert stack.interpret("*") == str(expected)
+
+    def test_fixed_width_uses_compact_storage(self):
+        assert Stack(arithmetic="wrap").fifth.storage.compact
+
+
+class TestExecuteAtomic:
+    def test_applies_all(self, empty_stack):
+        empty_stack.execute_atomic(["PUSH 1", "PUSH 2", "+"])
+        assert str(empty_stack) == str([3])
+
+    def test_applies_none_on_error(self, double_item_stack):
+        with pytest.raises(InvalidOperationError):
+            double_item_stack.execute_atomic(["r+", "rPUSH 5", "PUSH 0", "/"])
+        assert str(double_item_stack) == str([1, 2])
+
+    def test_applies_none_on_invalid_command(self, double_item_stack):
+        with pytest.raises(InvalidCommandError):
+            double_item_stack.execute_atomic(["POP", "INVALID"])
+        assert str(double_item_stack) == str([1, 2])
+
+
+class TestInterpretStream:
+    def test_results(self, empty_stack):
+        results = list(empty_stack.interpret_stream(["PUSH 1", "POP", "POP", "", "PUSH 2 3\n"]))
+        assert results == [
+            Result(STATUS.OK, OPCODE.PUSH),
+            Result(STATUS.OK, OPCODE.POP),
+            Result(STATUS.ERROR, error=InsufficientStackItemsError,
+                   message="ERROR: insufficient items on stack."),
+            Result(STATUS.ERROR, error=InvalidCommandError, message="ERROR: no command specified."),
+            Result(STATUS.OK, OPCODE.PUSH_MANY),
+        ]
+        assert str(empty_stack) == str([2, 3])
+
+    def test_top_and_delta(self, empty_stack):
+        results = list(empty_stack.interpret_stream(["PUSH 4 5", "SUM 2", "POP", "/"],
+                                                     top=True, delta=True))
+        assert [(result.top, result.delta) for result in results] == [
+            (5, "+4 +5"), (9, "-2 +9"), (None, "-1"), (None, None)]
+
+    def test_delta_matches_output_mode(self):
+        commands = ["PUSH 1", "rPUSH 2 3", "SWAP", "r-", "DUPN 2", "INVALID", "rPROD 2"]
+        output = Stack(output=OUTPUT.DELTA).run_script("\n".join(commands) + "\n")
+        results = Stack().interpret_stream(commands, delta=True)
+        assert output.splitlines()[1:] == [result.delta or result.message for result in results]
+
+    def test_lazy(self, empty_stack):
+        commands = itertools.repeat("PUSH 1")
+        results = empty_stack.interpret_stream(commands)
+        assert all(next(results).status == STATUS.OK for _ in range(1000))
+        assert empty_stack.fifth.size() == 1000
+
+    def test_async(self, empty_stack):
+        async def commands():
+            for command_line in ["PUSH 1", "DUP", "+", "INVALID"]:
+                await asyncio.sleep(0)
+                yield command_line
+
+        async def run():
+            return [result async for result in
+                    empty_stack.interpret_async_stream(commands(), top=True)]
+
+        results = asyncio.run(run())
+        assert [result.top for result in results] == [1, 1, 2, None]
+        assert results[-1].error is InvalidCommandError
+
+
+class Unprintable(int):
+    def __repr__(self):
+        raise AssertionError("formatted")
+
+
+class TestRenderedStack:
+    def test_rendering_is_opt_in(self):
+        assert not isinstance(Stack().fifth.storage, RenderedStorage)
+        assert isinstance(Stack(storage=rendered_storage()).fifth.storage, RenderedStorage)
+        storage = Stack(arithmetic=ARITHMETIC.WRAP, storage=rendered_storage(ARITHMETIC.WRAP))
+        assert storage.fifth.storage.compact
+
+    def test_stream_does_not_format_values(self):
+        stack = Stack()
+        stack.fifth.push(Unprintable(1))
+        results = list(stack.interpret_stream(["DUP", "POP"]))
+        assert [result.status for result in results] == [STATUS.OK, STATUS.OK]
+
+    def test_full_output_matches_list(self):
+        commands = ["PUSHN 1 600", "rPUSH 7", "SWAP", "DROPN 300", "rSUM 3", "r+", "POP"]
+        stack = Stack(storage=rendered_storage())
+        model = Stack(output=OUTPUT.QUIET)
+        for command_line in commands:
+            model.execute(command_line)
+            assert stack.interpret(command_line) == str(list(model.fifth.storage))
@@ -0,0 +1,332 @@
+import copy
+import os
+import random
+import subprocess
+import sys
+from functools import partial
+
+import pytest
+from fifth import Fifth
+from filestorage import MmapStorage
+from filestorage import SpillStorage
+from storage import ArrayStorage
+from storage import DequeStorage
+from storage import ListStorage
+from storage import PersistentStorage
+from storage import RenderedStorage
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+
+BACKENDS = {
+    "list": lambda path: ListStorage,
+    "deque": lambda path: DequeStorage,
+    "array": lambda path: ArrayStorage,
+    "persistent": lambda path: PersistentStorage,
+    "mmap": lambda path: lambda data=(): MmapStorage(str(path / "stack"), data, chunk=4),
+    "spill": lambda path: lambda data=(): SpillStorage(data, hot=4, segment=2, directory=path),
+    "rendered": lambda path: lambda data=(): RenderedStorage(data, chunk=2),
+}
+
+
+@pytest.fixture(name="backend", params=BACKENDS)
+def backend_factory(request, tmp_path):
+    yield BACKENDS[request.param](tmp_path)
+
+
+def apply(storage, model, rng, values):
+    operation = rng.choice(["append", "appendleft", "pop", "popleft", "drop", "extend", "set"])
+    if operation in ("append", "appendleft"):
+        value = rng.choice(values)
+        getattr(storage, operation)(value)
+        model.insert(0 if operation == "appendleft" else len(model), value)
+    elif operation == "extend":
+        numbers = [rng.choice(values) for _ in range(rng.randint(0, 3))]
+        storage.extend(numbers)
+        model.extend(numbers)
+    elif not model:
+        return
+    elif operation == "pop":
+        assert storage.pop() == model.pop()
+    elif operation == "popleft":
+        assert storage.popleft() == model.pop(0)
+    elif operation == "drop":
+        count = rng.randint(1, len(model))
+        storage.drop(count)
+        del model[len(model) - count:]
+    else:
+        index = rng.choice([0, -1, len(model) - 1, -len(model)])
+        value = rng.choice(values)
+        storage[index] = value
+        model[index] = value
+
+
+class TestBackends:
+    @pytest.mark.parametrize("seed", range(5))
+    def test_matches_list(self, backend, seed):
+        rng = random.Random(seed)
+        values = [-1, 0, 1, 2 ** 63 - 1, -2 ** 63] + ([2 ** 64] if seed == 4 else [])
+        storage = backend([1, 2, 3])
+        model = [1, 2, 3]
+        for _ in range(500):
+            apply(storage, model, rng, values)
+            assert len(storage) == len(model)
+            assert list(storage) == model
+            assert list(reversed(storage)) == model[::-1]
+            if model:
+                assert (storage[0], storage[-1]) == (model[0], model[-1])
+
+    def test_pop_when_empty(self, backend):
+        with pytest.raises(IndexError):
+            backend().pop()
+        with pytest.raises(IndexError):
+            backend().popleft()
+
+
+class TestArrayStorage:
+    def test_is_compact(self):
+        storage = ArrayStorage(range(1000))
+        assert storage.compact
+        assert storage.__sizeof__() < 1000 * 9 + 200
+
+    @pytest.mark.parametrize("operation", ["append", "appendleft"])
+    def test_promotes_on_overflow(self, operation):
+        storage = ArrayStorage([1, 2])
+        getattr(storage, operation)(2 ** 64)
+        assert not storage.compact
+        assert sorted(storage) == [1, 2, 2 ** 64]
+
+    def test_promotes_on_extend(self):
+        storage = ArrayStorage([1])
+        storage.extend([2, -2 ** 100, 3])
+        assert not storage.compact
+        assert list(storage) == [1, 2, -2 ** 100, 3]
+
+    def test_promotes_on_set(self):
+        storage = ArrayStorage([1, 2])
+        storage[0] = 2 ** 64
+        assert list(storage) == [2 ** 64, 2]
+
+    def test_promotes_on_set_with_bottom_half(self):
+        storage = ArrayStorage([1, 2])
+        storage.appendleft(0)
+        storage[-1] = 2 ** 64
+        storage[1] = -2 ** 64
+        assert list(storage) == [0, -2 ** 64, 2 ** 64]
+
+    def test_promotes_on_multiply(self):
+        fifth = Fifth([1, 2], storage=ArrayStorage)
+        fifth.reverse_push(0)
+        fifth.push(2 ** 62)
+        fifth.push(4)
+        fifth.multiply()
+        assert list(fifth.storage) == [0, 1, 2, 2 ** 64]
+
+
+class TestMmapStorage:
+    def test_reopen(self, tmp_path):
+        path = str(tmp_path / "stack")
+        with MmapStorage(path, [1, 2], chunk=2) as storage:
+            for number in range(5):
+                storage.appendleft(-number)
+                storage.append(2 ** 64 + number)
+        with MmapStorage(path) as storage:
+            big = [2 ** 64 + number for number in range(5)]
+            assert list(storage) == [-4, -3, -2, -1, 0, 1, 2] + big
+            storage.pop()
+            storage.popleft()
+        with MmapStorage(path) as storage:
+            assert len(storage) == 10
+            assert (storage[0], storage[-1]) == (-3, 2 ** 64 + 3)
+
+    def test_big_values_survive_without_close(self, tmp_path):
+        path = str(tmp_path / "stack")
+        script = (f"from filestorage import MmapStorage\n"
+                  f"storage = MmapStorage({path!r}, [1, 2 ** 64, -2 ** 63])\n"
+                  f"storage[0] = 2 ** 70\n"
+                  f"os._exit(0)\n")
+        subprocess.run([sys.executable, "-c", "import os\n" + script], check=True,
+                       env=dict(os.environ, PYTHONPATH=SRC))
+        with MmapStorage(path) as storage:
+            assert list(storage) == [2 ** 70, 2 ** 64, -2 ** 63]
+
+    def test_missing_big_value(self, tmp_path):
+        path = tmp_path / "stack"
+        with MmapStorage(str(path), [1, 2 ** 64]):
+            pass
+        (tmp_path / "stack.big").unlink()
+        with MmapStorage(str(path)) as storage:
+            with pytest.raises(KeyError):
+                list(storage)
+            with pytest.raises(KeyError):
+                storage.pop()
+
+    def test_grows_in_chunks(self, tmp_path):
+        path = tmp_path / "stack"
+        with MmapStorage(str(path), chunk=8) as storage:
+            storage.extend(range(9))
+            assert path.stat().st_size == MmapStorage.HEADER_SIZE + 16 * 8
+
+    def test_rejects_other_files(self, tmp_path):
+        path = tmp_path / "stack"
+        path.write_bytes(b"not a stack" * 10)
+        with pytest.raises(ValueError):
+            MmapStorage(str(path))
+
+    def test_with_fifth(self, tmp_path):
+        path = str(tmp_path / "stack")
+        fifth = Fifth([1, 2], storage=partial(MmapStorage, path))
+        fifth.reverse_push(3)
+        fifth.multiply()
+        fifth.storage.close()
+        with MmapStorage(path) as storage:
+            assert list(storage) == [3, 2]
+
+
+class TestPersistentStorage:
+    def test_copies_are_independent(self):
+        storage = PersistentStorage(range(10))
+        fork = copy.copy(storage)
+        storage.append(10)
+        storage.popleft()
+        fork[-1] = -9
+        fork[0] = -1
+        fork.drop(3)
+        assert list(storage) == list(range(1, 11))
+        assert list(fork) == [-1, 1, 2, 3, 4, 5, 6]
+
+    def test_copies_share_nodes(self):
+        storage = PersistentStorage(range(1000))
+        fork = copy.copy(storage)
+        fork.pop()
+        fork.append(7)
+        fork.popleft()
+        fork.appendleft(7)
+        assert fork._tree[1] is storage._tree[1]
+
+    def test_forks_pop_from_both_ends_cheaply(self):
+        storage = PersistentStorage(range(10 ** 5))
+        for _ in range(100):
+            storage.pop()
+        forks = []
+        for _ in range(1000):
+            fork = copy.copy(storage)
+            assert fork.popleft() == 0
+            assert fork.pop() == 10 ** 5 - 101
+            forks.append(fork)
+        # Each fork shares all but a few nodes at each end
+        assert all(fork._tree[1][1] is storage._tree[1][1] for fork in forks)
+
+    @pytest.mark.parametrize("size", range(20))
+    def test_matches_list_at_every_size(self, size):
+        model = list(range(size))
+        storage = PersistentStorage(model)
+        assert list(storage) == model
+        assert list(reversed(storage)) == model[::-1]
+        while model:
+            assert storage.popleft() == model.pop(0)
+            if model:
+                assert storage.pop() == model.pop()
+            assert list(storage) == model
+
+    @pytest.mark.parametrize("index", range(-7, 7))
+    def test_any_index(self, index):
+        model = [3, 1, 4, 1, 5, 9, 2]
+        storage = PersistentStorage(model)
+        storage.appendleft(storage.popleft())
+        assert storage[index] == model[index]
+        storage[index] = 100
+        model[index] = 100
+        assert list(storage) == model
+
+
+class TestSpillStorage:
+    def test_windows_are_bounded(self):
+        with SpillStorage(range(1000), hot=8, segment=4) as storage:
+            assert storage.spilled == 1000 - len(storage._top)
+            assert len(storage._top) <= 8
+            assert [storage.pop() for _ in range(1000)] == list(range(999, -1, -1))
+            assert storage.spilled == 0
+
+    def test_reads_deep_values_without_filling(self):
+        with SpillStorage(range(100), hot=8, segment=4) as storage:
+            spilled = storage.spilled
+            assert storage[50] == 50
+            storage[50] = -50
+            assert storage.spilled == spilled
+            assert list(storage)[49:52] == [49, -50, 51]
+
+    def test_big_values(self):
+        model = [2 ** 70, -1, 2 ** 63] * 10
+        with SpillStorage(model, hot=4, segment=2) as storage:
+            assert list(storage) == model
+            assert list(reversed(storage)) == model[::-1]
+
+    def test_drop_discards_whole_segments(self):
+        with SpillStorage(range(100), hot=8, segment=4) as storage:
+            storage.drop(95)
+            assert list(storage) == [0, 1, 2, 3, 4]
+            storage.drop(5)
+            assert not storage.spilled and storage._end == 0
+
+    def test_reuses_file_space(self):
+        with SpillStorage(range(10), hot=4, segment=4) as storage:
+            storage.extend(range(20))
+            storage.drop(20)
+            end = storage._end
+            for _ in range(100):
+                storage.extend(range(20))
+                storage.drop(20)
+            assert storage._end == end
+            assert list(storage) == list(range(10))
+
+    def test_invalid_segment(self):
+        with pytest.raises(ValueError):
+            SpillStorage(hot=4, segment=8)
+
+
+class TestRenderedStorage:
+    @pytest.mark.parametrize("storage", [DequeStorage, ArrayStorage, PersistentStorage])
+    @pytest.mark.parametrize("seed", range(5))
+    def test_renders_as_list(self, storage, seed):
+        rng = random.Random(seed)
+        values = [-1, 0, 7, 2 ** 63 - 1, 2 ** 64]
+        rendered = RenderedStorage([1, 2, 3], storage=storage, chunk=3)
+        model = [1, 2, 3]
+        for _ in range(500):
+            apply(rendered, model, rng, values)
+            assert str(rendered) == str(model)
+            assert "".join(rendered.render()) == str(model)
+
+    @pytest.mark.parametrize("index", range(-10, 10))
+    def test_set_any_index(self, index):
+        rendered = RenderedStorage(range(10), chunk=3)
+        model = list(range(10))
+        rendered[index] = model[index] = -5
+        assert str(rendered) == str(model)
+
+    def test_renders_only_changed_chunks(self):
+        rendered = RenderedStorage(range(10), chunk=4)
+        str(rendered)
+        rendered.append(10)
+        rendered.popleft()
+        assert [chunk.text is None for chunk in rendered._chunks] == [True, False, True]
+
+    def test_copies_are_independent(self):
+        rendered = RenderedStorage([1, 2, 3])
+        copied = copy.copy(rendered)
+        copied.append(4)
+        copied[0] = 0
+        assert str(rendered) == "[1, 2, 3]"
+        assert str(copied) == "[0, 2, 3, 4]"
+
+    def test_with_fifth(self):
+        fifth = Fifth([1, 2], storage=partial(RenderedStorage, chunk=2))
+        fifth.push(3)
+        fifth.reverse_push(0)
+        fifth.add()
+        assert str(fifth) == "[0, 1, 5]"
+        assert "".join(fifth.render()) == "[0, 1, 5]"
+
+    def test_compact(self):
+        assert RenderedStorage(storage=ArrayStorage).compact
+        assert not RenderedStorage().compact
@@ -0,0 +1,136 @@
+import random
+import threading
+import time
+from collections import Counter
+
+import pytest
+from fifth import ARITHMETIC
+from fifth import Fifth
+from fifth import InsufficientStackItemsError
+from fifth import InvalidOperationError
+from threadsafe import ConcurrentFifth
+
+# Operations and the number of arguments they take, each a small integer
+OPERATIONS = {
+    "push": 1, "pop": 0, "swap": 0, "dup": 0, "drop": 1, "add": 0, "subtract": 0,
+    "multiply": 0, "floordiv": 0, "push_many": None, "dup_many": 1, "sum": 1, "product": 1,
+    "reverse_push": 1, "reverse_pop": 0, "reverse_swap": 0, "reverse_dup": 0,
+    "reverse_add": 0, "reverse_subtract": 0, "reverse_multiply": 0, "reverse_floordiv": 0,
+    "reverse_push_many": None, "reverse_sum": 1, "reverse_product": 1,
+}
+
+
+def outcome(fifth, name, args):
+    try:
+        return getattr(fifth, name)(*args)
+    except (InsufficientStackItemsError, InvalidOperationError) as error:
+        return type(error)
+
+
+class TestSequential:
+    @pytest.mark.parametrize("seed", range(20))
+    def test_matches_fifth(self, seed):
+        rng = random.Random(seed)
+        fifth = Fifth()
+        concurrent = ConcurrentFifth()
+        for _ in range(300):
+            name = rng.choice(list(OPERATIONS))
+            count = OPERATIONS[name]
+            if count is None:
+                args = ([rng.randint(-3, 9) for _ in range(rng.randint(0, 4))],)
+            else:
+                args = tuple(rng.randint(0, 3) for _ in range(count))
+            assert outcome(concurrent, name, args) == outcome(fifth, name, args)
+            assert str(concurrent) == str(fifth)
+            assert concurrent.size() == fifth.size()
+
+    def test_initial_data(self):
+        concurrent = ConcurrentFifth([1, 2, 3])
+        assert concurrent.reverse_pop() == 1
+        assert concurrent.pop() == 3
+        assert str(concurrent) == "[2]"
+
+    def test_peek(self):
+        concurrent = ConcurrentFifth([1, 2, 3])
+        concurrent.reverse_pop()
+        concurrent.reverse_push(0)
+        assert concurrent.peek() == 3
+        assert concurrent.peek(0) == 0
+
+    def test_arithmetic(self):
+        concurrent = ConcurrentFifth([2 ** 62, 2 ** 62], arithmetic=ARITHMETIC.WRAP)
+        concurrent.add()
+        assert concurrent.pop() == -2 ** 63
+
+
+class TestBlocking:
+    def test_empty_raises(self):
+        with pytest.raises(InsufficientStackItemsError):
+            ConcurrentFifth().pop()
+
+    def test_timeout(self):
+        concurrent = ConcurrentFifth()
+        start = time.monotonic()
+        with pytest.raises(InsufficientStackItemsError):
+            concurrent.reverse_pop(block=True, timeout=0.05)
+        assert time.monotonic() - start >= 0.05
+
+    @pytest.mark.parametrize("pop", ["pop", "reverse_pop"])
+    def test_waits_for_push(self, pop):
+        concurrent = ConcurrentFifth()
+        timer = threading.Timer(0.05, concurrent.push, (7,))
+        timer.start()
+        assert getattr(concurrent, pop)(block=True, timeout=10) == 7
+        timer.join()
+
+    def test_woken_by_bulk_push(self):
+        concurrent = ConcurrentFifth()
+        timer = threading.Timer(0.05, concurrent.reverse_push_many, ([1, 2],))
+        timer.start()
+        assert concurrent.pop(block=True, timeout=10) == 1
+        timer.join()
+
+
+class TestThreads:
+    def test_producers_and_consumers(self):
+        concurrent = ConcurrentFifth()
+        count = 2000
+        popped = [[] for _ in range(4)]
+
+        def produce(offset):
+            for number in range(offset, offset + count):
+                concurrent.push(number)
+
+        def consume(numbers, pop):
+            for _ in range(count):
+                numbers.append(pop(block=True, timeout=10))
+
+        threads = [threading.Thread(target=produce, args=(index * count,)) for index in range(4)]
+        threads += [threading.Thread(target=consume, args=(numbers, pop))
+                    for numbers, pop in zip(popped, [concurrent.pop, concurrent.reverse_pop] * 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert Counter(number for numbers in popped for number in numbers) == \
+            Counter(range(4 * count))
+        assert concurrent.size() == 0
+
+    def test_both_ends_keep_total(self):
+        concurrent = ConcurrentFifth([1] * 10)
+
+        def work(add, push):
+            for _ in range(1000):
+                push(1)
+                add()
+
+        threads = [threading.Thread(target=work, args=(concurrent.add, concurrent.push)),
+                   threading.Thread(target=work,
+                                    args=(concurrent.reverse_add, concurrent.reverse_push))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert concurrent.size() == 10
+        assert concurrent.sum(10) is None
+        assert concurrent.pop() == 2010
@@ -0,0 +1,67 @@
+import random
+
+import pytest
+from compiler import OPCODE
+from compiler import compile_script
+from compiler import execute
+from fifth import Fifth
+from optimiser import optimise
+from verifier import bind_unchecked
+from verifier import required_depth
+from verifier import verify
+import verifier
+
+from helpers import outcome
+from helpers import random_script
+
+
+class TestVerify:
+    def test_depths(self):
+        verification = verify(compile_script("PUSH 1\nDUP\nrPOP\n+\nrDUP\nSWAP"), 1)
+        assert verification == ([1, 2, 3, 2, 1, 2, 2], None)
+
+    @pytest.mark.parametrize("script,depth,failure", [
+        ("PUSH 1\n+", 0, 1),
+        ("PUSH 1\n+", 1, None),
+        ("rPOP\nrPOP\nSWAP", 3, 2),
+        ("PUSH 1\nFOO\nPOP", 5, 1),
+        ("POP\nPOP\nPOP", 2, 2),
+    ])
+    def test_first_failure(self, script, depth, failure):
+        assert verify(compile_script(script), depth).failure == failure
+
+    @pytest.mark.parametrize("script,required", [
+        ("PUSH 1\nPUSH 2\n+", 0),
+        ("+\n+\n+", 4),
+        ("DUP\nrPOP\nrPOP\nr+", 3),
+        ("POP\nFOO", None),
+    ])
+    def test_required_depth(self, script, required):
+        assert required_depth(compile_script(script)) == required
+
+    def test_required_depth_with_drop(self):
+        program, _ = optimise(compile_script("PUSH 1\nPOP\nPOP\nPOP\nPOP"))
+        assert required_depth(program) == 3
+
+
+class TestExecute:
+    def test_unchecked_skips_size_checks(self):
+        fifth = Fifth([1])
+        table = bind_unchecked(compile_script("+"), fifth)
+        with pytest.raises(IndexError):
+            table[OPCODE.ADD]()
+
+    def test_divide_by_zero_is_checked(self):
+        program = compile_script("PUSH 4\nPUSH 0\n/")
+        assert outcome(verifier.execute, program, [1]) == outcome(execute, program, [1])
+
+    @pytest.mark.parametrize("seed", range(50))
+    def test_same_outcome(self, seed):
+        rng = random.Random(seed)
+        script = random_script(rng, rng.randint(1, 40))
+        data = [rng.randint(1, 5) for _ in range(rng.randint(0, 20))]
+        program = compile_script(script)
+        assert outcome(verifier.execute, program, data) == outcome(execute, program, data)
+        required = required_depth(program)
+        safe = required is not None and len(data) >= required
+        assert (verify(program, len(data)).failure is None) == safe
@@ -0,0 +1,98 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+from client import OUTPUTS
+from client import parse_args
+from stack import OUTPUT
+from stack import Stack
+from warm import handle
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+SCRIPT = b"PUSH 3\nDUP\n*\nPOP\nPOP\nrPUSH 2\n"
+
+
+def request(header: bytes, data: bytes) -> bytes:
+    server, client = socket.socketpair()
+    thread = threading.Thread(target=handle, args=(server,))
+    thread.start()
+    with client:
+        client.sendall(header + data)
+        client.shutdown(socket.SHUT_WR)
+        response = b""
+        while chunk := client.recv(4096):
+            response += chunk
+    thread.join()
+    return response
+
+
+class TestClient:
+    def test_outputs_match_the_program(self):
+        assert list(OUTPUTS) == OUTPUT.list()
+
+    @pytest.mark.parametrize("argv,expected", [
+        ([], ("full", False, None)),
+        (["--output", "delta", "x.txt"], ("delta", False, "x.txt")),
+        (["--output=quiet", "--batch"], ("quiet", True, None)),
+    ])
+    def test_parse_args(self, argv, expected):
+        assert parse_args(argv) == expected
+
+    @pytest.mark.parametrize("argv", [["--output", "loud"], ["--verbose"]])
+    def test_parse_args_rejects(self, argv):
+        with pytest.raises(ValueError):
+            parse_args(argv)
+
+
+class TestHandle:
+    @pytest.mark.parametrize("output", OUTPUT.list())
+    @pytest.mark.parametrize("mode", ["batch", "interactive"])
+    def test_same_output_as_the_program(self, mode, output):
+        response = request(f"FIFTH 1 {mode} {output}\n".encode(), SCRIPT)
+        assert response.decode() == Stack(output=output).run_script(SCRIPT.decode())
+
+    def test_rejects_other_requests(self):
+        assert request(b"GET / HTTP/1.0\n", SCRIPT) == b""
+
+
+@pytest.fixture(name="warm_server")
+def warm_server_env(tmp_path):
+    env = dict(os.environ, FIFTH_SOCKET=str(tmp_path / "fifth.sock"))
+    with subprocess.Popen([sys.executable, os.path.join(SRC, "warm.py"), "--workers", "2"],
+                          env=env, stderr=subprocess.DEVNULL) as server:
+        try:
+            deadline = time.monotonic() + 10
+            while not os.path.exists(env["FIFTH_SOCKET"]) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            yield env
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(10)
+    assert not os.path.exists(env["FIFTH_SOCKET"])
+
+
+def run_client(env, script, *args):
+    return subprocess.run([sys.executable, os.path.join(SRC, "client.py"), *args],
+                          input=script, env=env, capture_output=True, check=True, timeout=60)
+
+
+class TestWarmServer:
+    def test_client(self, warm_server):
+        for _ in range(3):
+            result = run_client(warm_server, SCRIPT, "--output", "delta")
+            assert result.stdout.decode() == Stack(output="delta").run_script(SCRIPT.decode())
+
+    def test_output_larger_than_the_socket_buffer(self, warm_server):
+        script = b"PUSH 1\nPOP\n" * 200000
+        result = run_client(warm_server, script, "--output", "delta")
+        assert result.stdout.decode() == Stack(output="delta").run_script(script.decode())
+
+    def test_client_without_server(self, tmp_path):
+        env = dict(os.environ, FIFTH_SOCKET=str(tmp_path / "missing.sock"))
+        result = run_client(env, SCRIPT)
+        assert result.stdout.decode() == Stack().run_script(SCRIPT.decode())